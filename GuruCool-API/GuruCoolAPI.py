@@ -2,6 +2,7 @@ import os
 import warnings
 import logging
 import time
+import hashlib
 import threading
 
 from dotenv import load_dotenv
@@ -13,7 +14,6 @@ from flask_cors import CORS
 from firebase_admin import storage as firebase_storage, firestore
 
 from langchain_ollama import OllamaLLM
-from sentence_transformers import SentenceTransformer
 
 from utils.helpers import *
 from utils.embedding import * 
@@ -21,9 +21,16 @@ from utils.firebase import *
 from utils.quiz import *
 from utils.transcribe import *
 from utils.askguru import *
+from utils.federated_search import *
 from utils.coursepolicy import *
 from utils.assignment import *
 from utils.cleanup import *
+from utils.models import *
+from utils.lecture_cache import *
+from utils.query_cache import *
+from utils.answer_cache import *
+from utils.jobs import *
+from utils.parsing import *
 
 warnings.filterwarnings("ignore", category=FutureWarning, module="whisper")
 warnings.filterwarnings("ignore", category=UserWarning, module="whisper")
@@ -35,14 +42,18 @@ STORAGE_BUCKET = os.getenv("STORAGE_BUCKET")
 CREDENTIALS_PATH = os.getenv("CREDENTIALS_PATH")
 PORT = os.getenv("PORT")
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = os.getenv("DATA_PATH", os.path.join(PROJECT_ROOT, "Docs"))
-CACHE_PATH = os.getenv("DATA_PATH", os.path.join(PROJECT_ROOT, "Cache"))
+# DATA_PATH, the root of the downloaded lecture documents, comes from utils.helpers so every endpoint uses the same files.
+# CACHE_PATH, the root of the lecture and unit indexes, comes from utils.lecture_index so builds and searches agree on it.
 GURUCOOL_API_KEY = os.getenv("GURUCOOL_API_KEY")
 LOGS = os.path.join(PROJECT_ROOT, "Logs/log.txt")
 MODEL = os.getenv("MODEL","llama3.1")
+PRELOAD_EMBEDDING_MODEL = os.getenv("PRELOAD_EMBEDDING_MODEL", "true").lower() == "true"
 
 logging.basicConfig(filename=LOGS, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Forked before the Firebase clients, models and worker threads below exist.
+start_parse_pool()
+
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 app.secret_key = GURUCOOL_API_KEY
@@ -52,6 +63,11 @@ storage = firebase_storage.bucket()
 
 ollama_model = OllamaLLM(model=MODEL)
 
+if PRELOAD_EMBEDDING_MODEL:
+    preload_embedding_models()
+    if RERANK_ENABLED:
+        get_reranker_model()
+
 # --------------------------------------------------------------- API Key Middleware --------------------------------------------------------------- 
 
 def require_api_key(func):
@@ -132,13 +148,25 @@ def hello_world():
     </html>
     '''
     
+def run_embedding_job(job, subject, unit, lecture_id, document_urls, replace=False):
+    """
+    Job function of /generate_embeddings: builds the lecture index and returns the job result.
+    """
+    _, _, documents = generate_and_save_embeddings(subject, unit, lecture_id, document_urls, progress=job.report, replace=replace)
+    return {
+        "chunks": len(documents),
+        "embedding_cache_file": os.path.join(get_embedding_cache_dir(subject, unit, lecture_id), MANIFEST_FILE),
+    }
+
 @app.route('/generate_embeddings', methods=['POST'])
 @require_api_key
 def generate_embeddings():
     """
-    Generate embeddings for a lecture based on the provided subject, unit, lecture ID, and document URLs.
+    Queue embedding generation for a lecture based on the provided subject, unit, lecture ID, and document URLs.
+    The lecture is built in the background; poll /jobs/<job_id> for its progress. With "wait": true in the body
+    the embeddings are generated within the request instead.
     Returns:
-        A JSON response containing the status of the embedding generation process.
+        A JSON response containing the job ID and status URL (202), or the status of the embedding generation (200).
     Raises:
         Exception: If an error occurs during the embedding generation process.
     """
@@ -148,6 +176,7 @@ def generate_embeddings():
         unit = data.get('unit')
         lecture_id = data.get('lecture')
         document_urls = data.get('document_urls', [])
+        replace = bool(data.get('replace', False))
         
         if isinstance(document_urls, str):
             document_urls = [document_urls] 
@@ -157,21 +186,130 @@ def generate_embeddings():
         if not subject or not unit or not lecture_id or not document_urls:
             logging.error("Missing fields: 'subject', 'unit', 'lecture', and 'document_urls' are required.")
             return jsonify({"error": "Missing fields: 'subject', 'unit', 'lecture', and 'document_urls' are required."}), 400
+
+        if data.get('wait', False):
+            logging.info(f"Starting embedding generation for lecture ID: {lecture_id}")
         
-        logging.info(f"Starting embedding generation for lecture ID: {lecture_id}")
-    
-        generate_and_save_embeddings(subject, unit, lecture_id, document_urls, PROJECT_ROOT=PROJECT_ROOT)
-        
-        logging.info(f"Embedding generation completed for lecture ID: {lecture_id}")
+            generate_and_save_embeddings(subject, unit, lecture_id, document_urls, replace=replace)
+            
+            logging.info(f"Embedding generation completed for lecture ID: {lecture_id}")
+            return jsonify({
+                "message": "Embeddings generated and cached successfully", 
+                "embedding_cache_file": os.path.join(get_embedding_cache_dir(subject, unit, lecture_id), MANIFEST_FILE),
+            }), 200
+
+        job_id, created = job_queue.submit(
+            "generate_embeddings",
+            f"{subject}/{unit}/{lecture_id}:{document_set_digest(document_urls)}{':replace' if replace else ''}",
+            {"subject": subject, "unit": unit, "lecture_id": lecture_id, "document_urls": document_urls, "replace": replace},
+            run_embedding_job,
+        )
         return jsonify({
-            "message": "Embeddings generated and cached successfully", 
-            "embedding_cache_file": os.path.join(PROJECT_ROOT, "Cache", f"{lecture_id}_embedding_cache.pkl"),
-        }), 200
-
+            "message": "Embedding generation queued" if created else "Embedding generation already in progress",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+        }), 202
+
+    except JobQueueFull as e:
+        logging.warning(f"Rejected /generate_embeddings: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         logging.error(f"An error occurred in /generate_embeddings: {e}")
         return jsonify({"error": str(e)}), 500
 
+def run_bulk_embedding_job(job, lectures):
+    """
+    Job function of /generate_embeddings_bulk: builds the lecture indexes and returns the per-lecture results.
+    """
+    return {"lectures": generate_embeddings_bulk(lectures, progress=job.report)}
+
+@app.route('/generate_embeddings_bulk', methods=['POST'])
+@require_api_key
+def generate_embeddings_bulk_route():
+    """
+    Queue embedding generation for many lectures at once. All documents are downloaded concurrently, parsed in
+    parallel and encoded in shared batches before each lecture index is written. Poll /jobs/<job_id> for progress
+    and the per-lecture results; with "wait": true in the body the lectures are built within the request instead.
+    Returns:
+        A JSON response containing the job ID and status URL (202), or the per-lecture results (200).
+    Raises:
+        Exception: If an error occurs during the embedding generation process.
+    """
+    try:
+        data = request.json
+        lectures = (data.get('lectures') if isinstance(data, dict) else None) or []
+
+        if not isinstance(lectures, list) or not lectures:
+            logging.error("Missing field: 'lectures' must be a non-empty list.")
+            return jsonify({"error": "Missing field: 'lectures' must be a non-empty list."}), 400
+
+        for lecture in lectures:
+            if not isinstance(lecture, dict):
+                logging.error(f"Invalid lecture in bulk request: {lecture}")
+                return jsonify({"error": "Each lecture must be an object with 'subject', 'unit', 'lecture', and 'document_urls'."}), 400
+            document_urls = lecture.get('document_urls', [])
+            if isinstance(document_urls, str):
+                document_urls = lecture['document_urls'] = [document_urls]
+            if not isinstance(document_urls, list) or not all(is_document_entry(doc) for doc in document_urls):
+                logging.error(f"Invalid document_urls in bulk request: {lecture}")
+                return jsonify({"error": "'document_urls' must be a URL or a list of URLs or {'url': ..., 'name': ...} objects."}), 400
+            if not lecture.get('subject') or not lecture.get('unit') or not lecture.get('lecture') or not document_urls:
+                logging.error(f"Invalid lecture in bulk request: {lecture}")
+                return jsonify({"error": "Each lecture requires 'subject', 'unit', 'lecture', and 'document_urls'."}), 400
+
+        lecture_keys = sorted(f"{l['subject']}/{l['unit']}/{l['lecture']}" for l in lectures)
+        if len(set(lecture_keys)) < len(lecture_keys):
+            return jsonify({"error": "Each lecture may only be listed once."}), 400
+
+        logging.info(f"Bulk embedding generation requested for {len(lectures)} lectures")
+
+        if data.get('wait', False):
+            results = generate_embeddings_bulk(lectures)
+            return jsonify({"message": "Bulk embedding generation finished", "lectures": results}), 200
+
+        job_key = hashlib.sha256("\n".join(
+            f"{l['subject']}/{l['unit']}/{l['lecture']}:{document_set_digest(l['document_urls'])}{':replace' if l.get('replace') else ''}"
+            for l in sorted(lectures, key=lambda l: (l['subject'], l['unit'], l['lecture']))
+        ).encode("utf-8")).hexdigest()
+        job_id, created = job_queue.submit("generate_embeddings_bulk", job_key, {"lectures": lectures}, run_bulk_embedding_job)
+        return jsonify({
+            "message": "Bulk embedding generation queued" if created else "Bulk embedding generation already in progress",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+        }), 202
+
+    except JobQueueFull as e:
+        logging.warning(f"Rejected /generate_embeddings_bulk: {e}")
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logging.error(f"An error occurred in /generate_embeddings_bulk: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@require_api_key
+def job_status(job_id):
+    """
+    Reports the status of a background job.
+    Returns:
+        A JSON response containing the job's status, stage, progress, timings, result and error.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify({
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "timings": job["timings"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }), 200
+
 @app.route('/transcribe_audio', methods=['POST'])
 @require_api_key
 def transcribe_audio():
@@ -362,21 +500,62 @@ def chat():
     subject = data.get("subject_id")
     unit = data.get("unit_id")
     lecture_id = data.get("lecture_id")
+    scope = data.get("scope", "lecture")
 
-    if not user_query or not lecture_id:
+    if scope not in ("lecture", "unit", "subject"):
+        logging.error(f"Invalid scope: {scope}")
+        return jsonify({"error": "'scope' must be one of 'lecture', 'unit' or 'subject'."}), 400
+
+    if scope == "lecture" and (not user_query or not lecture_id):
         logging.error("Both 'query' and 'lecture_id' are required.")
         return jsonify({"error": "Both 'query' and 'lecture_id' are required."}), 400
 
-    logging.info(f"Received query: {user_query}, Lecture ID: {lecture_id}")
+    if scope != "lecture" and (not user_query or not subject or (scope == "unit" and not unit)):
+        logging.error(f"'query', 'subject_id' and, for unit scope, 'unit_id' are required for {scope} search.")
+        return jsonify({"error": f"'query', 'subject_id' and, for unit scope, 'unit_id' are required for {scope} search."}), 400
 
-    try:
-        embeddings, index, documents = load_embeddings(lecture_id, subject, unit, PROJECT_ROOT=PROJECT_ROOT)
+    logging.info(f"Received query: {user_query}, Scope: {scope}, Lecture ID: {lecture_id}")
 
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        relevant_docs = retrieve_relevant_docs(user_query, index, documents, embedding_model)
+    try:
+        embedding_model = get_embedding_model()
+
+        # Answers only depend on the lecture and the query while there is no conversation history to take into account.
+        answer_key = (subject, unit, lecture_id)
+        answer_version = None
+        if scope == "lecture" and subject and unit and not session['conversation_history']:
+            answer_version = file_signature(os.path.join(get_lecture_index_dir(CACHE_PATH, subject, unit, lecture_id), MANIFEST_FILE))
+        use_answer_cache = answer_version is not None
+
+        if use_answer_cache:
+            cached_answer = answer_cache.lookup(answer_key, answer_version, encode_query(user_query, embedding_model))
+            if cached_answer is not None:
+                response, document_sources, similarity = cached_answer
+                session['conversation_history'].append((user_query, response))
+
+                end_time = time.time()
+                logging.info(f"Answer served from cache (similarity {similarity:.3f}) in {end_time - start_time:.2f} seconds")
+
+                return jsonify({
+                    "response": response,
+                    "document_sources": document_sources,
+                    "processing_time": f"{end_time - start_time:.2f} seconds",
+                    "cached": True,
+                    "similarity": round(similarity, 4)
+                })
+
+        if scope == "lecture":
+            lecture_index = load_lecture(lecture_id, subject, unit)
+            relevant_docs = retrieve_relevant_docs(user_query, lecture_index.index, lecture_index.documents, embedding_model,
+                                                   bm25=lecture_index.bm25, embeddings=lecture_index.embeddings)
+        else:
+            query_embedding = encode_query(user_query, embedding_model)
+            relevant_docs = federated_search(query_embedding, CACHE_PATH, subject, unit if scope == "unit" else None)
 
         response, document_sources = generate_response(user_query, relevant_docs, session['conversation_history'], ollama_model)
 
+        if use_answer_cache and response != FALLBACK_ANSWER:
+            answer_cache.store(answer_key, answer_version, encode_query(user_query, embedding_model), response, document_sources)
+
         session['conversation_history'].append((user_query, response))
 
         end_time = time.time()
@@ -386,7 +565,8 @@ def chat():
         return jsonify({
             "response": response,
             "document_sources": document_sources,
-            "processing_time": f"{end_time - start_time:.2f} seconds"
+            "processing_time": f"{end_time - start_time:.2f} seconds",
+            "cached": False
         })
 
     except FileNotFoundError as e:
@@ -399,6 +579,37 @@ def chat():
         logging.error(f"Internal error: {e}")
         return jsonify({"error": "An internal error occurred."}), 500
     
+@app.route('/build_unit_index', methods=['POST'])
+@require_api_key
+def build_unit_index_route():
+    """
+    Builds the unit-level index over every lecture index of a unit, used by unit and subject scoped chat.
+    Returns:
+        A JSON response containing the number of lectures and chunks in the unit index.
+    """
+    try:
+        data = request.json
+        subject = data.get("subject_id")
+        unit = data.get("unit_id")
+
+        if not subject or not unit:
+            logging.error("Both 'subject_id' and 'unit_id' are required.")
+            return jsonify({"error": "Both 'subject_id' and 'unit_id' are required."}), 400
+
+        manifest = build_unit_index(CACHE_PATH, subject, unit)
+        return jsonify({
+            "message": "Unit index built successfully",
+            "lectures": len(manifest["lectures"]),
+            "chunks": manifest["count"],
+        }), 200
+
+    except FileNotFoundError as e:
+        logging.error(f"Error building unit index: {e}")
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        logging.error(f"An error occurred in /build_unit_index: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/generate_lecture_schedule', methods=['POST'])
 def generate_lecture_schedule():
     """
@@ -418,13 +629,14 @@ def generate_lecture_schedule():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
 
-        text = extract_text_from_books(book_url, DATA_PATH)
+        # Pages are extracted only as far as topic generation reads them.
+        book_pages = iter_book_pages(book_url, DATA_PATH)
 
         num_days = (end_date - start_date).days
         lectures_per_week = hours_per_week // 1
         num_lectures = (num_days // 7) * lectures_per_week
         
-        lecture_topics = generate_topics_using_llm(text, num_lectures, ollama_model)
+        lecture_topics = generate_topics_using_llm(book_pages, num_lectures, ollama_model)
 
         grouped_lectures = group_topics_into_lectures(lecture_topics, num_lectures)
 
@@ -496,13 +708,32 @@ def create_assignment():
         logging.error(f"Internal error: {e}")
         return jsonify({"error": "An internal error occurred"}), 500
     
+@app.route('/metrics', methods=['GET'])
+@require_api_key
+def metrics():
+    """
+    Reports runtime statistics of the API process.
+    Returns:
+        A JSON response containing load time and memory usage of the loaded models, lecture, query and answer cache counters,
+        and document parsing totals.
+    """
+    return jsonify({
+        "models": get_model_stats(),
+        "lecture_cache": get_lecture_cache_stats(),
+        "query_cache": get_query_cache_stats(),
+        "answer_cache": get_answer_cache_stats(),
+        "parsing": get_parse_stats(),
+    }), 200
+
 # --------------------------------------------------------------- MAIN --------------------------------------------------------------- 
 
 if __name__ == "__main__":  
     
     cleanup_data_thread = threading.Thread(target=schedule_cleanup, args=(DATA_PATH,), daemon=True)
     cleanup_cache_thread = threading.Thread(target=schedule_cleanup, args=(CACHE_PATH,), daemon=True)
+    cleanup_blob_thread = threading.Thread(target=schedule_blob_cleanup, daemon=True)
     cleanup_data_thread.start()
     cleanup_cache_thread.start()
+    cleanup_blob_thread.start()
     
     app.run(debug=True, host='0.0.0.0', port=PORT)
\ No newline at end of file
@@ -0,0 +1,78 @@
+#benchmarks/bench_embedding_backend.py
+"""
+Compares the embedding backends (torch, onnx, onnx-int8) on the same chunks.
+
+For every backend it reports chunk throughput, p50 single-query latency and, against the torch backend, the mean and
+minimum cosine similarity of the embeddings. The script exits with status 1 if any backend falls below --min-cosine,
+so it doubles as the parity check after exporting or upgrading a model.
+
+Usage:
+    python benchmarks/bench_embedding_backend.py --texts 2000
+    python benchmarks/bench_embedding_backend.py --docs Docs/<subject>/<unit>/<lecture>
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.models import DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKENDS, get_embedding_model
+
+WORDS = ("stack queue heap binary tree graph traversal recursion pointer array hash table complexity algorithm "
+         "sorting merge quick insertion dynamic programming memoization greedy matrix vector gradient descent "
+         "neural network activation function loss optimizer protocol packet router latency throughput").split()
+
+def synthetic_texts(num_texts: int, seed: int = 0) -> list:
+    # Chunk-like texts of very different lengths, as produced by splitting slides and textbook pages.
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=int(rng.integers(8, 180)))) for _ in range(num_texts)]
+
+def document_texts(directory: str) -> list:
+    from utils.helpers import load_documents
+    return [doc.page_content for doc in load_documents(directory)]
+
+def run(texts: list, backends: list, batch_size: int, min_cosine: float) -> int:
+    print(f"{len(texts)} chunks, batch size {batch_size}, model {DEFAULT_EMBEDDING_MODEL}")
+    print(f"{'backend':>10} {'chunks/s':>10} {'speedup':>8} {'query p50 ms':>13} {'mean cos':>9} {'min cos':>9}")
+    reference = None
+    reference_rate = None
+    failed = False
+    for backend in backends:
+        model = get_embedding_model(DEFAULT_EMBEDDING_MODEL, backend)
+        model.encode(texts[:batch_size], batch_size=batch_size, convert_to_tensor=False)
+
+        start = time.perf_counter()
+        embeddings = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_tensor=False), dtype=np.float32)
+        rate = len(texts) / (time.perf_counter() - start)
+
+        latencies = []
+        for text in texts[:100]:
+            start = time.perf_counter()
+            model.encode([text], convert_to_tensor=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if reference is None:
+            reference, reference_rate = embeddings, rate
+        cosine = np.sum(embeddings * reference, axis=1)
+        failed = failed or cosine.min() < min_cosine
+        print(f"{backend:>10} {rate:>10.1f} {rate / reference_rate:>7.2f}x {np.percentile(latencies, 50):>13.2f} {cosine.mean():>9.4f} {cosine.min():>9.4f}")
+
+    if failed:
+        print(f"FAILED: a backend is below the minimum cosine similarity of {min_cosine} to {backends[0]}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000, help="Number of synthetic chunks (ignored with --docs)")
+    parser.add_argument("--docs", help="Lecture directory whose documents are loaded and split into chunks")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS),
+                        help="Backends to compare; the first is the reference")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+    texts = document_texts(args.docs) if args.docs else synthetic_texts(args.texts)
+    sys.exit(run(texts, args.backends, args.batch_size, args.min_cosine))
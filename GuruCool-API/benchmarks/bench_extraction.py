@@ -0,0 +1,236 @@
+#benchmarks/bench_extraction.py
+"""
+Compares the document extractor backends of each format on the same files.
+
+For every format and backend it reports pages per second (PDF pages and PPTX slides; other files count as one page),
+MB/s and text fidelity: the token F1 of the extracted text against the text the generated corpus was written from,
+or, with --docs, against the first backend of the format. A backend whose optional package is missing is listed as
+unavailable. The script exits with status 1 if a configured backend (EXTRACTOR_<FORMAT>) falls below --min-f1 on
+the generated corpus.
+
+The generated corpus is fixed by --seed and covers every format: plain text, Markdown with links and code, PDFs
+with many pages, PPTX decks with tables and grouped shapes (needs python-pptx) and DOCX files with tables.
+
+Usage:
+    python benchmarks/bench_extraction.py
+    python benchmarks/bench_extraction.py --formats pdf pptx --repeat 5
+    python benchmarks/bench_extraction.py --docs Docs/<subject>/<unit>/<lecture>
+"""
+import os
+import re
+import sys
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+from collections import Counter
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.extractors import EXTRACTORS, FORMATS, count_pages, detect_format, extract_file, list_extractors
+
+WORDS = ("stack queue heap binary tree graph traversal recursion pointer array hash table complexity algorithm "
+         "sorting merge quick insertion dynamic programming memoization greedy matrix vector gradient descent "
+         "neural network activation function loss optimizer protocol packet router latency throughput").split()
+
+def sentence(rng: random.Random, min_words: int = 6, max_words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+def tokens(text: str) -> Counter:
+    return Counter(re.findall(r"[a-z0-9]+", text.lower()))
+
+def token_f1(extracted: str, reference: str) -> float:
+    extracted, reference = tokens(extracted), tokens(reference)
+    overlap = sum((extracted & reference).values())
+    if not overlap:
+        return 0.0 if extracted or reference else 1.0
+    precision = overlap / sum(extracted.values())
+    recall = overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+def write_text(path: str, rng: random.Random) -> str:
+    text = "\n\n".join(" ".join(sentence(rng) for _ in range(8)) for _ in range(40))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return text
+
+def write_markdown(path: str, rng: random.Random) -> str:
+    lines, truth = [], []
+    for section in range(12):
+        heading, body, link = sentence(rng, 2, 4), sentence(rng), sentence(rng, 2, 3)
+        lines += [f"## {heading}", "", f"{body} See [{link}](https://example.com/notes/{section}) and **{heading}**.",
+                  "", f"- {sentence(rng)}", f"- {sentence(rng)}", "", "```", "x = 1", "```", ""]
+        truth += [heading, body, f"See {link} and {heading}.", lines[-7][2:], lines[-6][2:], "x = 1"]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    return "\n".join(truth)
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, rng: random.Random, pages: int = 24) -> str:
+    # A minimal PDF with one Helvetica text stream per page, written without a PDF library.
+    page_lines = [[sentence(rng) for _ in range(30)] for _ in range(pages)]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(pages))}] /Count {pages} >>",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    for i, lines in enumerate(page_lines):
+        content = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_pdf_string(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       f"/Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return "\n".join(line for lines in page_lines for line in lines)
+
+def write_pptx(path: str, rng: random.Random, slides: int = 20) -> str:
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    truth = []
+    for _ in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = sentence(rng, 2, 5)
+        truth.append(slide.shapes.title.text)
+        body = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(4), Inches(2))
+        body.text_frame.text = sentence(rng)
+        truth.append(body.text_frame.text)
+        table = slide.shapes.add_table(3, 3, Inches(5), Inches(1.5), Inches(4), Inches(1.5)).table
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = sentence(rng, 1, 3)
+                truth.append(cell.text)
+        group = slide.shapes.add_group_shape()
+        for j in range(2):
+            label = group.shapes.add_textbox(Inches(0.5 + 4 * j), Inches(4.5), Inches(3.5), Inches(1))
+            label.text_frame.text = sentence(rng, 3, 6)
+            truth.append(label.text_frame.text)
+    prs.save(path)
+    return "\n".join(truth)
+
+def write_docx(path: str, rng: random.Random) -> str:
+    # A minimal DOCX package with paragraphs and a table, written with zipfile.
+    blocks, truth = [], []
+    for _ in range(30):
+        paragraph = " ".join(sentence(rng) for _ in range(4))
+        blocks.append(f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>")
+        truth.append(paragraph)
+    rows = []
+    for _ in range(10):
+        cells = [sentence(rng, 1, 3) for _ in range(3)]
+        truth.extend(cells)
+        rows.append("<w:tr>" + "".join(f"<w:tc><w:p><w:r><w:t>{escape(cell)}</w:t></w:r></w:p></w:tc>" for cell in cells) + "</w:tr>")
+    blocks.append("<w:tbl>" + "".join(rows) + "</w:tbl>")
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                         '</Types>')
+        archive.writestr("_rels/.rels",
+                         '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+                         '</Relationships>')
+        archive.writestr("word/document.xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                         f'<w:body>{"".join(blocks)}</w:body></w:document>')
+    return "\n".join(truth)
+
+WRITERS = {"text": (".txt", write_text), "markdown": (".md", write_markdown), "pdf": (".pdf", write_pdf),
+           "pptx": (".pptx", write_pptx), "docx": (".docx", write_docx)}
+
+def generate_corpus(directory: str, formats: list, files_per_format: int, seed: int) -> dict:
+    """
+    Writes files_per_format files of every format into directory.
+
+    Returns:
+        dict: {format: [(path, the text the file was written from), ...]}
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for fmt in formats:
+        extension, writer = WRITERS[fmt]
+        for i in range(files_per_format):
+            path = os.path.join(directory, f"{fmt}-{i}{extension}")
+            try:
+                corpus.setdefault(fmt, []).append((path, writer(path, rng)))
+            except ImportError as e:
+                print(f"Skipping {fmt}: {e}")
+                corpus.pop(fmt, None)
+                break
+    return corpus
+
+def document_corpus(directory: str, formats: list) -> dict:
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and not name.startswith("."):
+            fmt = detect_format(path)
+            if fmt in formats:
+                corpus.setdefault(fmt, []).append((path, None))
+    return corpus
+
+def page_count(path: str, fmt: str) -> int:
+    if fmt == "pptx":
+        with zipfile.ZipFile(path) as archive:
+            return sum(1 for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name))
+    return count_pages(path, fmt)
+
+def run(corpus: dict, repeat: int, min_f1: float) -> int:
+    print(f"{'format':>9} {'backend':>19} {'files':>6} {'pages':>6} {'pages/s':>9} {'MB/s':>7} {'F1':>7}")
+    failed = False
+    for fmt, files in corpus.items():
+        pages = sum(page_count(path, fmt) for path, _ in files)
+        megabytes = sum(os.path.getsize(path) for path, _ in files) / 1e6
+        references = [truth for _, truth in files]
+        for backend in list_extractors(fmt):
+            try:
+                texts = ["\n".join(doc.page_content for doc in extract_file(path, fmt, extractor=backend)) for path, _ in files]
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for path, _ in files:
+                        extract_file(path, fmt, extractor=backend)
+                    best = min(best, time.perf_counter() - start)
+            except ImportError as e:
+                print(f"{fmt:>9} {backend:>19}   unavailable: {e}")
+                continue
+
+            if references[0] is None:
+                # Real documents have no ground truth: compare with the first backend of the format.
+                references = texts
+            f1 = sum(token_f1(text, reference) for text, reference in zip(texts, references)) / len(files)
+            failed = failed or (files[0][1] is not None and backend == EXTRACTORS[fmt] and f1 < min_f1)
+            print(f"{fmt:>9} {backend:>19} {len(files):>6} {pages:>6} {pages / best:>9.1f} {megabytes / best:>7.2f} {f1:>7.3f}"
+                  f"{'  (configured)' if backend == EXTRACTORS[fmt] else ''}")
+
+    if failed:
+        print(f"FAILED: a configured backend is below the minimum token F1 of {min_f1} on the generated corpus")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", help="Directory of real documents to compare the backends on, instead of the generated corpus")
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--files", type=int, default=3, help="Generated files per format")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per backend; the fastest is reported")
+    parser.add_argument("--min-f1", type=float, default=0.9)
+    args = parser.parse_args()
+    if args.docs:
+        sys.exit(run(document_corpus(args.docs, args.formats), args.repeat, args.min_f1))
+    with tempfile.TemporaryDirectory() as directory:
+        sys.exit(run(generate_corpus(directory, args.formats, args.files, args.seed), args.repeat, args.min_f1))
@@ -0,0 +1,86 @@
+#benchmarks/bench_faiss_index.py
+"""
+Compares the FAISS index types used for lecture indexes on synthetic corpora.
+
+For every corpus size it reports build time, recall@5 against exact flat search, bytes stored per vector and
+p50/p99 single-query latency for Flat, IVF and HNSW in each compression mode, and marks the type that automatic
+selection would pick.
+
+Usage:
+    python benchmarks/bench_faiss_index.py --sizes 1000 10000 100000 1000000
+    python benchmarks/bench_faiss_index.py --sizes 10000 --compression none fp16 sq8 pq
+"""
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.faiss_index import INDEX_TYPES, COMPRESSION_MODES, build_faiss_index, choose_index_type, describe_faiss_index
+
+DIM = 384
+K = 5
+
+def synthetic_corpus(num_vectors: int, num_queries: int, seed: int = 0):
+    """
+    Clustered unit vectors, which resemble sentence embeddings far better than uniform noise.
+    Queries are perturbed copies of random corpus vectors.
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = max(8, num_vectors // 500)
+    centers = rng.standard_normal((num_clusters, DIM)).astype(np.float32)
+    corpus = centers[rng.integers(0, num_clusters, num_vectors)] + 0.6 * rng.standard_normal((num_vectors, DIM)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+
+    queries = corpus[rng.integers(0, num_vectors, num_queries)] + 0.3 * rng.standard_normal((num_queries, DIM)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return corpus, queries.astype(np.float32)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def measure_latency(index, queries: np.ndarray):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), K)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def bytes_per_vector(index) -> float:
+    # Serialized size is what the lecture cache maps, including graph links and codebooks.
+    return faiss.serialize_index(index).size / index.ntotal
+
+def run(sizes: list, num_queries: int, compressions: list) -> None:
+    print(f"{'vectors':>9} {'index':>6} {'compression':>11} {'params':<28} {'build s':>8} {'recall@5':>9} {'B/vector':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in sizes:
+        corpus, queries = synthetic_corpus(size, num_queries)
+        exact = faiss.IndexFlatL2(DIM)
+        exact.add(corpus)
+        _, truth = exact.search(queries, K)
+        for index_type in INDEX_TYPES:
+            for compression in compressions:
+                start = time.perf_counter()
+                index = build_faiss_index(corpus, index_type, compression)
+                build_time = time.perf_counter() - start
+
+                _, found = index.search(queries, K)
+                p50, p99 = measure_latency(index, queries)
+                description = describe_faiss_index(index)
+                marker = "*" if index_type == choose_index_type(size) else " "
+                print(f"{size:>9} {index_type:>5}{marker} {description['compression']:>11} {str(description['index_params']):<28} {build_time:>8.2f} "
+                      f"{recall_at_k(found, truth):>9.3f} {bytes_per_vector(index):>9.1f} {p50:>8.3f} {p99:>8.3f}")
+    print("* = type chosen by automatic selection")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--compression", nargs="+", choices=COMPRESSION_MODES, default=["none"])
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.compression)
@@ -0,0 +1,6 @@
+#tests/conftest.py
+import os
+import sys
+
+# The API imports its modules as utils.*, relative to the GuruCool-API directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,30 @@
+#tests/test_blob_store.py
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain")
+
+from utils.blob_store import BlobStore
+
+SHA = "ab" * 32
+
+def test_embeddings_are_keyed_by_splitter_settings(tmp_path):
+    store = BlobStore(str(tmp_path))
+    vectors = np.ones((3, 4), dtype=np.float32)
+    store.put_embeddings(SHA, "org/model", "torch", "recursive-1000-200-v1", vectors)
+
+    np.testing.assert_array_equal(store.get_embeddings(SHA, "org/model", "torch", "recursive-1000-200-v1"), vectors)
+    # Same chunk count, other splitter settings: the chunk texts may differ, so the vectors are not reused.
+    assert store.get_embeddings(SHA, "org/model", "torch", "recursive-1000-200-v2") is None
+    assert store.get_embeddings(SHA, "org/model", "onnx", "recursive-1000-200-v1") is None
+
+def test_prune_deletes_embeddings_in_the_unkeyed_layout(tmp_path):
+    store = BlobStore(str(tmp_path))
+    store.put_embeddings(SHA, "model", "torch", "splitter", np.ones((1, 4)))
+    legacy = tmp_path / "embeddings" / "model__torch" / f"{SHA}.npy"
+    np.save(legacy, np.ones((1, 4)))
+
+    store.prune()
+
+    assert not legacy.exists()
+    assert store.get_embeddings(SHA, "model", "torch", "splitter") is not None
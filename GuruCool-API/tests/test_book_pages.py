@@ -0,0 +1,101 @@
+#tests/test_book_pages.py
+"""
+Checks that iter_book_pages keeps the pages it extracted in the text cache when its caller stops early, and that
+later reads are served from the cache and continue after it.
+
+utils.firebase connects to Firebase on import, so it is replaced by an empty module, and the book is "downloaded"
+by copying a PDF generated here.
+"""
+import sys
+import json
+import types
+import shutil
+
+import pytest
+
+pytest.importorskip("PyPDF2")
+pytest.importorskip("pypdf")
+pytest.importorskip("pptx")
+pytest.importorskip("langchain")
+pytest.importorskip("filelock")
+pytest.importorskip("holidays")
+
+PAGES = [f"Page {i} covers topic number {i} of the course." for i in range(6)]
+
+def write_pdf(path: str, pages: list) -> None:
+    # One Helvetica text line per page.
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] /Count {len(pages)} >>",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       f"/Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def helpers(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "utils.firebase", types.ModuleType("utils.firebase"))
+    monkeypatch.delitem(sys.modules, "utils.helpers", raising=False)
+    from utils import helpers
+    from utils.blob_store import BlobStore
+
+    book = tmp_path / "book.pdf"
+    write_pdf(str(book), PAGES)
+    monkeypatch.setattr(helpers, "download_file", lambda url, path, **kwargs: shutil.copyfile(book, path))
+    monkeypatch.setattr(helpers, "blob_store", BlobStore(str(tmp_path / "blobs")))
+    return helpers
+
+def cached_pages(helpers, tmp_path) -> list:
+    (text_path,) = (tmp_path / "blobs" / "text").glob("*.jsonl")
+    with open(text_path, 'r', encoding='utf-8') as f:
+        assert json.loads(f.readline()) == {"page_count": len(PAGES)}
+        return [json.loads(line) for line in f]
+
+def test_cache_is_kept_when_the_caller_stops_early(helpers, tmp_path):
+    pages = helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data"))
+    first = [next(pages), next(pages)]
+    pages.close()
+
+    assert [text.strip() for text in first] == PAGES[:2]
+    assert [text.strip() for text in cached_pages(helpers, tmp_path)] == PAGES[:2]
+    assert not list((tmp_path / "blobs" / "text").glob("*.tmp"))
+
+def test_later_reads_continue_after_the_cached_pages(helpers, tmp_path, monkeypatch):
+    pages = helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data"))
+    next(pages)
+    pages.close()
+
+    assert [text.strip() for text in helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data"))] == PAGES
+    assert len(cached_pages(helpers, tmp_path)) == len(PAGES)
+
+    # A complete cache is read without opening the PDF.
+    monkeypatch.setattr(helpers.PyPDF2, "PdfReader", None)
+    assert [text.strip() for text in helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data"))] == PAGES
+
+def test_budgeted_planner_read_leaves_a_cache(helpers, tmp_path):
+    from utils.coursepolicy import take_book_text
+
+    text = take_book_text(helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data")), max_chars=60)
+
+    assert len(text) <= 60 + len("\n\n")
+    assert 1 <= len(cached_pages(helpers, tmp_path)) < len(PAGES)
+
+def test_planner_reads_the_whole_book_by_default(helpers, tmp_path):
+    from utils.coursepolicy import take_book_text
+
+    text = take_book_text(helpers.iter_book_pages("https://example.com/book.pdf", str(tmp_path / "data")))
+
+    assert [page.strip() for page in text.split("\n\n")] == PAGES
+    assert len(cached_pages(helpers, tmp_path)) == len(PAGES)
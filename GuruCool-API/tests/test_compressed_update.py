@@ -0,0 +1,64 @@
+#tests/test_compressed_update.py
+"""
+Checks that updating a compressed lecture index builds it from the true embeddings of the unchanged chunks rather than
+from the lossy vectors decoded from the previous index.
+"""
+import sys
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("langchain")
+pytest.importorskip("psutil")
+
+from langchain.schema import Document
+
+DIM = 32
+
+def vector(text: str) -> np.ndarray:
+    return np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(DIM).astype(np.float32)
+
+@pytest.fixture
+def embedding(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "utils.firebase", types.ModuleType("utils.firebase"))
+    for name in ("utils.helpers", "utils.embedding"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    from utils import embedding
+    from utils import faiss_index
+    from utils.blob_store import BlobStore
+
+    monkeypatch.setattr(faiss_index, "EMBEDDING_COMPRESSION", "sq8")
+    monkeypatch.setattr(embedding, "blob_store", BlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(embedding, "encode_texts", lambda texts: np.vstack([vector(text) for text in texts]))
+    return embedding
+
+def chunks(name: str, count: int) -> list:
+    return [Document(page_content=f"{name} chunk {i}", metadata={"source": f"/docs/{name}", "sha256": name * 8})
+            for i in range(count)]
+
+def test_update_of_compressed_index_uses_true_embeddings(embedding, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index")
+    first = chunks("a", 40) + chunks("b", 40)
+    embedding.update_lecture_index(index_dir, None, {"a": "a" * 8, "b": "b" * 8}, ["a", "b"], first,
+                                   embedding.encode_documents(first))
+    previous_index = embedding.open_lecture_index(index_dir)
+    assert isinstance(previous_index.embeddings, embedding.IndexVectors)
+
+    written = {}
+    write_lecture_index = embedding.write_lecture_index
+    def record(index_dir, embeddings, *args, **kwargs):
+        written["embeddings"] = np.array(embeddings)
+        return write_lecture_index(index_dir, embeddings, *args, **kwargs)
+    monkeypatch.setattr(embedding, "write_lecture_index", record)
+
+    changed = chunks("c", 40)
+    embedding.update_lecture_index(index_dir, previous_index, {"a": "a" * 8, "c": "c" * 8}, ["c"], changed,
+                                   embedding.encode_documents(changed))
+
+    expected = np.vstack([vector(doc.page_content) for doc in chunks("a", 40) + changed])
+    np.testing.assert_array_equal(written["embeddings"], expected)
+    # The decoded vectors really are lossy, so reusing them would have changed the index.
+    assert not np.array_equal(np.asarray(previous_index.embeddings[range(40)]), expected[:40])
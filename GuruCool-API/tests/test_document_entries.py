@@ -0,0 +1,29 @@
+#tests/test_document_entries.py
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("filelock")
+
+@pytest.fixture
+def helpers(monkeypatch):
+    # utils.firebase connects to Firebase on import.
+    monkeypatch.setitem(sys.modules, "utils.firebase", types.ModuleType("utils.firebase"))
+    monkeypatch.delitem(sys.modules, "utils.helpers", raising=False)
+    from utils import helpers
+    return helpers
+
+@pytest.mark.parametrize("doc", [
+    "https://example.com/notes.pdf",
+    {"url": "https://example.com/notes.pdf", "name": "Notes"},
+    {"url": "https://example.com/notes.pdf"},
+])
+def test_accepted_document_entries(helpers, doc):
+    assert helpers.is_document_entry(doc)
+    assert helpers.get_document_url(doc) == "https://example.com/notes.pdf"
+
+@pytest.mark.parametrize("doc", [None, 3, ["https://example.com/notes.pdf"], {"name": "Notes"}, {"url": ""}, {"url": 3}])
+def test_rejected_document_entries(helpers, doc):
+    assert not helpers.is_document_entry(doc)
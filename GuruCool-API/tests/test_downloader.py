@@ -0,0 +1,233 @@
+#tests/test_downloader.py
+"""
+Exercises download_file against a local HTTP server: resuming .part files with Range and If-Range, restarting when
+the remote file changed, 416 on a complete .part file, resuming after a dropped connection, and checksum verification.
+"""
+import os
+import json
+import base64
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("filelock")
+
+from utils import downloader
+from utils.downloader import DownloadVerificationError, download_all, download_file
+
+OLD = bytes(range(256)) * 40
+NEW = bytes(reversed(range(256))) * 48
+
+class FileServer:
+    """
+    Serves one file at /file.bin with a strong ETag and byte ranges, and records the headers of every GET.
+    """
+    def __init__(self):
+        self.content = OLD
+        self.etag = '"v1"'
+        self.honor_if_range = True
+        self.md5 = None
+        self.drop_after = None
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self._send_version()
+                self.send_header("Content-Length", str(len(server.content)))
+                self.end_headers()
+
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                content, start = server.content, 0
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and (if_range is None or if_range == server.etag or not server.honor_if_range):
+                    start = int(range_header[len("bytes="):].rstrip("-"))
+                    if start >= len(content):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self._send_version()
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+                else:
+                    self.send_response(200)
+                self._send_version()
+                body = content[start:]
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if server.drop_after is not None:
+                    # Announce the whole body but send only part of it, as a dropped connection would.
+                    self.wfile.write(body[:server.drop_after])
+                    server.drop_after = None
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def _send_version(self):
+                self.send_header("ETag", server.etag)
+                if server.md5:
+                    self.send_header("x-goog-hash", f"md5={server.md5}")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/file.bin"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def publish(self, content: bytes, etag: str) -> None:
+        self.content, self.etag = content, etag
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_BACKOFF", 0)
+    server = FileServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+def md5_of(content: bytes) -> str:
+    return base64.b64encode(hashlib.md5(content).digest()).decode("ascii")
+
+def write_part(file_path, content: bytes, url: str = None, etag: str = None) -> None:
+    with open(f"{file_path}.part", 'wb') as f:
+        f.write(content)
+    if url:
+        with open(os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.part.json"), 'w') as f:
+            json.dump({"url": url, "etag": etag}, f)
+
+def leftovers(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name not in ("file.bin", ".downloads.json") and not name.endswith(".lock"))
+
+def test_download_leaves_only_the_file(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+
+    assert download_file(server.url, str(file_path)) == len(OLD)
+
+    assert file_path.read_bytes() == OLD
+    assert leftovers(tmp_path) == []
+    assert "Range" not in server.requests[0]
+
+def test_resume_sends_if_range_and_appends(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    write_part(file_path, OLD[:1000], server.url, '"v1"')
+
+    assert download_file(server.url, str(file_path)) == len(OLD) - 1000
+
+    assert file_path.read_bytes() == OLD
+    assert server.requests[0]["Range"] == "bytes=1000-"
+    assert server.requests[0]["If-Range"] == '"v1"'
+    assert leftovers(tmp_path) == []
+
+def test_changed_file_is_downloaded_from_the_start(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    write_part(file_path, OLD[:1000], server.url, '"v1"')
+    server.publish(NEW, '"v2"')
+
+    download_file(server.url, str(file_path))
+
+    assert file_path.read_bytes() == NEW
+
+def test_changed_file_is_restarted_when_the_server_ignores_if_range(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    write_part(file_path, OLD[:1000], server.url, '"v1"')
+    server.publish(NEW, '"v2"')
+    server.honor_if_range = False
+
+    download_file(server.url, str(file_path))
+
+    assert file_path.read_bytes() == NEW
+    assert "Range" not in server.requests[-1]
+
+def test_part_without_recorded_version_is_restarted(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    write_part(file_path, NEW[:1000])
+
+    download_file(server.url, str(file_path))
+
+    assert file_path.read_bytes() == OLD
+    assert [request.get("Range") for request in server.requests] == [None]
+
+def test_complete_part_is_used_on_416(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    write_part(file_path, OLD, server.url, '"v1"')
+
+    assert download_file(server.url, str(file_path)) == 0
+
+    assert file_path.read_bytes() == OLD
+    assert leftovers(tmp_path) == []
+
+def test_dropped_connection_is_resumed(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_CHUNK_SIZE", 1024)
+    file_path = tmp_path / "file.bin"
+    server.md5 = md5_of(OLD)
+    server.drop_after = 3 * 1024
+
+    download_file(server.url, str(file_path))
+
+    assert file_path.read_bytes() == OLD
+    assert [request.get("Range") for request in server.requests] == [None, "bytes=3072-"]
+    assert server.requests[1]["If-Range"] == '"v1"'
+
+def test_checksum_mismatch_discards_the_part(server, tmp_path):
+    file_path = tmp_path / "file.bin"
+    server.md5 = md5_of(NEW)
+
+    with pytest.raises(DownloadVerificationError):
+        download_file(server.url, str(file_path))
+
+    assert not file_path.exists()
+    assert leftovers(tmp_path) == []
+
+@pytest.fixture
+def store(tmp_path):
+    pytest.importorskip("langchain")
+    from utils.blob_store import BlobStore
+    return BlobStore(str(tmp_path / "blobs"))
+
+def test_stored_object_is_linked_without_downloading(server, store, tmp_path):
+    server.md5 = md5_of(OLD)
+    (tmp_path / "seed.bin").write_bytes(OLD)
+    store.add(str(tmp_path / "seed.bin"), md5=server.md5)
+
+    assert download_file(server.url, str(tmp_path / "file.bin"), store=store) == 0
+
+    assert (tmp_path / "file.bin").read_bytes() == OLD
+    assert server.requests == []
+
+def test_object_pruned_before_linking_is_downloaded(server, store, tmp_path, monkeypatch):
+    server.md5 = md5_of(OLD)
+    (tmp_path / "seed.bin").write_bytes(OLD)
+    sha256 = store.add(str(tmp_path / "seed.bin"), md5=server.md5)
+    find_by_md5 = store.find_by_md5
+    def find_then_prune(md5):
+        found = find_by_md5(md5)
+        os.remove(store.blob_path(sha256))
+        return found
+    monkeypatch.setattr(store, "find_by_md5", find_then_prune)
+
+    assert download_file(server.url, str(tmp_path / "file.bin"), store=store) == len(OLD)
+
+    assert (tmp_path / "file.bin").read_bytes() == OLD
+    assert os.path.exists(store.blob_path(sha256))
+
+def test_os_errors_fail_one_download_only(server, tmp_path, monkeypatch):
+    def download(file_url, file_path, **kwargs):
+        if file_path.endswith("bad.bin"):
+            raise FileNotFoundError(file_path)
+        return download_file(file_url, file_path, **kwargs)
+    monkeypatch.setattr(downloader, "download_file", download)
+
+    stats = download_all([(server.url, str(tmp_path / "bad.bin")), (server.url, str(tmp_path / "file.bin"))])
+
+    assert (stats["failed"], stats["downloaded"]) == (1, 1)
+    assert (tmp_path / "file.bin").read_bytes() == OLD
@@ -0,0 +1,25 @@
+#tests/test_faiss_index.py
+import gc
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from utils.faiss_index import build_faiss_index, configure_search, FAISS_EF_SEARCH
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_configured_index_outlives_the_loaded_one(tmp_path, index_type):
+    embeddings = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(build_faiss_index(embeddings, index_type=index_type, compression="none"), path)
+
+    # Nothing else references the loaded index, as in open_lecture_index.
+    index = configure_search(faiss.read_index(path))
+    gc.collect()
+
+    assert index.ntotal == len(embeddings)
+    _, found = index.search(embeddings[:3], 1)
+    assert found[:, 0].tolist() == [0, 1, 2]
+    if index_type == "hnsw":
+        assert faiss.downcast_index(index).hnsw.efSearch == FAISS_EF_SEARCH
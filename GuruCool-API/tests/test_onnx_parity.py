@@ -0,0 +1,72 @@
+#tests/test_onnx_parity.py
+"""
+Checks that the ONNX embedding backends stay close to the torch model they are exported from.
+
+Runs on a small randomly initialized BERT model built in a temporary directory, so it works offline, and on
+EMBEDDING_MODEL (default all-MiniLM-L6-v2) when it can be loaded. Exporting needs torch, sentence-transformers, onnx
+and onnxruntime; the test is skipped when any of them is missing.
+"""
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+transformers = pytest.importorskip("transformers")
+SentenceTransformer = pytest.importorskip("sentence_transformers").SentenceTransformer
+
+from utils.onnx_embedding import OnnxEmbeddingModel, export_onnx_model
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+SENTENCES = [
+    "A binary search tree keeps its keys in sorted order.",
+    "Dijkstra's algorithm finds shortest paths in graphs with non-negative edge weights.",
+    "Gradient descent updates the weights against the gradient of the loss.",
+    "TCP retransmits packets that are not acknowledged in time.",
+    "Short.",
+    "Memoization stores the results of subproblems so dynamic programming solves each one once, which turns an "
+    "exponential recursion into a polynomial one for problems such as the longest common subsequence.",
+]
+# Minimum cosine similarity of each sentence's embedding to the torch embedding.
+MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.97}
+
+def build_tiny_model(model_dir: str) -> str:
+    # A two-layer BERT with a vocabulary of the test sentences' words, saved as a SentenceTransformer model.
+    words = sorted({word.strip(".,'").lower() for sentence in SENTENCES for word in sentence.split()})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ",", "'", "-", *words]
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    with open(vocab_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(vocab))
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                                     intermediate_size=128, max_position_embeddings=128)
+    transformers.BertModel(config).save_pretrained(model_dir)
+    transformers.BertTokenizerFast(vocab_file=vocab_file).save_pretrained(model_dir)
+    SentenceTransformer(model_dir, device="cpu").save(model_dir)
+    return model_dir
+
+@pytest.fixture(scope="module", params=["tiny", "configured"])
+def exported_model(request, tmp_path_factory):
+    if request.param == "tiny":
+        model_name = build_tiny_model(str(tmp_path_factory.mktemp("tiny-bert")))
+    else:
+        model_name = MODEL_NAME
+    try:
+        torch_model = SentenceTransformer(model_name, device="cpu")
+    except OSError as e:
+        pytest.skip(f"Model {model_name} is not available: {e}")
+    return torch_model, export_onnx_model(model_name, str(tmp_path_factory.mktemp("onnx")))
+
+@pytest.mark.parametrize("backend", sorted(MIN_COSINE))
+def test_onnx_embeddings_match_torch(exported_model, backend):
+    torch_model, model_dir = exported_model
+    expected = np.asarray(torch_model.encode(SENTENCES, convert_to_tensor=False), dtype=np.float32)
+    actual = OnnxEmbeddingModel(model_dir, backend).encode(SENTENCES, batch_size=4)
+
+    assert actual.shape == expected.shape
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    cosine = np.sum(actual * expected, axis=1)
+    assert cosine.min() >= MIN_COSINE[backend], f"{backend} cosine similarities to torch: {np.round(cosine, 4).tolist()}"
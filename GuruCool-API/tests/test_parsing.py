@@ -0,0 +1,64 @@
+#tests/test_parsing.py
+import os
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("pypdf")
+pytest.importorskip("pptx")
+
+from utils import parsing
+
+@pytest.fixture
+def pdfs(tmp_path, monkeypatch):
+    counted = []
+    def count_pages(path, fmt):
+        counted.append(os.path.basename(path))
+        return 100
+    monkeypatch.setattr(parsing, "detect_format", lambda path: "pdf")
+    monkeypatch.setattr(parsing, "count_pages", count_pages)
+    monkeypatch.setattr(parsing, "PDF_SPLIT_MIN_BYTES", 1000)
+    monkeypatch.setattr(parsing, "PDF_PAGES_PER_TASK", 16)
+    (tmp_path / "small.pdf").write_bytes(b"%PDF" + b"0" * 10)
+    (tmp_path / "large.pdf").write_bytes(b"%PDF" + b"0" * 2000)
+    return tmp_path, counted
+
+def test_small_pdfs_are_not_opened_to_plan(pdfs):
+    directory, counted = pdfs
+
+    tasks = parsing.plan_parse_tasks([directory / "small.pdf"], workers=4)
+
+    assert tasks == [(0, str(directory / "small.pdf"), "pdf", None, None)]
+    assert counted == []
+
+def test_large_pdfs_are_split_into_at_most_one_range_per_worker(pdfs):
+    directory, counted = pdfs
+
+    ranges = [task[3:] for task in parsing.plan_parse_tasks([directory / "large.pdf"], workers=4)]
+
+    assert ranges == [(0, 25), (25, 50), (50, 75), (75, 100)]
+    assert counted == ["large.pdf"]
+    # With many workers the ranges stay at least PDF_PAGES_PER_TASK pages long.
+    assert len(parsing.plan_parse_tasks([directory / "large.pdf"], workers=32)) == 7
+
+def test_single_worker_parses_whole_files(pdfs):
+    directory, counted = pdfs
+
+    assert parsing.plan_parse_tasks([directory / "large.pdf"], workers=1) == [(0, str(directory / "large.pdf"), "pdf", None, None)]
+    assert counted == []
+
+def test_started_pool_parses_files(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f"notes{i}.txt")
+        files[-1].write_text(f"Lecture notes number {i}. " * 20, encoding="utf-8")
+
+    parsing.start_parse_pool(workers=2)
+    try:
+        assert parsing._executor is not None
+        documents, reports = parsing.parse_files(files, workers=2)
+    finally:
+        parsing.stop_parse_pool()
+
+    assert [report["error"] for report in reports] == [None, None, None]
+    assert {os.path.basename(doc.metadata["source"]) for doc in documents} == {"notes0.txt", "notes1.txt", "notes2.txt"}
@@ -0,0 +1,103 @@
+#utils/answer_cache.py
+import os
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_PER_LECTURE = int(os.getenv("ANSWER_CACHE_MAX_PER_LECTURE", "256"))
+ANSWER_CACHE_MAX_LECTURES = int(os.getenv("ANSWER_CACHE_MAX_LECTURES", "512"))
+
+def _unit_vector(query_embedding) -> np.ndarray:
+    vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class SemanticAnswerCache:
+    """
+    Thread-safe cache of generated chat answers, grouped per lecture and matched by cosine similarity of the query
+    embeddings. Each lecture's answers are tagged with a version of its lecture index and are dropped together as
+    soon as a lookup or store sees a different version.
+    """
+    def __init__(self, threshold: float, max_per_lecture: int, max_lectures: int):
+        self.threshold = threshold
+        self.max_per_lecture = max_per_lecture
+        self.max_lectures = max_lectures
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lectures = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _answers(self, key, version, create: bool):
+        entry = self._lectures.get(key)
+        if entry is not None and entry[0] != version:
+            logging.info(f"Lecture index of {key} changed; dropping {len(entry[1])} cached answers.")
+            del self._lectures[key]
+            self.invalidations += 1
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = (version, OrderedDict())
+            self._lectures[key] = entry
+            while len(self._lectures) > self.max_lectures:
+                self._lectures.popitem(last=False)
+        self._lectures.move_to_end(key)
+        return entry[1]
+
+    def lookup(self, key, version, query_embedding):
+        """
+        Returns the cached answer whose query is most similar to the given one, if it reaches the threshold.
+
+        Args:
+            key (tuple): The lecture, e.g. (subject, unit, lecture_id).
+            version: Version of the lecture index the answer must have been generated from.
+            query_embedding (np.ndarray): Embedding of the new query.
+
+        Returns:
+            tuple: (response, document_sources, similarity), or None on a miss.
+        """
+        vector = _unit_vector(query_embedding)
+        with self._lock:
+            answers = self._answers(key, version, create=False)
+            if answers:
+                ids = list(answers)
+                similarities = np.stack([answers[i][0] for i in ids]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    answers.move_to_end(ids[best])
+                    self.hits += 1
+                    _, response, document_sources = answers[ids[best]]
+                    return response, list(document_sources), float(similarities[best])
+            self.misses += 1
+            return None
+
+    def store(self, key, version, query_embedding, response: str, document_sources: list) -> None:
+        with self._lock:
+            answers = self._answers(key, version, create=True)
+            answers[next(self._ids)] = (_unit_vector(query_embedding), response, list(document_sources))
+            while len(answers) > self.max_per_lecture:
+                answers.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "lectures": len(self._lectures),
+                "answers": sum(len(answers) for _, answers in self._lectures.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_PER_LECTURE, ANSWER_CACHE_MAX_LECTURES)
+
+def get_answer_cache_stats() -> dict:
+    return answer_cache.stats()
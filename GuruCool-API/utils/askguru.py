@@ -1,58 +1,93 @@
 #utils/askguru.py
 from utils.embedding import *
 from utils.helpers import *
+from utils.lecture_index import *
+from utils.lecture_cache import *
+from utils.query_cache import *
+from utils.retrieval import *
 import logging
-import pickle
 import os
 
-def load_embeddings(lecture_id, subject, unit, PROJECT_ROOT=None):
+FALLBACK_ANSWER = "Sorry, I couldn't generate a response."
+
+def load_lecture(lecture_id, subject, unit):
     """
-    Loads embeddings from cache if available; otherwise, generates them using the provided documents.
+    Loads a lecture index from the process-level lecture cache, opening the on-disk lecture index on a miss
+    (and migrating a legacy pickle cache if needed).
     
     Args:
         lecture_id (str): The ID of the lecture.
         subject (str): The subject of the lecture.
         unit (str): The unit of the lecture.
-        PROJECT_ROOT (str): The root directory of the project.
     
     Returns:
-        tuple: embeddings, index (FAISS index), and documents.
+        LectureIndex: The opened lecture index.
     """
-    cache_directory = os.path.join(PROJECT_ROOT, "Cache")
-    embedding_cache_file = os.path.join(cache_directory, f"{lecture_id}_embedding_cache.pkl")
+    cache_directory = CACHE_PATH
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
     
-    logging.info(f"Checking for cached embeddings at: {embedding_cache_file}")
+    logging.info(f"Checking for cached embeddings at: {index_dir}")
     
-    if os.path.exists(embedding_cache_file):
-        logging.info(f"Embeddings found in cache for Lecture ID: {lecture_id}. Loading from cache...")
-        try:
-            with open(embedding_cache_file, 'rb') as f:
-                embeddings, index, documents = pickle.load(f)
-            return embeddings, index, documents
-        except Exception as e:
-            logging.error(f"Error loading embeddings from cache: {e}")
-            raise
-    else:
+    try:
+        lecture_index = get_cached_lecture_index(cache_directory, subject, unit, lecture_id)
+    except FileNotFoundError:
         logging.error(f"Embeddings not found in cache for Lecture ID: {lecture_id}.")
-        raise FileNotFoundError(f"Embeddings not found for Lecture ID: {lecture_id}.")
+        raise
+    except Exception as e:
+        logging.error(f"Error loading embeddings from cache: {e}")
+        raise
+
+    logging.info(f"Embeddings found in cache for Lecture ID: {lecture_id} (build {lecture_index.build_id}).")
+    return lecture_index
+
+def load_embeddings(lecture_id, subject, unit):
+    """
+    Loads embeddings of a lecture, see load_lecture.
 
-def retrieve_relevant_docs(query, index, documents, embedding_model):
+    Returns:
+        tuple: embeddings (memory-mapped), index (FAISS index), and documents (lazy chunk store).
+    """
+    lecture_index = load_lecture(lecture_id, subject, unit)
+    return lecture_index.embeddings, lecture_index.index, lecture_index.documents
+
+def retrieve_relevant_docs(query, index, documents, embedding_model, bm25=None, embeddings=None):
     """
-    Retrieves relevant documents based on a given query.
+    Retrieves relevant documents based on a given query. Recently seen queries reuse their cached embedding.
+    With a BM25 index and RETRIEVAL_MODE=hybrid, dense and keyword results are fused. With RERANK enabled,
+    RERANK_CANDIDATES chunks are retrieved and the RERANK_TOP_K best according to a cross-encoder are returned.
+    Given the chunk embeddings, near-duplicate chunks are dropped and, without reranking, chunks are picked by
+    maximal marginal relevance. Overlapping chunks of the same source are merged into one passage.
 
     Args:
         query (str): The query string.
         index (Index): The index used for searching.
         documents (list): The list of documents.
         embedding_model (EmbeddingModel): The embedding model used for encoding the query.
+        bm25 (BM25Index): The lecture's BM25 index, if it has one.
+        embeddings (np.ndarray): The chunk embeddings, used for deduplication and MMR.
 
     Returns:
         list: The list of relevant documents.
     """
-    query_embedding = embedding_model.encode([query], convert_to_tensor=False)
-    _, indices = index.search(query_embedding, k=5)
-    relevant_docs = [documents[i] for i in indices[0]] 
-    return relevant_docs
+    query_embedding = encode_query(query, embedding_model)
+    k = RERANK_TOP_K if RERANK_ENABLED else 5
+    diversify = embeddings is not None and (RERANK_ENABLED or MMR_ENABLED)
+    if RERANK_ENABLED:
+        candidates = RERANK_CANDIDATES
+    else:
+        candidates = max(k, MMR_CANDIDATES) if diversify else k
+
+    doc_ids = search_lecture(query, query_embedding, index, bm25, k=candidates)
+    if diversify and doc_ids:
+        doc_ids, vectors = remove_near_duplicates(doc_ids, embeddings[doc_ids])
+        if not RERANK_ENABLED:
+            doc_ids = mmr_select(query_embedding, doc_ids, vectors, k)
+
+    if RERANK_ENABLED:
+        relevant_docs = rerank_documents(query, [documents[i] for i in doc_ids], top_k=k)
+    else:
+        relevant_docs = [documents[i] for i in doc_ids[:k]]
+    return merge_overlapping_chunks(relevant_docs)
 
 def generate_response(query, relevant_docs, conversation_history, ollama_model):
     """
@@ -83,7 +118,7 @@ def generate_response(query, relevant_docs, conversation_history, ollama_model):
         logging.info(f"Ollama response generated successfully.")
     except Exception as e:
         logging.error(f"Error generating response: {e}")
-        answer = "Sorry, I couldn't generate a response."
+        answer = FALLBACK_ANSWER
     
     document_sources = [doc.metadata.get("source") for doc in relevant_docs]
     return answer, document_sources
\ No newline at end of file
@@ -0,0 +1,226 @@
+#utils/blob_store.py
+import os
+import json
+import time
+import uuid
+import base64
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from langchain.schema import Document
+
+from utils.build_lock import atomic_write
+
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Blobs"))
+HASH_MEMO_SIZE = 4096
+
+_hash_memo = {}
+
+def hash_file(file_path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's content, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_file_cached(file_path: str) -> str:
+    """
+    hash_file, remembered per process for as long as the file's inode, size and modification time are unchanged.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        digest = hash_file(file_path)
+        if len(_hash_memo) >= HASH_MEMO_SIZE:
+            _hash_memo.clear()
+        _hash_memo[key] = digest
+    return digest
+
+class BlobStore:
+    """
+    Content-addressed store for downloaded documents, shared by all lectures. Every document is kept once under
+    its SHA-256, lecture directories hold hard links to it, and the chunks and chunk embeddings of a document are
+    cached by the same hash, so a file attached to many lectures is downloaded, parsed and embedded once.
+
+    Layout under the root:
+        objects/<sha[:2]>/<sha>                 document content
+        md5/<md5 hex>                           SHA-256 of the object with that MD5, to match storage metadata
+        chunks/<splitter>/<sha>.json            chunks of the document split with the given splitter settings
+        embeddings/<model>__<backend>/<splitter>/<sha>.npy
+                                                embeddings of those chunks
+        text/<sha>.jsonl                        page texts extracted from a book, a header line and one page per line
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], sha256)
+
+    def _md5_path(self, md5: str) -> str:
+        # Storage servers publish MD5 in base64, which is not file name safe.
+        return os.path.join(self.root, "md5", base64.b64decode(md5).hex())
+
+    def _chunks_path(self, sha256: str, splitter_key: str) -> str:
+        return os.path.join(self.root, "chunks", splitter_key, f"{sha256}.json")
+
+    def _embeddings_path(self, sha256: str, model_name: str, backend: str, splitter_key: str) -> str:
+        # Keyed by the splitter settings too: chunks re-split with other settings may keep their count but not their text.
+        return os.path.join(self.root, "embeddings", f"{model_name.replace('/', '__')}__{backend}", splitter_key, f"{sha256}.npy")
+
+    def text_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "text", f"{sha256}.jsonl")
+
+    def find_by_md5(self, md5: str):
+        """
+        Returns the SHA-256 of the stored object with the given base64 MD5, or None.
+        """
+        if not md5:
+            return None
+        try:
+            with open(self._md5_path(md5), 'r', encoding='utf-8') as f:
+                sha256 = f.read().strip()
+        except (OSError, ValueError):
+            return None
+        return sha256 if os.path.exists(self.blob_path(sha256)) else None
+
+    def add(self, file_path: str, md5: str = None) -> str:
+        """
+        Moves a file into the store, unless an object with the same content is already there.
+
+        Args:
+            file_path (str): The file to add; it no longer exists afterwards.
+            md5 (str): The base64 MD5 of the file, recorded so later downloads of the same object can be skipped.
+
+        Returns:
+            str: The SHA-256 of the file.
+        """
+        sha256 = hash_file(file_path)
+        blob_path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            # Refreshing its age keeps prune from deleting the object before the caller links it.
+            os.utime(blob_path)
+            os.remove(file_path)
+        else:
+            os.replace(file_path, blob_path)
+        if md5:
+            md5_path = self._md5_path(md5)
+            os.makedirs(os.path.dirname(md5_path), exist_ok=True)
+            with atomic_write(md5_path, 'w', encoding='utf-8') as f:
+                f.write(sha256)
+        return sha256
+
+    def link(self, sha256: str, target_path: str) -> None:
+        """
+        Places a stored object at target_path as a hard link, replacing any file there. Falls back to a copy when
+        the store and the target are on different file systems.
+        """
+        # Unique per call, so threads linking the same target outside the downloader's per-file lock never collide.
+        tmp_path = f"{target_path}.{uuid.uuid4().hex}.link"
+        try:
+            try:
+                os.link(self.blob_path(sha256), tmp_path)
+            except OSError:
+                shutil.copyfile(self.blob_path(sha256), tmp_path)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_chunks(self, sha256: str, splitter_key: str):
+        """
+        Returns the cached chunks of a document for the given splitter settings as Documents without a 'source',
+        or None.
+        """
+        try:
+            with open(self._chunks_path(sha256, splitter_key), 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return [Document(page_content=record["page_content"], metadata=record["metadata"]) for record in records]
+
+    def put_chunks(self, sha256: str, splitter_key: str, documents: list) -> None:
+        path = self._chunks_path(sha256, splitter_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        records = [{"page_content": doc.page_content,
+                    "metadata": {key: value for key, value in doc.metadata.items() if key not in ("source", "sha256")}}
+                   for doc in documents]
+        with atomic_write(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+
+    def get_embeddings(self, sha256: str, model_name: str, backend: str, splitter_key: str):
+        """
+        Returns the cached embeddings of a document's chunks split with the given splitter settings, or None.
+        """
+        try:
+            return np.load(self._embeddings_path(sha256, model_name, backend, splitter_key))
+        except (OSError, ValueError):
+            return None
+
+    def put_embeddings(self, sha256: str, model_name: str, backend: str, splitter_key: str, embeddings) -> None:
+        path = self._embeddings_path(sha256, model_name, backend, splitter_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path) as f:
+            np.save(f, np.asarray(embeddings, dtype=np.float32))
+
+    def prune(self, days_old: int = 1) -> int:
+        """
+        Deletes objects no lecture directory links to any more (link count 1) that are older than the given number
+        of days, together with their MD5 entries, and cached chunks, embeddings and book text of content no longer
+        stored.
+
+        Returns:
+            int: The number of objects deleted.
+        """
+        cutoff_time = time.time() - days_old * 86400
+        deleted = set()
+        for blob in Path(self.root, "objects").glob("*/*"):
+            try:
+                stat = blob.stat()
+                if stat.st_nlink > 1 or stat.st_mtime >= cutoff_time:
+                    continue
+                blob.unlink()
+            except OSError as e:
+                logging.error(f"Error deleting blob {blob}: {e}")
+                continue
+            deleted.add(blob.name)
+
+        # Chunks and embeddings are also cached for lecture files that never went through the store, so they are
+        # pruned by their own age once no stored object has their hash.
+        for cache_file in [*Path(self.root, "chunks").glob("*/*.json"), *Path(self.root, "embeddings").glob("*/*/*.npy"),
+                           *Path(self.root, "text").glob("*.jsonl")]:
+            try:
+                if not os.path.exists(self.blob_path(cache_file.stem)) and cache_file.stat().st_mtime < cutoff_time:
+                    cache_file.unlink()
+            except OSError as e:
+                logging.error(f"Error deleting cache file {cache_file}: {e}")
+
+        # Embeddings cached before they were keyed by splitter settings, as embeddings/<model>__<backend>/<sha>.npy,
+        # are never read again.
+        for legacy_file in Path(self.root, "embeddings").glob("*/*.npy"):
+            try:
+                legacy_file.unlink()
+            except OSError as e:
+                logging.error(f"Error deleting cache file {legacy_file}: {e}")
+
+        for md5_file in Path(self.root, "md5").glob("*"):
+            try:
+                if md5_file.read_text(encoding='utf-8').strip() in deleted:
+                    md5_file.unlink()
+            except OSError as e:
+                logging.error(f"Error deleting MD5 entry {md5_file}: {e}")
+
+        if deleted:
+            logging.info(f"Deleted {len(deleted)} unreferenced blobs.")
+        return len(deleted)
+
+blob_store = BlobStore(BLOB_STORE_PATH)
@@ -0,0 +1,123 @@
+#utils/bm25.py
+import os
+import re
+import json
+import time
+import logging
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Words, numbers and identifiers such as snake_case names; dotted and hyphenated terms (O(n), k-means, os.path)
+# are indexed as their parts.
+TOKEN_PATTERN = re.compile(r"\w+")
+
+BM25_FILES = ("bm25_vocab", "bm25_offsets", "bm25_doc_ids", "bm25_term_freqs", "bm25_doc_lengths")
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+def bm25_file_names(build_id: str) -> dict:
+    return {
+        "bm25_vocab": f"bm25-{build_id}.vocab.json",
+        "bm25_offsets": f"bm25-{build_id}.offsets.npy",
+        "bm25_doc_ids": f"bm25-{build_id}.doc_ids.npy",
+        "bm25_term_freqs": f"bm25-{build_id}.term_freqs.npy",
+        "bm25_doc_lengths": f"bm25-{build_id}.doc_lengths.npy",
+    }
+
+def _save_npy(path: str, array) -> None:
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def write_bm25_index(texts: list, paths: dict) -> dict:
+    """
+    Builds a BM25 inverted index over chunk texts and writes it as CSR-style postings: per term, a slice of
+    offsets into the doc id and term frequency arrays. Everything but the vocabulary can be memory-mapped.
+
+    Args:
+        texts (list): The chunk texts, in index order.
+        paths (dict): Output paths keyed by the names in BM25_FILES.
+
+    Returns:
+        dict: BM25 statistics recorded in the lecture index manifest.
+    """
+    start_time = time.time()
+    postings = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths[doc_id] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((doc_id, count))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for term_id, term in enumerate(vocab):
+        offsets[term_id + 1] = offsets[term_id] + len(postings[term])
+    doc_ids = np.empty(offsets[-1], dtype=np.int32)
+    term_freqs = np.empty(offsets[-1], dtype=np.float32)
+    for term_id, term in enumerate(vocab):
+        entries = np.asarray(postings[term], dtype=np.int64).reshape(-1, 2)
+        doc_ids[offsets[term_id]:offsets[term_id + 1]] = entries[:, 0]
+        term_freqs[offsets[term_id]:offsets[term_id + 1]] = entries[:, 1]
+
+    with open(paths["bm25_vocab"], 'w', encoding='utf-8') as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    _save_npy(paths["bm25_offsets"], offsets)
+    _save_npy(paths["bm25_doc_ids"], doc_ids)
+    _save_npy(paths["bm25_term_freqs"], term_freqs)
+    _save_npy(paths["bm25_doc_lengths"], doc_lengths)
+
+    logging.info(f"BM25 index over {len(texts)} chunks and {len(vocab)} terms built in {time.time() - start_time:.3f} seconds")
+    return {"terms": len(vocab), "postings": int(offsets[-1]), "avg_doc_length": float(doc_lengths.mean()) if len(texts) else 0.0}
+
+class BM25Index:
+    """
+    Read-only BM25 index of a lecture, opened from the files written by write_bm25_index.
+    """
+    def __init__(self, paths: dict, avg_doc_length: float, k1: float = BM25_K1, b: float = BM25_B):
+        with open(paths["bm25_vocab"], 'r', encoding='utf-8') as f:
+            self._term_ids = {term: term_id for term_id, term in enumerate(json.load(f))}
+        self._offsets = np.load(paths["bm25_offsets"], mmap_mode='r')
+        self._doc_ids = np.load(paths["bm25_doc_ids"], mmap_mode='r')
+        self._term_freqs = np.load(paths["bm25_term_freqs"], mmap_mode='r')
+        self._doc_lengths = np.load(paths["bm25_doc_lengths"], mmap_mode='r')
+        self.avg_doc_length = avg_doc_length or 1.0
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def search(self, query: str, k: int):
+        """
+        Scores every chunk containing a query term and returns the k best.
+
+        Returns:
+            tuple: (scores, chunk ids), best first. Chunks without any query term are not returned.
+        """
+        start_time = time.time()
+        num_docs = len(self)
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            doc_ids = self._doc_ids[start:end]
+            term_freqs = self._term_freqs[start:end]
+            idf = np.log(1 + (num_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_ids] / self.avg_doc_length)
+            # A chunk appears at most once per term's postings, so plain fancy-index accumulation is safe.
+            scores[doc_ids] += idf * term_freqs * (self.k1 + 1) / (term_freqs + norm)
+
+        matches = np.flatnonzero(scores)
+        top = matches[np.argsort(-scores[matches], kind="stable")[:k]]
+        logging.info(f"BM25 search matched {len(matches)} of {num_docs} chunks in {(time.time() - start_time) * 1000:.1f} ms")
+        return scores[top], top
@@ -1,8 +1,13 @@
 import os
 import time
+import shutil
 import logging
 from pathlib import Path
 
+from utils.lecture_index import MANIFEST_FILE, get_lecture_lock_file
+from utils.build_lock import build_lock
+from utils.blob_store import blob_store
+
 def delete_old_files(directory, days_old=1):
     """
     Delete files in the specified directory that are older than the given number of days.
@@ -31,6 +36,29 @@ def delete_old_files(directory, days_old=1):
             except Exception as e:
                 logging.error(f"Error deleting file {file_path}: {e}")
 
+def delete_old_lecture_index(index_dir, days_old=1):
+    """
+    Delete a lecture index directory as a whole once its manifest is older than the given number of days,
+    so an index is never left with only part of its files.
+    
+    Args:
+        index_dir (Path): Directory of the lecture index.
+        days_old (int): Number of days old the index should be before deletion. Defaults to 1 day.
+    """
+    cutoff_time = time.time() - days_old * 86400
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+
+    if os.path.getmtime(manifest_path) < cutoff_time:
+        try:
+            # A lecture that is being rebuilt right now is not old; leave it for the next cleanup run.
+            with build_lock(get_lecture_lock_file(index_dir), timeout=0):
+                shutil.rmtree(index_dir)
+            logging.info(f"Deleted old lecture index: {index_dir}")
+        except TimeoutError:
+            logging.info(f"Lecture index {index_dir} is being rebuilt; skipping cleanup.")
+        except Exception as e:
+            logging.error(f"Error deleting lecture index {index_dir}: {e}")
+
 def schedule_cleanup(DATA_PATH):
     """
     Periodically delete old files in the DATA_PATH directory.
@@ -50,8 +78,20 @@ def schedule_cleanup(DATA_PATH):
                 for unit_dir in subject_dir.iterdir():
                     if unit_dir.is_dir():
                         for lecture_dir in unit_dir.iterdir():
-                            if lecture_dir.is_dir():
+                            if (lecture_dir / MANIFEST_FILE).exists():
+                                delete_old_lecture_index(lecture_dir)
+                            elif lecture_dir.is_dir():
                                 delete_old_files(lecture_dir)
         
         logging.info("Cleanup complete. Sleeping for 2 hours.")
-        time.sleep(7200)  
\ No newline at end of file
+        time.sleep(7200)
+
+def schedule_blob_cleanup():
+    """
+    Periodically delete blob store objects that no lecture directory links to any more.
+    """
+    logging.info("Starting scheduled cleanup for unreferenced blobs.")
+    while True:
+        blob_store.prune()
+        logging.info("Blob cleanup complete. Sleeping for 2 hours.")
+        time.sleep(7200)
@@ -5,6 +5,10 @@ from datetime import timedelta
 import os
 import random
 
+# Characters of book text given to the model when planning topics; the pages after it are never extracted.
+# 0 (the default) gives it the whole book.
+BOOK_TEXT_BUDGET = int(os.getenv("BOOK_TEXT_BUDGET", "0"))
+
 def inject_review_and_exploration(topics, num_lectures):
     review_topics = ["Review or assignment session", "Deeper exploration of earlier topics"]
     review_positions = random.sample(range(1, num_lectures), k=(num_lectures // 5))  
@@ -17,18 +21,43 @@ def inject_review_and_exploration(topics, num_lectures):
 
     return topics[:num_lectures]
 
+def take_book_text(pages, max_chars=BOOK_TEXT_BUDGET):
+    """
+    Joins pages from a page iterator, such as iter_book_pages, until max_chars characters, then closes the iterator
+    so no further pages are read. With max_chars 0 every page is joined.
+    """
+    parts = []
+    size = 0
+    try:
+        for page_text in pages:
+            if not max_chars:
+                parts.append(page_text)
+                continue
+            parts.append(page_text[:max_chars - size])
+            size += len(parts[-1])
+            if size >= max_chars:
+                break
+    finally:
+        if hasattr(pages, "close"):
+            pages.close()
+    return "\n\n".join(parts)
+
 def generate_topics_using_llm(text, num_lectures, model):
     """
     Generates lecture topics using a large language model based on the provided book text.
 
     Args:
-        text (str): The full extracted text from the book.
+        text (str or iterable): The extracted text from the book, or an iterator over its pages, read page by page
+            (only up to BOOK_TEXT_BUDGET characters when that is set).
         num_lectures (int): The number of lectures to divide topics into.
         model (OllamaLLM): The language model used for generating topics.
 
     Returns:
         list: A list of topics to be used in the lectures.
     """
+    if not isinstance(text, str):
+        text = take_book_text(text)
+
     prompt = (
         f"Your task is to generate specific and detailed lecture topics based on the structure of the provided book. "
         f"Extract major sections, subsections, key concepts, methods, and case studies that can fill multiple lectures. "
@@ -0,0 +1,422 @@
+#utils/downloader.py
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from filelock import FileLock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.build_lock import atomic_write
+
+try:
+    # Installed with firebase-admin (through google-cloud-storage); without it only MD5 is verified.
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", "10"))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_BACKOFF = float(os.getenv("DOWNLOAD_BACKOFF", "0.5"))
+REVALIDATE_INTERVAL = float(os.getenv("REVALIDATE_INTERVAL", "3600"))
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout)
+FIREBASE_STORAGE_HOST = "firebasestorage.googleapis.com"
+DOWNLOAD_RECORDS_FILE = ".downloads.json"
+VERSION_FIELDS = ("generation", "etag", "md5")
+
+class DownloadVerificationError(Exception):
+    """Raised when a downloaded file does not match the checksum published by the storage server."""
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+_file_locks = {}
+_locks_guard = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session. Its connection pool is shared by all downloads, so repeated downloads
+    from Firebase Storage reuse TLS connections, and failed requests are retried with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=DOWNLOAD_RETRIES, backoff_factor=DOWNLOAD_BACKOFF, status_forcelist=RETRY_STATUSES,
+                          allowed_methods=("GET", "HEAD"), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    with _locks_guard:
+        return _host_semaphores.setdefault(urlparse(url).netloc, threading.BoundedSemaphore(DOWNLOAD_PER_HOST))
+
+def _file_lock(file_path: str) -> threading.Lock:
+    # One lock per target file: only downloads of the same file wait for each other.
+    with _locks_guard:
+        return _file_locks.setdefault(os.path.abspath(file_path), threading.Lock())
+
+def parse_goog_hash(header: str) -> dict:
+    """
+    Parses an x-goog-hash header ("crc32c=<base64>,md5=<base64>") into {"crc32c": ..., "md5": ...}.
+    """
+    hashes = {}
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name in ("crc32c", "md5") and value:
+            hashes[name] = value
+    return hashes
+
+def fetch_remote_version(file_url: str) -> dict:
+    """
+    Cheaply reads the version of a remote file without downloading it: generation, MD5 and CRC32C from the object
+    metadata for Firebase Storage URLs (the download URL without alt=media), otherwise ETag, generation, hashes and
+    size from a HEAD request.
+
+    Returns:
+        dict: Any of 'generation', 'etag', 'md5', 'crc32c' and 'size'; empty if the server could not be asked.
+    """
+    parsed = urlparse(file_url)
+    timeout = (DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+    try:
+        if parsed.netloc == FIREBASE_STORAGE_HOST:
+            metadata_url = urlunparse(parsed._replace(query=urlencode([(k, v) for k, v in parse_qsl(parsed.query) if k != "alt"])))
+            response = get_http_session().get(metadata_url, timeout=timeout)
+            response.raise_for_status()
+            metadata = response.json()
+            fields = (("generation", "generation"), ("md5", "md5Hash"), ("crc32c", "crc32c"), ("size", "size"))
+            return {name: metadata[key] for name, key in fields if metadata.get(key)}
+        response = get_http_session().head(file_url, allow_redirects=True, timeout=timeout)
+        response.raise_for_status()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.warning(f"Could not read the remote version of {parsed.path}: {e}")
+        return {}
+    return _response_version(response)
+
+def _response_version(response) -> dict:
+    version = parse_goog_hash(response.headers.get("x-goog-hash"))
+    for name, header in (("etag", "ETag"), ("generation", "x-goog-generation")):
+        if response.headers.get(header):
+            version[name] = response.headers[header]
+    if response.status_code == 200 and response.headers.get("Content-Length"):
+        version["size"] = response.headers["Content-Length"]
+    return version
+
+def _records_path(file_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), DOWNLOAD_RECORDS_FILE)
+
+def _read_records(records_path: str) -> dict:
+    try:
+        with open(records_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def read_download_record(file_path: str):
+    """
+    Returns what was recorded about a downloaded file (URL, generation, ETag, MD5, size and when it was last
+    checked against the server), or None.
+    """
+    return _read_records(_records_path(file_path)).get(os.path.basename(file_path))
+
+def write_download_record(file_path: str, record: dict) -> None:
+    """
+    Records the version of a downloaded file in the .downloads.json file of its directory.
+    """
+    records_path = _records_path(file_path)
+    with _file_lock(records_path), FileLock(f"{records_path}.lock"):
+        records = _read_records(records_path)
+        records[os.path.basename(file_path)] = record
+        with atomic_write(records_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+def remove_download_record(file_path: str) -> None:
+    """
+    Forgets a downloaded file that was deleted, so it no longer makes its directory due for revalidation.
+    """
+    records_path = _records_path(file_path)
+    with _file_lock(records_path), FileLock(f"{records_path}.lock"):
+        records = _read_records(records_path)
+        if records.pop(os.path.basename(file_path), None) is not None:
+            with atomic_write(records_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2)
+
+def directory_checked_at(directory: str) -> float:
+    """
+    Returns when the least recently checked download in a directory was last checked against the server,
+    or 0 if the directory has downloads that were never recorded.
+    """
+    records = _read_records(os.path.join(os.path.abspath(directory), DOWNLOAD_RECORDS_FILE))
+    return min((record.get("checked_at", 0) for record in records.values()), default=0)
+
+def is_current(file_path: str, record, remote: dict) -> bool:
+    """
+    Decides whether a local file is still the remote version, comparing the first of generation, ETag and MD5 known
+    on both sides. Files downloaded before versions were recorded are compared by MD5 or size. If the server could
+    not be asked, the local file is kept.
+    """
+    for name in VERSION_FIELDS:
+        if record and record.get(name) and remote.get(name):
+            return record[name] == remote[name]
+    if remote.get("md5"):
+        return file_hashes(file_path)["md5"] == remote["md5"]
+    if remote.get("size"):
+        return os.path.getsize(file_path) == int(remote["size"])
+    return True
+
+def file_hashes(file_path: str) -> dict:
+    """
+    Computes the base64 MD5 (and CRC32C, when google-crc32c is installed) of a file, as storage servers publish them.
+    """
+    md5 = hashlib.md5()
+    crc = google_crc32c.Checksum() if google_crc32c is not None else None
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            md5.update(block)
+            if crc is not None:
+                crc.update(block)
+    hashes = {"md5": base64.b64encode(md5.digest()).decode("ascii")}
+    if crc is not None:
+        hashes["crc32c"] = base64.b64encode(crc.digest()).decode("ascii")
+    return hashes
+
+def verify_download(file_path: str, expected: dict) -> bool:
+    """
+    Checks a file against the expected hashes. Returns False if there was nothing to check against.
+
+    Raises:
+        DownloadVerificationError: If a hash does not match.
+    """
+    actual = file_hashes(file_path)
+    checked = [name for name in ("crc32c", "md5") if name in expected and name in actual]
+    for name in checked:
+        if actual[name] != expected[name]:
+            raise DownloadVerificationError(f"{name} mismatch for {os.path.basename(file_path)}: expected {expected[name]}, got {actual[name]}")
+    return bool(checked)
+
+def _part_version_path(part_path: str) -> str:
+    # Hidden, so listing a lecture directory never mistakes it for a document.
+    return os.path.join(os.path.dirname(part_path), f".{os.path.basename(part_path)}.json")
+
+def _read_part_version(part_path: str) -> dict:
+    try:
+        with open(_part_version_path(part_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_part_version(part_path: str, file_url: str, response) -> None:
+    version = {"url": file_url}
+    for name, header in (("etag", "ETag"), ("generation", "x-goog-generation"), ("last_modified", "Last-Modified")):
+        if response.headers.get(header):
+            version[name] = response.headers[header]
+    with atomic_write(_part_version_path(part_path), 'w', encoding='utf-8') as f:
+        json.dump(version, f)
+
+def discard_part(part_path: str) -> None:
+    """
+    Deletes a .part file and the version recorded for it.
+    """
+    for path in (part_path, _part_version_path(part_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _if_range(part_version: dict):
+    # If-Range needs a strong ETag or a date; weak ETags never match it.
+    etag = part_version.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return part_version.get("last_modified")
+
+def _same_version(part_version: dict, response) -> bool:
+    for name, header in (("generation", "x-goog-generation"), ("etag", "ETag")):
+        if part_version.get(name) and response.headers.get(header):
+            return part_version[name] == response.headers[header]
+    return True
+
+def _fetch_part(file_url: str, part_path: str) -> tuple:
+    """
+    Streams a URL into a .part file, continuing from the bytes already in it with a Range request. Interrupted
+    transfers are resumed up to DOWNLOAD_RETRIES times.
+
+    The ETag, generation and Last-Modified of the response that started the .part file are recorded next to it,
+    and a resume sends them as If-Range, so the server answers with the whole new file instead of appending its
+    tail to the old bytes when the object changed in between. A .part file without a recorded version, such as
+    one left by a crash before the first response, is downloaded again from the start.
+
+    Returns:
+        tuple: The number of bytes fetched and the version the server announced (hashes, ETag, generation).
+    """
+    fetched = 0
+    version = {}
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        part_version = _read_part_version(part_path) if offset else {}
+        validator = _if_range(part_version) if part_version.get("url") == file_url else None
+        if offset and not validator:
+            logging.info(f"{os.path.basename(part_path)} has no recorded remote version; restarting the download.")
+            discard_part(part_path)
+            offset = 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        try:
+            with get_http_session().get(file_url, headers=headers, stream=True,
+                                        timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)) as response:
+                if response.status_code == 416:
+                    # If-Range held (the server would have sent the whole file otherwise), so a range starting at the
+                    # end of the object means the part file already holds all of it.
+                    if response.headers.get("Content-Range", "").endswith(f"/{offset}") and _same_version(part_version, response):
+                        return fetched, version
+                    logging.info(f"{os.path.basename(part_path)} does not match the remote file; restarting the download.")
+                    discard_part(part_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code == 206 and not _same_version(part_version, response):
+                    logging.info(f"{os.path.basename(part_path)} was started from another version of the remote file; restarting the download.")
+                    discard_part(part_path)
+                    continue
+                version = _response_version(response) or version
+                if response.status_code == 206:
+                    logging.info(f"Resuming {os.path.basename(part_path)} at {offset} bytes")
+                else:
+                    # A whole response replaces the part file, and its version is what a later resume must match.
+                    _write_part_version(part_path, file_url, response)
+                with open(part_path, 'ab' if response.status_code == 206 else 'wb') as f:
+                    for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(block)
+                        fetched += len(block)
+                    f.flush()
+                    os.fsync(f.fileno())
+            return fetched, version
+        except RESUMABLE_ERRORS as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            logging.warning(f"Download of {os.path.basename(part_path)} interrupted ({e}); resuming.")
+            time.sleep(DOWNLOAD_BACKOFF * 2 ** attempt)
+    raise requests.exceptions.RetryError(f"Gave up downloading {file_url} after {DOWNLOAD_RETRIES + 1} attempts.")
+
+def download_file(file_url: str, file_path: str, overwrite: bool = False, store=None):
+    """
+    Downloads a URL to a file. The response is streamed to <file>.part, which is resumed with HTTP Range requests
+    after an interruption (also across restarts), verified against the MD5/CRC32C published by the storage server
+    and only then renamed to the target, so an existing target is always complete.
+
+    An existing file is kept without asking the server if it was checked within REVALIDATE_INTERVAL seconds;
+    otherwise its recorded generation / ETag / MD5 is compared with the remote version and it is downloaded again
+    only if that changed.
+
+    Args:
+        file_url (str): The URL to download.
+        file_path (str): Where to save it.
+        overwrite (bool): Download even if the file already exists and is current.
+        store (BlobStore): Optional content-addressed store. The download is skipped when the store already holds
+            an object with the MD5 the server publishes for the URL; otherwise the downloaded file is added to it.
+            Either way file_path ends up linked to the stored object.
+
+    Returns:
+        int: The number of bytes downloaded (0 if the content was linked from the store), or None if the existing
+            file was kept.
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails after all retries.
+        DownloadVerificationError: If the downloaded file does not match its published checksum.
+    """
+    # The file lock keeps worker processes from appending to the same .part file.
+    with _file_lock(file_path), FileLock(f"{file_path}.lock"):
+        remote = None
+        if os.path.exists(file_path) and not overwrite:
+            record = read_download_record(file_path)
+            if record and record.get("url") == file_url and time.time() - record.get("checked_at", 0) < REVALIDATE_INTERVAL:
+                logging.info(f"File {os.path.basename(file_path)} already exists, skipping download.")
+                return None
+            remote = fetch_remote_version(file_url)
+            if is_current(file_path, record, remote):
+                write_download_record(file_path, {**(record or {}), **remote, "url": file_url, "checked_at": time.time()})
+                logging.info(f"File {os.path.basename(file_path)} is unchanged on the server, skipping download.")
+                return None
+            logging.info(f"File {os.path.basename(file_path)} changed on the server; downloading the new version.")
+
+        if store is not None:
+            remote = remote if remote is not None else fetch_remote_version(file_url)
+            sha256 = store.find_by_md5(remote.get("md5"))
+            if sha256:
+                try:
+                    store.link(sha256, file_path)
+                except OSError as e:
+                    # The object was pruned between the lookup and the link.
+                    logging.warning(f"Could not link {os.path.basename(file_path)} to stored object {sha256[:12]} ({e}); downloading it.")
+                else:
+                    write_download_record(file_path, {**remote, "url": file_url, "checked_at": time.time()})
+                    logging.info(f"Linked {os.path.basename(file_path)} to stored object {sha256[:12]}; download skipped.")
+                    return 0
+
+        part_path = f"{file_path}.part"
+        with _host_semaphore(file_url):
+            start_time = time.time()
+            size, version = _fetch_part(file_url, part_path)
+            if not (version.get("md5") or version.get("crc32c")):
+                version = {**(remote if remote is not None else fetch_remote_version(file_url)), **version}
+
+        try:
+            verified = verify_download(part_path, version)
+        except DownloadVerificationError:
+            discard_part(part_path)
+            raise
+        if store is not None:
+            store.link(store.add(part_path, md5=version.get("md5")), file_path)
+        else:
+            os.replace(part_path, file_path)
+        discard_part(part_path)
+        version.pop("size", None)
+        write_download_record(file_path, {**version, "url": file_url, "size": os.path.getsize(file_path), "checked_at": time.time()})
+
+        elapsed = time.time() - start_time
+        logging.info(f"Downloaded {os.path.basename(file_path)}: {size / 1e6:.2f} MB in {elapsed:.2f} seconds "
+                     f"({size / 1e6 / max(elapsed, 1e-9):.2f} MB/s){'' if verified else ', no checksum to verify'}")
+        return size
+
+def download_all(downloads: list, workers: int = DOWNLOAD_WORKERS, store=None) -> dict:
+    """
+    Downloads (url, file path) pairs on a bounded thread pool. A failed download is logged and counted without
+    stopping the others.
+
+    Returns:
+        dict: Counts of downloaded, linked (from the store), skipped (current) and failed files, total bytes and
+            elapsed seconds.
+    """
+    start_time = time.time()
+    stats = {"files": len(downloads), "downloaded": 0, "linked": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    if downloads:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(downloads))), thread_name_prefix="download") as executor:
+            futures = [executor.submit(download_file, file_url, file_path, store=store) for file_url, file_path in downloads]
+            for (file_url, _), future in zip(downloads, futures):
+                try:
+                    size = future.result()
+                except (requests.exceptions.RequestException, DownloadVerificationError, OSError) as e:
+                    logging.error(f"Error downloading file from {file_url}: {e}")
+                    stats["failed"] += 1
+                    continue
+                if size is None:
+                    stats["skipped"] += 1
+                elif size == 0 and store is not None:
+                    stats["linked"] += 1
+                else:
+                    stats["downloaded"] += 1
+                    stats["bytes"] += size
+    stats["seconds"] = round(time.time() - start_time, 3)
+    return stats
@@ -2,66 +2,413 @@
 import os
 import logging
 import time
-import pickle
-import faiss
-import torch
-from sentence_transformers import SentenceTransformer
+import hashlib
+import numpy as np
+
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
 from utils.firebase import *
 from utils.helpers import *
+from utils.models import DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKEND, get_embedding_model, get_embedding_pool
+from utils.lecture_index import *
+from utils.faiss_index import *
+from utils.build_lock import build_lock
+from utils.blob_store import blob_store
+from utils.parsing import SPLITTER_KEY
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+# Below this many chunks, shipping them to worker processes costs more than it saves.
+EMBEDDING_POOL_MIN_TEXTS = int(os.getenv("EMBEDDING_POOL_MIN_TEXTS", "2000"))
+BULK_DOWNLOAD_WORKERS = int(os.getenv("BULK_DOWNLOAD_WORKERS", "8"))
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 4)))
+
+def get_embedding_cache_dir(subject, unit, lecture_id):
+    return get_lecture_index_dir(CACHE_PATH, subject, unit, lecture_id)
+
+def encode_texts(texts: list, batch_size: int = EMBEDDING_BATCH_SIZE, workers: int = EMBEDDING_WORKERS) -> np.ndarray:
+    """
+    Encodes chunk texts with the shared embedding model. Texts are encoded longest first so each batch holds
+    chunks of similar length and little padding, and large corpora are spread over a pool of worker processes
+    when more than one worker is configured.
 
-if torch.cuda.is_available():
-    device = torch.device("cuda")
-    print("Using CUDA (GPU)")
-elif torch.backends.mps.is_available():
-    device = torch.device("mps")
-    print("Using MPS (Apple Silicon GPU)")
-else:
-    device = torch.device("cpu")
-    print("Using CPU")
-
-def get_embedding_cache_file(lecture_id, PROJECT_ROOT):
-    return os.path.join(PROJECT_ROOT, f"Cache/{lecture_id}_embedding_cache.pkl")
-
-def generate_and_save_embeddings(subject, unit, lecture_id, document_urls, PROJECT_ROOT):
-    
-    lecture_dir = os.path.join(PROJECT_ROOT, "Docs", subject, unit, lecture_id)
-    os.makedirs(lecture_dir, exist_ok=True)  
-    cache_directory = os.path.join(PROJECT_ROOT, "Cache")
-    os.makedirs(cache_directory, exist_ok=True)  
-    
-    embedding_cache_file = os.path.join(cache_directory, f"{lecture_id}_embedding_cache.pkl")
-    logging.info(f"Checking for cached embeddings at: {embedding_cache_file}")
-    
-    if os.path.exists(embedding_cache_file):
-        logging.info("Embeddings cache already exists. No need to regenerate.")
-        with open(embedding_cache_file, 'rb') as f:
-            embeddings, index, cached_documents = pickle.load(f)
-        return embeddings, index, cached_documents
-
-    logging.info("No cache file found. Generating embeddings...")
+    Args:
+        texts (list): The chunk texts.
+        batch_size (int): Chunks per model forward pass.
+        workers (int): Encoding processes to use for corpora of at least EMBEDDING_POOL_MIN_TEXTS chunks.
+
+    Returns:
+        np.ndarray: A float32 matrix with one row per text, in the order of the texts.
+    """
     start_time = time.time()
-    
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+
+    embedding_model = get_embedding_model()
+    # ONNX Runtime already spreads one batch over all cores, so only the torch backend fans out to processes.
+    if workers > 1 and len(texts) >= EMBEDDING_POOL_MIN_TEXTS and EMBEDDING_BACKEND == "torch":
+        sorted_embeddings = embedding_model.encode_multi_process(sorted_texts, get_embedding_pool(workers=workers), batch_size=batch_size)
+    else:
+        workers = 1
+        sorted_embeddings = embedding_model.encode(sorted_texts, batch_size=batch_size, convert_to_tensor=False)
+
+    embeddings = np.empty((len(texts), sorted_embeddings.shape[1]), dtype=np.float32)
+    embeddings[order] = sorted_embeddings
+
+    elapsed = time.time() - start_time
+    logging.info(f"Encoded {len(texts)} chunks in {elapsed:.2f} seconds ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec, "
+                 f"batch size {batch_size}, {workers} worker{'s' if workers > 1 else ''})")
+    return embeddings
+
+def document_set_digest(document_urls: list) -> str:
+    """
+    Fingerprints the set of document URLs of a lecture, so a finished build can be matched to a request.
+    """
+    urls = sorted(get_document_url(doc) or "" for doc in document_urls)
+    return hashlib.sha256("\n".join(urls).encode("utf-8")).hexdigest()
+
+def reuse_concurrent_build(index_dir: str, document_set: str, since: float):
+    """
+    Returns the lecture index written by a build that finished after `since` for the same document set, or None.
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path) or os.path.getmtime(manifest_path) < since:
+        return None
+    if read_manifest(index_dir).get("document_set") != document_set:
+        return None
+    return open_lecture_index(index_dir)
+
+def plan_lecture_update(cache_directory, subject, unit, lecture_id, lecture_dir):
+    """
+    Compares the documents in the lecture directory against the file hashes recorded in the lecture index.
+
+    Returns:
+        tuple: The previous lecture index (or None), the current {file name: sha256} map,
+               the changed or new file names, and the removed file names.
+    """
+    file_hashes = {file.name: hash_file_cached(file) for file in list_document_files(lecture_dir)}
+
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
+    previous_index = None
+    if lecture_index_exists(index_dir) or os.path.exists(get_legacy_cache_file(cache_directory, lecture_id)):
+        previous_index = load_lecture_index(cache_directory, subject, unit, lecture_id)
+
+    previous_hashes = {}
+    if previous_index is not None:
+        previous_hashes = {name: entry["sha256"] for name, entry in previous_index.manifest.get("documents", {}).items()}
+
+    changed = sorted(name for name, digest in file_hashes.items() if previous_hashes.get(name) != digest)
+    removed = sorted(name for name in previous_hashes if name not in file_hashes)
+    return previous_index, file_hashes, changed, removed
+
+def update_lecture_index(index_dir, previous_index, file_hashes, changed, new_documents, new_embeddings, **manifest_fields):
+    """
+    Writes a new lecture index that keeps the chunks and vectors of unchanged files from the previous index
+    and adds the freshly embedded chunks of changed or new files.
+
+    Returns:
+        tuple: embeddings, index (FAISS index), and documents of the new lecture index.
+    """
+    kept_rows = []
+    if previous_index is not None:
+        unchanged = set(file_hashes) - set(changed)
+        # Indexes migrated from the pickle cache carry no file hashes, so none of their chunks count as unchanged.
+        if previous_index.manifest.get("documents"):
+            kept_rows = [i for i in range(len(previous_index.documents))
+                         if os.path.basename(previous_index.documents.metadata(i).get("source", "")) in unchanged]
+
+    if kept_rows:
+        kept_documents = [previous_index.documents[i] for i in kept_rows]
+        if isinstance(previous_index.embeddings, IndexVectors):
+            # A compressed index only holds lossy codes. Quantizing its decoded vectors again would compound the error
+            # with every update and make them the ground truth of the recall measurement, so the kept chunks are
+            # embedded again, which mostly reads their exact vectors from the blob store's embedding cache.
+            kept_embeddings = encode_documents(kept_documents)
+        else:
+            kept_embeddings = np.asarray(previous_index.embeddings[kept_rows], dtype=np.float32)
+        documents = kept_documents + list(new_documents)
+        embeddings = np.vstack([kept_embeddings, new_embeddings]) if len(new_documents) else kept_embeddings
+    else:
+        documents = list(new_documents)
+        embeddings = new_embeddings
+
+    if not documents:
+        raise ValueError("No document chunks could be loaded for the lecture.")
+
+    chunk_counts = {}
+    for doc in documents:
+        name = os.path.basename(doc.metadata.get("source", ""))
+        chunk_counts[name] = chunk_counts.get(name, 0) + 1
+
+    index = build_faiss_index(embeddings)
+    write_lecture_index(index_dir, embeddings, index, documents,
+                        documents={name: {"sha256": digest, "chunks": chunk_counts.get(name, 0)} for name, digest in file_hashes.items()},
+                        **manifest_fields)
+    logging.info(f"Lecture index updated: {len(kept_rows)} chunks reused, {len(new_documents)} chunks embedded.")
+    return embeddings, index, documents
+
+def fetch_lecture_documents(cache_directory, subject, unit, lecture_id, lecture_dir, document_urls, replace=False):
+    """
+    Download stage of a lecture build: fetches the lecture's documents and plans the index update.
+
+    Args:
+        replace (bool): Also delete local files that are not among document_urls. Off by default: the lecture
+                        directory is shared with the quiz, MCQ and assignment endpoints, which keep it in line with
+                        the lecture's Firestore document list, so a request listing only some of the documents must
+                        not delete the others.
+
+    Returns:
+        tuple: The same as plan_lecture_update.
+    """
     download_files(document_urls, lecture_dir)
-    documents = load_documents(lecture_dir)
-    
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
-    document_texts = [doc.page_content for doc in documents]
+    if replace:
+        remove_stale_documents(lecture_dir, document_urls)
+    return plan_lecture_update(cache_directory, subject, unit, lecture_id, lecture_dir)
+
+def parse_lecture_documents(lecture_dir, changed, file_hashes):
+    """
+    Parse stage of a lecture build: loads the chunks of the new or changed files of a lecture from the chunk cache,
+    parsing the files not cached yet, so a document already parsed for another lecture or endpoint is not parsed
+    again. Every chunk records the SHA-256 of its file, which the encode stage uses to reuse cached embeddings.
+
+    Returns:
+        tuple: The chunks, and the names of files that failed to parse. Those are left out of the lecture index
+               until they parse, so the next build tries them again.
+    """
+    changed = set(changed)
+    return load_cached_chunks([file for file in list_document_files(lecture_dir) if file.name in changed], file_hashes)
+
+def encode_documents(documents: list) -> np.ndarray:
+    """
+    Encode stage of a lecture build: embeds chunks, reusing the embeddings cached in the blob store for the file
+    content they came from. Files not cached yet are encoded together in one encode_texts call, once per distinct
+    content even if several lectures of a bulk build share them, and then cached.
+
+    Returns:
+        np.ndarray: A float32 matrix with one row per chunk.
+    """
+    files = {}
+    for i, doc in enumerate(documents):
+        files.setdefault((doc.metadata.get("sha256"), doc.metadata.get("source")), []).append(i)
+
+    vectors = {}
+    to_encode = {}
+    for (digest, source), rows in files.items():
+        if digest is None:
+            to_encode[(digest, source)] = rows
+        elif digest not in vectors and digest not in to_encode:
+            cached = blob_store.get_embeddings(digest, DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKEND, SPLITTER_KEY)
+            if cached is not None:
+                vectors[digest] = cached
+            else:
+                to_encode[digest] = rows
+
+    if to_encode:
+        texts = [documents[i].page_content for rows in to_encode.values() for i in rows]
+        encoded = encode_texts(texts)
+        offset = 0
+        for key, rows in to_encode.items():
+            vectors[key] = encoded[offset:offset + len(rows)]
+            offset += len(rows)
+            if isinstance(key, str):
+                blob_store.put_embeddings(key, DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKEND, SPLITTER_KEY, vectors[key])
 
-    embeddings = embedding_model.encode(document_texts, convert_to_tensor=False)
-    embedding_dim = len(embeddings[0])
-    index = faiss.IndexFlatL2(embedding_dim)
-    index.add(embeddings)
+    embeddings = np.empty((len(documents), next(iter(vectors.values())).shape[1]), dtype=np.float32)
+    for (digest, source), rows in files.items():
+        embeddings[rows] = vectors[digest if digest is not None else (digest, source)]
+    reused = len(documents) - sum(len(rows) for rows in to_encode.values())
+    if reused:
+        logging.info(f"Reused cached embeddings for {reused} of {len(documents)} chunks.")
+    return embeddings
 
+def write_lecture_update(index_dir, previous_index, file_hashes, changed, new_documents, new_embeddings, subject, unit, lecture_id, document_set):
+    """
+    Index stage of a lecture build: writes the updated lecture index with the manifest fields every build records.
+
+    Returns:
+        tuple: embeddings, index (FAISS index), and documents of the new lecture index.
+    """
     try:
-        with open(embedding_cache_file, 'wb') as f:
-            pickle.dump((embeddings, index, documents), f)
-        logging.info(f"Embeddings, index, and documents cached successfully at {embedding_cache_file}.")
+        embeddings, index, documents = update_lecture_index(
+            index_dir, previous_index, file_hashes, changed, new_documents, new_embeddings,
+            subject=subject, unit=unit, lecture_id=lecture_id, model=DEFAULT_EMBEDDING_MODEL, embedding_backend=EMBEDDING_BACKEND,
+            document_set=document_set,
+        )
+        logging.info(f"Embeddings, index, and documents cached successfully at {index_dir}.")
     except Exception as e:
         logging.error(f"Error saving embeddings to cache: {e}")
         raise
+    return embeddings, index, documents
+
+def generate_and_save_embeddings(subject, unit, lecture_id, document_urls, progress=None, replace=False):
+    """
+    Downloads the documents of a lecture and brings its lecture index up to date, embedding only new or changed files.
+
+    Args:
+        progress (callable): Optional progress(stage, fraction) callback, called as the build moves through its stages.
+        replace (bool): Delete local files of the lecture that are not among document_urls (see fetch_lecture_documents).
+
+    Returns:
+        tuple: embeddings, index (FAISS index), and documents of the lecture index.
+    """
+    report = progress or (lambda stage, fraction: None)
+
+    lecture_dir = get_lecture_dir(subject, unit, lecture_id)
+    os.makedirs(lecture_dir, exist_ok=True)
+    cache_directory = CACHE_PATH
+    os.makedirs(cache_directory, exist_ok=True)
+
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
+    logging.info(f"Checking for cached embeddings at: {index_dir}")
+
+    start_time = time.time()
+    document_set = document_set_digest(document_urls)
+
+    # One build per lecture at a time, across threads and worker processes. A caller that had to wait reuses the
+    # build it waited for when that build covered the same documents.
+    report("waiting", 0.0)
+    with build_lock(get_lecture_lock_file(index_dir)) as waited:
+        if waited:
+            lecture_index = reuse_concurrent_build(index_dir, document_set, since=start_time)
+            if lecture_index is not None:
+                logging.info(f"Reusing lecture index {lecture_index.build_id} built by a concurrent request.")
+                return lecture_index.embeddings, lecture_index.index, lecture_index.documents
+
+        report("downloading", 0.05)
+        previous_index, file_hashes, changed, removed = fetch_lecture_documents(cache_directory, subject, unit, lecture_id, lecture_dir, document_urls, replace)
+
+        if previous_index is not None and not changed and not removed:
+            logging.info("Embeddings cache is up to date with the lecture documents. No need to regenerate.")
+            return previous_index.embeddings, previous_index.index, previous_index.documents
+
+        logging.info(f"Generating embeddings for {len(changed)} new or changed files; dropping {len(removed)} removed files.")
+
+        report("parsing", 0.3)
+        new_documents, failed = parse_lecture_documents(lecture_dir, changed, file_hashes)
+        for name in failed:
+            file_hashes.pop(name)
+        report("encoding", 0.45)
+        new_embeddings = encode_documents(new_documents) if new_documents else None
+
+        report("indexing", 0.85)
+        embeddings, index, documents = write_lecture_update(index_dir, previous_index, file_hashes, changed, new_documents, new_embeddings,
+                                                            subject, unit, lecture_id, document_set)
 
     end_time = time.time()
     logging.info(f"Embeddings generated and saved in {end_time - start_time:.2f} seconds")
 
-    return embeddings, index, documents
\ No newline at end of file
+    return embeddings, index, documents
+
+def generate_embeddings_bulk(lectures, progress=None):
+    """
+    Brings the lecture indexes of many lectures up to date in one pass. Documents of all lectures are downloaded
+    concurrently and parsed in parallel, the new chunks of every lecture are encoded together in shared
+    length-sorted batches, and then each lecture index is written. A lecture whose documents fail to download or
+    parse is reported as failed without stopping the others.
+
+    Args:
+        lectures (list): Dictionaries with 'subject', 'unit', 'lecture', 'document_urls' and optionally 'replace'.
+        progress (callable): Optional progress(stage, fraction) callback, called as the build moves through its stages.
+
+    Returns:
+        list: One result per lecture, in input order, with its 'status' ('updated', 'up_to_date' or 'failed'),
+              chunk counts and error.
+
+    Raises:
+        ValueError: If a lecture is listed more than once.
+    """
+    report = progress or (lambda stage, fraction: None)
+    start_time = time.time()
+    cache_directory = CACHE_PATH
+    os.makedirs(cache_directory, exist_ok=True)
+
+    builds = []
+    for lecture in lectures:
+        subject, unit, lecture_id = lecture["subject"], lecture["unit"], lecture["lecture"]
+        builds.append({
+            "subject": subject, "unit": unit, "lecture_id": lecture_id,
+            "document_urls": lecture["document_urls"],
+            "replace": bool(lecture.get("replace", False)),
+            "document_set": document_set_digest(lecture["document_urls"]),
+            "lecture_dir": get_lecture_dir(subject, unit, lecture_id),
+            "index_dir": get_lecture_index_dir(cache_directory, subject, unit, lecture_id),
+            "result": {"subject": subject, "unit": unit, "lecture": lecture_id, "status": None, "chunks": 0, "embedded_chunks": 0, "error": None},
+        })
+    if len({build["index_dir"] for build in builds}) < len(builds):
+        raise ValueError("Each lecture may only be listed once.")
+
+    def fail(build, stage, e):
+        logging.error(f"Bulk build of lecture {build['lecture_id']} failed while {stage}: {e}")
+        build["result"].update(status="failed", error=str(e))
+
+    report("waiting", 0.0)
+    with ExitStack() as locks:
+        # Locks are taken in index directory order, so two bulk builds over overlapping lectures cannot deadlock.
+        for build in sorted(builds, key=lambda build: build["index_dir"]):
+            if locks.enter_context(build_lock(get_lecture_lock_file(build["index_dir"]))):
+                lecture_index = reuse_concurrent_build(build["index_dir"], build["document_set"], since=start_time)
+                if lecture_index is not None:
+                    build["result"].update(status="up_to_date", chunks=len(lecture_index))
+
+        pending = [build for build in builds if build["result"]["status"] is None]
+
+        report("downloading", 0.05)
+        download_start = time.time()
+        for build in pending:
+            os.makedirs(build["lecture_dir"], exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(1, min(BULK_DOWNLOAD_WORKERS, len(pending)))) as executor:
+            futures = [executor.submit(fetch_lecture_documents, cache_directory, build["subject"], build["unit"], build["lecture_id"],
+                                       build["lecture_dir"], build["document_urls"], build["replace"]) for build in pending]
+            for build, future in zip(pending, futures):
+                try:
+                    build["previous_index"], build["file_hashes"], build["changed"], removed = future.result()
+                except Exception as e:
+                    fail(build, "downloading", e)
+                    continue
+                if build["previous_index"] is not None and not build["changed"] and not removed:
+                    build["result"].update(status="up_to_date", chunks=len(build["previous_index"]))
+        logging.info(f"Bulk build downloaded and planned {len(pending)} lectures in {time.time() - download_start:.2f} seconds")
+
+        pending = [build for build in pending if build["result"]["status"] is None]
+
+        report("parsing", 0.3)
+        parse_start = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, min(BULK_PARSE_WORKERS, len(pending)))) as executor:
+            futures = [executor.submit(parse_lecture_documents, build["lecture_dir"], build["changed"], build["file_hashes"]) for build in pending]
+            for build, future in zip(pending, futures):
+                try:
+                    build["new_documents"], failed = future.result()
+                    for name in failed:
+                        build["file_hashes"].pop(name)
+                except Exception as e:
+                    fail(build, "parsing", e)
+        logging.info(f"Bulk build parsed {len(pending)} lectures in {time.time() - parse_start:.2f} seconds")
+
+        pending = [build for build in pending if build["result"]["status"] is None]
+
+        # One encode call for every new chunk of every lecture: batches are filled across lectures instead of
+        # ending with a short batch per lecture, and a document shared by several lectures is encoded once.
+        report("encoding", 0.45)
+        new_documents = [doc for build in pending for doc in build["new_documents"]]
+        all_embeddings = encode_documents(new_documents) if new_documents else None
+
+        report("indexing", 0.85)
+        offset = 0
+        for build in pending:
+            count = len(build["new_documents"])
+            new_embeddings = all_embeddings[offset:offset + count] if count else None
+            offset += count
+            try:
+                _, _, documents = write_lecture_update(build["index_dir"], build["previous_index"], build["file_hashes"], build["changed"],
+                                                       build["new_documents"], new_embeddings, build["subject"], build["unit"],
+                                                       build["lecture_id"], build["document_set"])
+                build["result"].update(status="updated", chunks=len(documents), embedded_chunks=count)
+            except Exception as e:
+                fail(build, "indexing", e)
+
+    results = [build["result"] for build in builds]
+    logging.info(f"Bulk build of {len(builds)} lectures finished in {time.time() - start_time:.2f} seconds: "
+                 f"{sum(r['status'] == 'updated' for r in results)} updated, {sum(r['status'] == 'up_to_date' for r in results)} up to date, "
+                 f"{sum(r['status'] == 'failed' for r in results)} failed, {len(new_documents)} chunks embedded.")
+    return results
@@ -0,0 +1,297 @@
+#utils/extractors.py
+import os
+import re
+import zipfile
+import hashlib
+import logging
+from xml.etree import ElementTree
+
+import PyPDF2
+from pypdf import PdfReader
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+from langchain.schema import Document
+from langchain_community.document_loaders import TextLoader
+
+try:
+    # python-magic needs the libmagic system library; without it formats are told apart by file extension only.
+    import magic
+except ImportError:
+    magic = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+try:
+    import docx
+    from docx.table import Table as DocxTable
+except ImportError:
+    docx = None
+
+# Supported formats, in the order their files are loaded, with the MIME types libmagic reports for them and their
+# file extensions.
+FORMATS = {
+    "text": (("text/plain",), (".txt",)),
+    "markdown": (("text/markdown", "text/x-markdown"), (".md", ".markdown")),
+    "pdf": (("application/pdf",), (".pdf",)),
+    "pptx": (("application/vnd.openxmlformats-officedocument.presentationml.presentation",), (".pptx",)),
+    "docx": (("application/vnd.openxmlformats-officedocument.wordprocessingml.document",), (".docx",)),
+}
+# Older libmagic versions report Office files as plain ZIP archives.
+CONTAINER_MIME_TYPES = ("application/zip", "application/octet-stream")
+DEFAULT_EXTRACTORS = {"text": "text", "markdown": "markdown", "pdf": "pypdf", "pptx": "python-pptx", "docx": "docx-xml"}
+FORMAT_MEMO_SIZE = 4096
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_extractors = {fmt: {} for fmt in FORMATS}
+_format_memo = {}
+
+def register_extractor(fmt: str, name: str):
+    """
+    Registers a function as an extractor backend for a format. Extractors are called as fn(path, start, stop) and
+    return a list of Documents with 'source' metadata; start and stop select a page range and only apply to PDFs.
+    """
+    def decorator(fn):
+        _extractors[fmt][name] = fn
+        return fn
+    return decorator
+
+def list_extractors(fmt: str) -> list:
+    return sorted(_extractors[fmt])
+
+def sniff_mime_type(file_path: str):
+    """
+    Returns the MIME type libmagic detects from a file's content, or None if libmagic is not available.
+    """
+    if magic is None:
+        return None
+    try:
+        return magic.from_file(str(file_path), mime=True)
+    except Exception as e:
+        logging.warning(f"Could not detect the type of {os.path.basename(str(file_path))}: {e}")
+        return None
+
+def _detect_format(file_path: str):
+    extension = os.path.splitext(str(file_path))[1].lower()
+    by_extension = next((fmt for fmt, (_, extensions) in FORMATS.items() if extension in extensions), None)
+    mime_type = sniff_mime_type(file_path)
+    if mime_type is None:
+        return by_extension
+    by_content = next((fmt for fmt, (mime_types, _) in FORMATS.items() if mime_type in mime_types), None)
+    if by_content == "text" and by_extension == "markdown":
+        # libmagic has no rule for Markdown and reports it as plain text.
+        return by_extension
+    if by_content is not None:
+        return by_content
+    if mime_type in CONTAINER_MIME_TYPES and by_extension in ("pptx", "docx"):
+        return by_extension
+    if mime_type.startswith("text/") and by_extension in ("text", "markdown"):
+        return by_extension
+    # Content that matches no supported format, such as an HTML error page saved as .pdf.
+    return None
+
+def detect_format(file_path: str):
+    """
+    Returns the format of a document ('text', 'markdown', 'pdf', 'pptx' or 'docx') from the MIME type sniffed from
+    its content, using the extension only where the content is ambiguous, or None if it is not a supported document.
+    Results are remembered per process for as long as the file's inode, size and modification time are unchanged.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(str(file_path)), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if key not in _format_memo:
+        if len(_format_memo) >= FORMAT_MEMO_SIZE:
+            _format_memo.clear()
+        _format_memo[key] = _detect_format(file_path)
+    return _format_memo[key]
+
+def count_pages(file_path: str, fmt: str) -> int:
+    """
+    Returns the number of pages of a PDF; other formats are extracted as a whole and count as one page.
+    """
+    return len(PdfReader(str(file_path)).pages) if fmt == "pdf" else 1
+
+def get_extractor(fmt: str, name: str = None):
+    """
+    Returns the extractor backend called name for a format, by default the one configured with EXTRACTOR_<FORMAT>.
+
+    Raises:
+        ValueError: If no such backend is registered.
+    """
+    name = name or EXTRACTORS[fmt]
+    try:
+        return _extractors[fmt][name]
+    except KeyError:
+        raise ValueError(f"Unknown {fmt} extractor '{name}'; available: {', '.join(list_extractors(fmt))}")
+
+def extract_file(file_path: str, fmt: str = None, start: int = None, stop: int = None, extractor: str = None) -> list:
+    """
+    Extracts the text of a document with the configured (or the given) extractor backend for its format.
+
+    Args:
+        file_path (str): The document.
+        fmt (str): Its format, if already detected.
+        start (int): First page to extract (PDF only).
+        stop (int): Page after the last one to extract (PDF only).
+        extractor (str): Backend to use instead of the configured one.
+
+    Returns:
+        list: Documents with 'source' metadata, one per page for PDFs and one per file for other formats.
+
+    Raises:
+        ValueError: If the file is not a supported document.
+    """
+    fmt = fmt or detect_format(file_path)
+    if fmt is None:
+        raise ValueError(f"Unsupported document type: {os.path.basename(str(file_path))} ({sniff_mime_type(file_path)})")
+    return get_extractor(fmt, extractor)(str(file_path), start, stop)
+
+def _page_range(page_count: int, start: int, stop: int) -> range:
+    return range(start or 0, page_count if stop is None else min(stop, page_count))
+
+def _read_text(file_path: str) -> str:
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+@register_extractor("pdf", "pypdf")
+def load_pdf_pages(pdf_file, start: int = None, stop: int = None) -> list:
+    """
+    Load pages [start, stop) of a PDF, one document per page, with the same metadata as PyPDFLoader.
+    """
+    reader = PdfReader(str(pdf_file))
+    return [Document(page_content=reader.pages[i].extract_text() or "", metadata={"source": str(pdf_file), "page": i})
+            for i in _page_range(len(reader.pages), start, stop)]
+
+@register_extractor("pdf", "pypdf2")
+def load_pdf_pages_pypdf2(pdf_file, start: int = None, stop: int = None) -> list:
+    reader = PyPDF2.PdfReader(str(pdf_file))
+    return [Document(page_content=reader.pages[i].extract_text() or "", metadata={"source": str(pdf_file), "page": i})
+            for i in _page_range(len(reader.pages), start, stop)]
+
+@register_extractor("pdf", "pymupdf")
+def load_pdf_pages_pymupdf(pdf_file, start: int = None, stop: int = None) -> list:
+    if pymupdf is None:
+        raise ImportError("The pymupdf extractor needs the pymupdf package.")
+    with pymupdf.open(str(pdf_file)) as pdf:
+        return [Document(page_content=pdf[i].get_text(), metadata={"source": str(pdf_file), "page": i})
+                for i in _page_range(pdf.page_count, start, stop)]
+
+def _shape_texts(shapes) -> list:
+    # Walks into grouped shapes, and reads tables row by row with cells separated by ' | '.
+    texts = []
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            texts.extend(_shape_texts(shape.shapes))
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            for row in shape.table.rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    texts.append(" | ".join(cells))
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame and shape.text_frame.text.strip():
+            texts.append(shape.text_frame.text)
+    return texts
+
+@register_extractor("pptx", "python-pptx")
+def extract_pptx(pptx_file, start: int = None, stop: int = None) -> list:
+    return [load_pptx_file(pptx_file)]
+
+def load_pptx_file(pptx_file) -> Document:
+    """
+    Load a single PPTX file into one document holding the text of all its slides, including tables and the
+    contents of grouped shapes.
+    """
+    logging.info(f"Processing PPTX file: {pptx_file}")
+    prs = Presentation(pptx_file)
+    text_runs = []
+    for slide in prs.slides:
+        text_runs.extend(_shape_texts(slide.shapes))
+    return Document(page_content="\n".join(text_runs), metadata={"source": str(pptx_file)})
+
+@register_extractor("pptx", "python-pptx-shapes")
+def extract_pptx_shapes(pptx_file, start: int = None, stop: int = None) -> list:
+    # Text of top-level shapes only, as extracted before tables and groups were read.
+    prs = Presentation(pptx_file)
+    text_runs = [shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text")]
+    return [Document(page_content="\n".join(text_runs), metadata={"source": str(pptx_file)})]
+
+def _docx_paragraph_text(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == f"{WORD_NAMESPACE}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{WORD_NAMESPACE}tab":
+            parts.append("\t")
+        elif node.tag in (f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+@register_extractor("docx", "docx-xml")
+def extract_docx_xml(docx_file, start: int = None, stop: int = None) -> list:
+    # Reads paragraphs and tables from word/document.xml in body order, without python-docx.
+    with zipfile.ZipFile(docx_file) as archive:
+        body = ElementTree.fromstring(archive.read("word/document.xml")).find(f"{WORD_NAMESPACE}body")
+    blocks = []
+    for element in body if body is not None else []:
+        if element.tag == f"{WORD_NAMESPACE}p":
+            blocks.append(_docx_paragraph_text(element))
+        elif element.tag == f"{WORD_NAMESPACE}tbl":
+            for row in element.iter(f"{WORD_NAMESPACE}tr"):
+                cells = [" ".join(_docx_paragraph_text(p) for p in cell.iter(f"{WORD_NAMESPACE}p")).strip()
+                         for cell in row.iter(f"{WORD_NAMESPACE}tc")]
+                if any(cells):
+                    blocks.append(" | ".join(cells))
+    return [Document(page_content="\n".join(block for block in blocks if block.strip()), metadata={"source": str(docx_file)})]
+
+@register_extractor("docx", "python-docx")
+def extract_docx(docx_file, start: int = None, stop: int = None) -> list:
+    if docx is None:
+        raise ImportError("The python-docx extractor needs the python-docx package.")
+    blocks = []
+    for block in docx.Document(docx_file).iter_inner_content():
+        if isinstance(block, DocxTable):
+            for row in block.rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    blocks.append(" | ".join(cells))
+        elif block.text.strip():
+            blocks.append(block.text)
+    return [Document(page_content="\n".join(blocks), metadata={"source": str(docx_file)})]
+
+@register_extractor("text", "text")
+@register_extractor("markdown", "markdown")
+def extract_text(text_file, start: int = None, stop: int = None) -> list:
+    # Undecodable bytes are replaced rather than failing the whole file.
+    return [Document(page_content=_read_text(text_file), metadata={"source": str(text_file)})]
+
+@register_extractor("text", "langchain")
+def extract_text_langchain(text_file, start: int = None, stop: int = None) -> list:
+    return TextLoader(text_file).load()
+
+MARKDOWN_PATTERNS = (
+    (re.compile(r"^```.*$|^~~~.*$", re.MULTILINE), ""),              # code fence lines
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),                  # images: keep the alt text
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),                   # links: keep the link text
+    (re.compile(r"<[^>\n]+>"), ""),                                  # inline HTML
+    (re.compile(r"^\s{0,3}(#{1,6}|>+)\s*", re.MULTILINE), ""),       # headings and quotes
+    (re.compile(r"^\s*([-*_]\s*){3,}$", re.MULTILINE), ""),          # horizontal rules
+    (re.compile(r"^\s*\|?(\s*:?-+:?\s*\|)+\s*:?-*:?\s*$", re.MULTILINE), ""),  # table header separators
+    (re.compile(r"(\*\*|\*|`)(?=\S)(.+?)(?<=\S)\1"), r"\2"),           # emphasis and inline code
+    (re.compile(r"(?<!\w)(__|_)(?=\S)(.+?)(?<=\S)\1(?!\w)"), r"\2"),    # underscore emphasis, not snake_case
+)
+
+@register_extractor("markdown", "markdown-plain")
+def extract_markdown_plain(markdown_file, start: int = None, stop: int = None) -> list:
+    # Strips Markdown syntax, keeping the text of headings, links, lists and tables.
+    text = _read_text(markdown_file)
+    for pattern, replacement in MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return [Document(page_content=text, metadata={"source": str(markdown_file)})]
+
+# The extractor backend of each format, e.g. EXTRACTOR_PDF=pymupdf. An unknown name fails at import.
+EXTRACTORS = {fmt: os.getenv(f"EXTRACTOR_{fmt.upper()}", DEFAULT_EXTRACTORS[fmt]) for fmt in FORMATS}
+EXTRACTORS = {fmt: name for fmt, name in EXTRACTORS.items() if get_extractor(fmt, name)}
+
+# Identifies the configured backends in the chunk cache key, since each extracts different text.
+EXTRACTOR_KEY = hashlib.sha256(",".join(f"{fmt}={name}" for fmt, name in EXTRACTORS.items()).encode("utf-8")).hexdigest()[:8]
@@ -0,0 +1,170 @@
+#utils/faiss_index.py
+import os
+import math
+import logging
+
+import faiss
+import numpy as np
+
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+FAISS_FLAT_MAX_VECTORS = int(os.getenv("FAISS_FLAT_MAX_VECTORS", "20000"))
+FAISS_HNSW_MAX_VECTORS = int(os.getenv("FAISS_HNSW_MAX_VECTORS", "200000"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+EMBEDDING_COMPRESSION = os.getenv("EMBEDDING_COMPRESSION", "none")
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+EMBEDDING_MIN_RECALL = float(os.getenv("EMBEDDING_MIN_RECALL", "0.9"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+COMPRESSION_MODES = ("none", "fp16", "sq8", "pq")
+PQ_NBITS = 8
+# PQ codebooks have 2^nbits centroids per sub-vector; below a few training points per centroid they are mostly noise.
+PQ_MIN_VECTORS = 4 * 2 ** PQ_NBITS
+RECALL_SAMPLE_QUERIES = 200
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Picks the index type for a corpus size: exact flat search for small corpora (a slide deck or a few),
+    HNSW for medium corpora and IVF for very large ones, where HNSW's graph gets expensive to build and hold.
+    """
+    if num_vectors <= FAISS_FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= FAISS_HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+def ivf_nlist(num_vectors: int) -> int:
+    # Rule of thumb of ~4 * sqrt(n) lists, capped so every list still gets enough training points.
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def choose_compression(compression: str, num_vectors: int, dim: int) -> str:
+    """
+    Validates a compression mode, falling back from PQ to SQ8 when the corpus is too small to train PQ codebooks
+    or the dimension does not split into FAISS_PQ_M sub-vectors.
+    """
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f"Unknown embedding compression: {compression}")
+    if compression == "pq" and (num_vectors < PQ_MIN_VECTORS or dim % FAISS_PQ_M):
+        logging.info(f"PQ needs at least {PQ_MIN_VECTORS} vectors and a dimension divisible by {FAISS_PQ_M}; using sq8 for {num_vectors}x{dim}.")
+        return "sq8"
+    return compression
+
+def _new_index(index_type: str, compression: str, num_vectors: int, dim: int):
+    sq_type = faiss.ScalarQuantizer.QT_fp16 if compression == "fp16" else faiss.ScalarQuantizer.QT_8bit
+    if index_type == "ivf":
+        nlist = ivf_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if compression == "none":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        elif compression == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, FAISS_PQ_M, PQ_NBITS)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq_type, faiss.METRIC_L2)
+        index.nprobe = min(FAISS_NPROBE, nlist)
+    elif index_type == "hnsw":
+        if compression == "none":
+            index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        elif compression == "pq":
+            index = faiss.IndexHNSWPQ(dim, FAISS_PQ_M, FAISS_HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dim, sq_type, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+    else:
+        if compression == "none":
+            index = faiss.IndexFlatL2(dim)
+        elif compression == "pq":
+            index = faiss.IndexPQ(dim, FAISS_PQ_M, PQ_NBITS)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, sq_type, faiss.METRIC_L2)
+    return index
+
+def build_faiss_index(embeddings: np.ndarray, index_type: str = None, compression: str = None):
+    """
+    Builds a FAISS index over the embeddings, choosing Flat, IVF or HNSW from the vector count unless an index type is given.
+    With compression the index stores float16, 8-bit scalar quantized or product quantized codes instead of float32 vectors.
+
+    Args:
+        embeddings (np.ndarray): A float32 matrix with one row per chunk.
+        index_type (str): 'flat', 'ivf', 'hnsw' or 'auto'. Defaults to FAISS_INDEX_TYPE.
+        compression (str): 'none', 'fp16', 'sq8' or 'pq'. Defaults to EMBEDDING_COMPRESSION.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    num_vectors, dim = embeddings.shape
+    index_type = index_type or FAISS_INDEX_TYPE
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    compression = choose_compression(compression or EMBEDDING_COMPRESSION, num_vectors, dim)
+
+    index = _new_index(index_type, compression, num_vectors, dim)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    logging.info(f"Built {index_type} FAISS index ({compression}) over {num_vectors} vectors ({describe_faiss_index(index)['index_params']})")
+    return index
+
+def index_compression(index) -> str:
+    """
+    Returns the compression mode of an index, looking through HNSW to the storage that holds the vectors.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "none"
+
+def measure_recall(index, embeddings: np.ndarray, k: int = 5, num_queries: int = RECALL_SAMPLE_QUERIES) -> float:
+    """
+    Measures recall@k of an index against exact search over the original float32 embeddings.
+    Queries are midpoints of random pairs of chunks, so no query trivially finds itself.
+
+    Returns:
+        float: The fraction of the exact top-k neighbours that the index also returns.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    num_vectors, dim = embeddings.shape
+    k = min(k, num_vectors)
+    rng = np.random.default_rng(0)
+    queries = (embeddings[rng.integers(0, num_vectors, num_queries)] + embeddings[rng.integers(0, num_vectors, num_queries)]) / 2
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def describe_faiss_index(index) -> dict:
+    """
+    Returns the index type, its parameters and its compression mode, as recorded in the lecture index manifest.
+    """
+    compression = index_compression(index)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return {"index_type": "hnsw", "index_params": {"M": index.hnsw.nb_neighbors(1), "efSearch": index.hnsw.efSearch}, "compression": compression}
+    if isinstance(index, faiss.IndexIVF):
+        return {"index_type": "ivf", "index_params": {"nlist": index.nlist, "nprobe": index.nprobe}, "compression": compression}
+    return {"index_type": "flat", "index_params": {}, "compression": compression}
+
+def configure_search(index):
+    """
+    Applies the search-time tuning knobs (FAISS_NPROBE, FAISS_EF_SEARCH) to a loaded index, and returns it.
+    """
+    # The downcast view does not own the index, so it is only used to set the knobs; returning it would leave the
+    # caller with a dangling pointer once the loaded index is garbage collected.
+    downcast = faiss.downcast_index(index)
+    if isinstance(downcast, faiss.IndexHNSW):
+        downcast.hnsw.efSearch = FAISS_EF_SEARCH
+    elif isinstance(downcast, faiss.IndexIVF):
+        downcast.nprobe = min(FAISS_NPROBE, downcast.nlist)
+    return index
@@ -0,0 +1,144 @@
+#utils/federated_search.py
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from langchain.schema import Document
+
+from utils.faiss_index import build_faiss_index
+from utils.lecture_index import *
+from utils.lecture_cache import *
+from utils.build_lock import build_lock
+
+UNIT_INDEX_ID = "_unit"
+FEDERATED_SEARCH_WORKERS = int(os.getenv("FEDERATED_SEARCH_WORKERS", "8"))
+
+search_executor = ThreadPoolExecutor(max_workers=FEDERATED_SEARCH_WORKERS, thread_name_prefix="federated-search")
+
+def list_units(cache_directory: str, subject: str) -> list:
+    subject_dir = os.path.join(cache_directory, subject)
+    if not os.path.isdir(subject_dir):
+        return []
+    return sorted(name for name in os.listdir(subject_dir) if os.path.isdir(os.path.join(subject_dir, name)))
+
+def list_lectures(cache_directory: str, subject: str, unit: str) -> list:
+    """
+    Lists the lectures of a unit that have a lecture index, excluding the unit-level index itself.
+    """
+    unit_dir = os.path.join(cache_directory, subject, unit)
+    if not os.path.isdir(unit_dir):
+        return []
+    return sorted(name for name in os.listdir(unit_dir)
+                  if name != UNIT_INDEX_ID and lecture_index_exists(os.path.join(unit_dir, name)))
+
+def _current_lecture_builds(cache_directory: str, subject: str, unit: str) -> dict:
+    return {lecture_id: read_manifest(get_lecture_index_dir(cache_directory, subject, unit, lecture_id))["build_id"]
+            for lecture_id in list_lectures(cache_directory, subject, unit)}
+
+def build_unit_index(cache_directory: str, subject: str, unit: str) -> dict:
+    """
+    Builds a unit-level index that holds the chunks of every lecture in the unit, so a unit search is one index lookup.
+
+    Returns:
+        dict: The manifest of the unit-level index.
+    """
+    start_time = time.time()
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, UNIT_INDEX_ID)
+
+    with build_lock(get_lecture_lock_file(index_dir)) as waited:
+        if waited and is_unit_index_fresh(cache_directory, subject, unit):
+            logging.info(f"Unit index for {subject}/{unit} was just built by a concurrent request; reusing it.")
+            return read_manifest(index_dir)
+
+        lecture_builds = {}
+        embeddings = []
+        documents = []
+
+        for lecture_id in list_lectures(cache_directory, subject, unit):
+            lecture_index = get_cached_lecture_index(cache_directory, subject, unit, lecture_id)
+            lecture_builds[lecture_id] = lecture_index.build_id
+            embeddings.append(np.asarray(lecture_index.embeddings, dtype=np.float32))
+            for doc in lecture_index.documents:
+                documents.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "lecture_id": lecture_id}))
+
+        if not documents:
+            raise FileNotFoundError(f"No lecture indexes found for unit {unit} of subject {subject}.")
+
+        embeddings = np.vstack(embeddings)
+        manifest = write_lecture_index(index_dir, embeddings, build_faiss_index(embeddings), documents,
+                                       subject=subject, unit=unit, lecture_id=UNIT_INDEX_ID, lectures=lecture_builds)
+    logging.info(f"Unit index for {subject}/{unit} built from {len(lecture_builds)} lectures in {time.time() - start_time:.2f} seconds")
+    return manifest
+
+def is_unit_index_fresh(cache_directory: str, subject: str, unit: str) -> bool:
+    """
+    A unit index is only used while it was built from exactly the current build of every lecture in the unit.
+    """
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, UNIT_INDEX_ID)
+    if not lecture_index_exists(index_dir):
+        return False
+    if read_manifest(index_dir).get("lectures") != _current_lecture_builds(cache_directory, subject, unit):
+        logging.info(f"Unit index for {subject}/{unit} is stale; searching lecture indexes instead.")
+        return False
+    return True
+
+def _search_targets(cache_directory: str, subject: str, units: list) -> list:
+    targets = []
+    for unit in units:
+        if is_unit_index_fresh(cache_directory, subject, unit):
+            targets.append((unit, UNIT_INDEX_ID))
+        else:
+            targets.extend((unit, lecture_id) for lecture_id in list_lectures(cache_directory, subject, unit))
+    return targets
+
+def _search_target(cache_directory: str, subject: str, target: tuple, query_embedding, k: int) -> list:
+    unit, lecture_id = target
+    lecture_index = get_cached_lecture_index(cache_directory, subject, unit, lecture_id)
+    distances, indices = lecture_index.index.search(query_embedding, k)
+    hits = []
+    for distance, i in zip(distances[0], indices[0]):
+        if i == -1:
+            continue
+        doc = lecture_index.documents[i]
+        # Chunks of the unit-level index already carry the lecture they came from.
+        if lecture_id != UNIT_INDEX_ID:
+            doc.metadata["lecture_id"] = lecture_id
+        hits.append((float(distance), doc))
+    return hits
+
+def federated_search(query_embedding, cache_directory: str, subject: str, unit: str = None, k: int = 5) -> list:
+    """
+    Searches every lecture index of a unit (or of every unit of a subject when no unit is given) and merges the
+    top-k chunks by distance. Lectures are searched in parallel; a fresh unit-level index is used when one exists.
+
+    Args:
+        query_embedding (np.ndarray): The encoded query, shape (1, dim).
+        cache_directory (str): Root directory of the lecture indexes.
+        subject (str): The subject to search.
+        unit (str): The unit to search, or None to search the whole subject.
+        k (int): Number of chunks to return.
+
+    Returns:
+        list: The k closest chunk Documents, each with a 'lecture_id' metadata entry.
+
+    Raises:
+        FileNotFoundError: If there is no lecture index in the requested scope.
+    """
+    start_time = time.time()
+    query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+    units = [unit] if unit else list_units(cache_directory, subject)
+    targets = _search_targets(cache_directory, subject, units)
+
+    hits = []
+    for target_hits in search_executor.map(lambda target: _search_target(cache_directory, subject, target, query_embedding, k), targets):
+        hits.extend(target_hits)
+
+    if not hits:
+        raise FileNotFoundError(f"Embeddings not found for {'unit ' + unit if unit else 'subject ' + subject}.")
+
+    hits.sort(key=lambda hit: hit[0])
+    logging.info(f"Federated search over {len(targets)} indexes in {len(units)} units returned {len(hits)} candidates in {time.time() - start_time:.3f} seconds")
+    return [doc for _, doc in hits[:k]]
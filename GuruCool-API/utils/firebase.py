@@ -1,13 +1,14 @@
 #utils/firebase.py
 import os
 import logging
-import requests
 
 import firebase_admin
 from firebase_admin import credentials, storage as firebase_storage, firestore
 
 from dotenv import load_dotenv
 
+from utils.downloader import download_file
+
 load_dotenv()
 STORAGE_BUCKET = os.getenv("STORAGE_BUCKET")
 CREDENTIALS_PATH = os.getenv("CREDENTIALS_PATH")
@@ -23,14 +24,11 @@ storage = firebase_storage.bucket()
 def download_file_from_url(url, save_directory):
     try:
         logging.info(f"Attempting to download file from {url}")
-        response = requests.get(url)
-        response.raise_for_status()  
         file_name = os.path.basename(url.split('?')[0]) 
         logging.info(f"File name is - {file_name}")
         file_path = os.path.join(save_directory, file_name)
  
-        with open(file_path, "wb") as file:
-            file.write(response.content)
+        download_file(url, file_path, overwrite=True)
         
         logging.info(f"File downloaded successfully and saved to {file_path}")
         return file_path
@@ -62,7 +60,8 @@ def fetch_document_urls_from_firestore(subject, unit, lecture_id):
         lecture_id (str): The ID of the lecture.
         
     Returns:
-        list: A list of document URLs (if found).
+        list: A list of document URLs, empty if the lecture has none, or None if the lecture is not in Firestore or
+            Firestore could not be read.
     """
     try:
         doc_ref = db.collection('subjects').document(subject)\
@@ -77,7 +76,7 @@ def fetch_document_urls_from_firestore(subject, unit, lecture_id):
             return document_urls
         else:
             logging.error(f"No Firestore document found for Lecture ID: {lecture_id}")
-            return []
+            return None
     except Exception as e:
         logging.error(f"Error fetching document URLs from Firestore: {e}")
-        return []
+        return None
@@ -1,27 +1,33 @@
 #utils/helpers.py
 import os
 import re
+import json
+import uuid
+import hashlib
 import requests
 import logging
-import threading
 import time
 import PyPDF2
 
 from pathlib import Path
-from pptx import Presentation
-
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, TextLoader
 
 from utils.firebase import *
+from utils.downloader import REVALIDATE_INTERVAL, directory_checked_at, download_all, download_file, remove_download_record
+from utils.blob_store import blob_store, hash_file, hash_file_cached
+from utils.parsing import SPLITTER_KEY, parse_files
+from utils.extractors import FORMATS, detect_format, load_pptx_file
+
+# Root of the downloaded lecture documents, shared by the embedding builds and the quiz, MCQ and assignment endpoints.
+DATA_PATH = os.getenv("DATA_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Docs"))
 
-download_lock = threading.Lock()
+def get_lecture_dir(subject: str, unit: str, lecture_id: str) -> str:
+    return os.path.join(DATA_PATH, subject, unit, lecture_id)
 
 def check_or_download_files(DATA_PATH: str, subject: str, unit: str, lecture_id: str) -> list:
     """
-    Check if local documents exist for the given lecture ID. If they exist, load and return the documents.
-    If not, fetch the document URLs from Firestore, download the files, and load and return the documents.
+    Check if local documents exist for the given lecture ID. If they exist and were checked against the server within
+    REVALIDATE_INTERVAL seconds, load and return them. Otherwise fetch the document URLs from Firestore, delete local
+    files that are no longer listed, download the files that are missing or changed, and load and return the documents.
     Parameters:
     - DATA_PATH (str): The path to the data directory.
     - subject (str): The subject of the lecture.
@@ -33,7 +39,8 @@ def check_or_download_files(DATA_PATH: str, subject: str, unit: str, lecture_id:
     lecture_dir = os.path.join(DATA_PATH, subject, unit, lecture_id)
     os.makedirs(lecture_dir, exist_ok=True)
 
-    if os.listdir(lecture_dir): 
+    has_documents = bool(list_document_files(lecture_dir))
+    if has_documents and time.time() - directory_checked_at(lecture_dir) < REVALIDATE_INTERVAL: 
         logging.info(f"Documents already exist for Lecture ID: {lecture_id}. Loading existing documents...")
         try:
             documents = load_documents(lecture_dir)
@@ -42,14 +49,23 @@ def check_or_download_files(DATA_PATH: str, subject: str, unit: str, lecture_id:
             logging.error(f"Error loading local documents: {e}")
             return None
 
-    logging.info(f"No local documents found. Fetching document URLs and downloading files...")
+    if has_documents:
+        logging.info(f"Revalidating local documents of Lecture ID: {lecture_id} against the server...")
+    else:
+        logging.info(f"No local documents found. Fetching document URLs and downloading files...")
     document_urls = fetch_document_urls_from_firestore(subject, unit, lecture_id)
 
-    if not document_urls:
-        logging.error(f"No document URLs found for Lecture ID: {lecture_id}")
-        return None 
-    
-    download_files(document_urls, lecture_dir)
+    if document_urls is None:
+        # The lecture could not be looked up: serve the local copies as they are rather than treating them as removed.
+        if not has_documents:
+            return None
+    else:
+        # Documents removed from the lecture in Firestore must not be loaded, embedded or cited any more.
+        remove_stale_documents(lecture_dir, document_urls)
+        if not document_urls:
+            logging.error(f"No document URLs found for Lecture ID: {lecture_id}")
+            return None
+        download_files(document_urls, lecture_dir)
     
     try:
         documents = load_documents(lecture_dir)
@@ -58,6 +74,17 @@ def check_or_download_files(DATA_PATH: str, subject: str, unit: str, lecture_id:
         logging.error(f"Error loading downloaded documents: {e}")
         return None
         
+def remove_stale_documents(lecture_dir: str, document_urls: list) -> None:
+    """
+    Deletes downloaded files of a lecture that are no longer among its document URLs.
+    """
+    expected = {get_file_name(get_document_url(doc), idx) for idx, doc in enumerate(document_urls) if get_document_url(doc)}
+    for file in list_document_files(lecture_dir):
+        if file.name not in expected:
+            logging.info(f"Document {file.name} was removed from the lecture; deleting local copy.")
+            os.remove(file)
+            remove_download_record(file)
+
 def chunk_content(content: str, chunk_size=1000) -> str:
     return [content[i:i+chunk_size] for i in range(0, len(content), chunk_size)]
 
@@ -84,49 +111,86 @@ def doc_chunking(documents: list) -> list:
         print(f"Error generating quiz: {e}")
         return {}
 
-def download_files(document_urls: list, save_directory: str) -> None:
+def get_document_url(doc) -> str:
+    """
+    Returns the URL of a document entry, which is either a URL string or a dictionary with 'url' and 'name'.
+    """
+    if isinstance(doc, dict):
+        return doc.get('url')
+    return doc
+
+def is_document_entry(doc) -> bool:
+    """
+    Checks that a document entry has the shape get_document_url accepts: a URL string, or a dictionary whose 'url'
+    is a non-empty string.
+    """
+    if isinstance(doc, dict):
+        return isinstance(doc.get('url'), str) and bool(doc['url'])
+    return isinstance(doc, str)
+
+def get_file_name(file_url: str, idx: int) -> str:
+    """
+    Returns the local file name a document URL is saved under.
+    """
+    file_name_match = re.search(r'/([^/]+\.[a-zA-Z0-9]+)(?:\?|$)', file_url)
+    return file_name_match.group(1) if file_name_match else f'document_{idx}.txt'
+
+def download_files(document_urls: list, save_directory: str) -> dict:
     """
     Downloads files from the provided document data and saves them in the specified directory.
-    If the file already exists, it will skip downloading.
+    If the file already exists, it will skip downloading. Files are fetched in parallel over the shared HTTP session
+    and kept in the blob store, so a document attached to several lectures is downloaded once.
 
     Args:
         document_urls (list): A list of URLs (strings) or dictionaries with 'url' and 'name'.
         save_directory (str): Directory where files will be saved.
+
+    Returns:
+        dict: Download statistics, as returned by download_all.
     """
     logging.info(f"Downloading files from provided URLs")
     os.makedirs(save_directory, exist_ok=True)
 
+    downloads = []
     for idx, doc in enumerate(document_urls):
-        try:
-            with download_lock:
-                if isinstance(doc, dict):
-                    file_url = doc.get('url')
-                else:
-                    file_url = doc 
+        file_url = get_document_url(doc)
+        if not file_url:
+            logging.error("Invalid document data: URL is empty.")
+            continue
+        downloads.append((file_url, os.path.join(save_directory, get_file_name(file_url, idx))))
 
-                if not file_url:
-                    logging.error("Invalid document data: URL is empty.")
-                    continue
+    stats = download_all(downloads, store=blob_store)
+    logging.info(f"Downloaded {stats['downloaded']} files ({stats['bytes'] / 1e6:.2f} MB), linked {stats['linked']} from the blob store, "
+                 f"skipped {stats['skipped']} existing, {stats['failed']} failed in {stats['seconds']:.2f} seconds")
+    return stats
 
-                file_name_match = re.search(r'/([^/]+\.[a-zA-Z0-9]+)(?:\?|$)', file_url)
-                file_name = file_name_match.group(1) if file_name_match else f'document_{idx}.txt'
-                file_path = os.path.join(save_directory, file_name)
 
-                if os.path.exists(file_path):
-                    logging.info(f"File {file_name} already exists, skipping download.")
-                    continue
+# Files written next to documents while downloading or building, which are never documents themselves.
+WORK_FILE_SUFFIXES = (".part", ".lock", ".tmp", ".link")
 
-                logging.info(f"Downloading {file_url} to {file_name}")
-                response = requests.get(file_url)
-                response.raise_for_status()
-                
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
+def list_document_files(directory: str) -> list:
+    """
+    List the files in a directory that load_documents can parse, as detected from their content, in load order
+    (text, Markdown, PDF, PPTX, then DOCX).
 
-                logging.info(f"Downloaded and saved file: {file_name}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error downloading file from {file_url}: {e}")
+    Args:
+        directory (str): The directory path where the documents are located.
 
+    Returns:
+        list: A list of file paths.
+    """
+    files = {}
+    for file in sorted(Path(directory).glob("*")):
+        if file.name.startswith(".") or file.name.endswith(WORK_FILE_SUFFIXES) or not file.is_file():
+            continue
+        try:
+            fmt = detect_format(file)
+        except OSError:
+            # Removed while listing.
+            continue
+        if fmt is not None:
+            files.setdefault(fmt, []).append(file)
+    return [file for fmt in FORMATS for file in files.get(fmt, [])]
 
 def load_pptx_files(directory: str) -> list:
     """
@@ -140,67 +204,151 @@ def load_pptx_files(directory: str) -> list:
 
     """
     logging.info(f"Loading PPTX files from directory: {directory}")
-    pptx_documents = []
-    for pptx_file in Path(directory).glob("*.pptx"):
-        logging.info(f"Processing PPTX file: {pptx_file}")
-        prs = Presentation(pptx_file)
-        text_runs = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text_runs.append(shape.text)
-        pptx_documents.append(Document(page_content="\n".join(text_runs), metadata={"source": str(pptx_file)}))
+    pptx_documents = [load_pptx_file(pptx_file) for pptx_file in Path(directory).glob("*.pptx")]
     logging.info(f"Loaded {len(pptx_documents)} PPTX documents.")
     return pptx_documents
 
-def load_documents(directory: str) -> list:
+def load_cached_chunks(files: list, file_hashes: dict = None) -> tuple:
+    """
+    Loads the split chunks of document files from the chunk cache, keyed by file content hash and splitter settings,
+    and parses only the files not cached yet (together, across the parse pool), caching their chunks. Every chunk
+    records its file's path as 'source' and content hash as 'sha256'.
+
+    Args:
+        files (list): Paths of the files, in the order their chunks should be returned.
+        file_hashes (dict): Optional {file name: sha256} of the files, when already computed.
+
+    Returns:
+        tuple: The chunks, and the names of files that failed to parse.
+    """
+    files = [Path(file) for file in files]
+    hashes = {file.name: (file_hashes or {}).get(file.name) or hash_file_cached(file) for file in files}
+    chunks_by_file = {file.name: blob_store.get_chunks(hashes[file.name], SPLITTER_KEY) for file in files}
+    cached = [name for name, chunks in chunks_by_file.items() if chunks is not None]
+    if cached:
+        logging.info(f"Loaded cached chunks of {len(cached)} files: {cached}")
+
+    failed = []
+    to_parse = [file for file in files if chunks_by_file[file.name] is None]
+    if to_parse:
+        parsed, reports = parse_files(to_parse)
+        offset = 0
+        for file, report in zip(to_parse, reports):
+            if report["error"]:
+                failed.append(file.name)
+                continue
+            chunks_by_file[file.name] = parsed[offset:offset + report["chunks"]]
+            offset += report["chunks"]
+            blob_store.put_chunks(hashes[file.name], SPLITTER_KEY, chunks_by_file[file.name])
+
+    documents = []
+    for file in files:
+        for chunk in chunks_by_file[file.name] or []:
+            chunk.metadata.update(source=str(file), sha256=hashes[file.name])
+            documents.append(chunk)
+    return documents, failed
+
+def load_documents(directory: str, files: list = None) -> list:
     """
     Load documents from a given directory.
     Args:
         directory (str): The directory path where the documents are located.
+        files (list): Optional file names or paths within the directory to load instead of every document.
     Returns:
         list: A list of split documents.
-    Raises:
-        FileNotFoundError: If the specified directory does not exist.
-        Exception: If there is an error loading a text file.
     """
     logging.info(f"Loading documents from directory: {directory}")
     start_time = time.time()
 
-    dir_path = Path(directory)
-
-    txt_documents = []
-    pdf_documents = []
-    
-    for file in dir_path.glob("*.txt"):
-        try:
-            loader = TextLoader(str(file))
-            txt_documents.extend(loader.load())
-            logging.info(f"Loaded text document: {file}")
-        except Exception as e:
-            logging.error(f"Error loading text file {file}: {e}")
-
-    pdf_loader = DirectoryLoader(str(dir_path), glob="*.pdf", loader_cls=PyPDFLoader)
-    pdf_documents = pdf_loader.load()
-    logging.info(f"Loaded {len(pdf_documents)} PDF documents.")
-    
-    pptx_documents = load_pptx_files(directory)
+    selected = None if files is None else {Path(file).name for file in files}
+    document_files = [file for file in list_document_files(directory) if selected is None or file.name in selected]
 
-    documents = txt_documents + pdf_documents + pptx_documents
-    logging.info(f"Total documents loaded: {len(documents)}")
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    split_documents = text_splitter.split_documents(documents)
-    logging.info(f"Documents split into {len(split_documents)} chunks.")
+    # Chunks come from the chunk cache when the files were parsed before; the rest are parsed in parallel, and a
+    # file that fails is logged and skipped.
+    split_documents, failed = load_cached_chunks(document_files)
+    logging.info(f"Loaded {len(document_files) - len(failed)} of {len(document_files)} files as {len(split_documents)} chunks"
+                 f"{f'; failed: {failed}' if failed else ''}.")
 
     end_time = time.time()
     logging.info(f"Documents loaded and processed in {end_time - start_time:.2f} seconds")
 
     return split_documents
 
+def iter_book_pages(book_url: str, save_directory: str):
+    """
+    Yields the text of a book's pages one at a time, so callers can stop reading once they have enough.
+
+    The book is downloaded to Books/<hash of the URL>.pdf under save_directory, so different books never overwrite
+    each other and a book is only downloaded again when it changes on the server. Extracted page texts are cached
+    in the blob store by the SHA-256 of the PDF: cached pages are read back from the cache, and pages a caller got
+    to first are extracted and added to it, including when the caller stops early.
+
+    Args:
+        book_url (str): The URL of the book in Firebase storage.
+        save_directory (str): The directory where the book will be saved.
+
+    Yields:
+        str: The text of each page, in order.
+    """
+    book_path = os.path.join(save_directory, "Books", f"{hashlib.sha256(book_url.encode('utf-8')).hexdigest()[:32]}.pdf")
+    os.makedirs(os.path.dirname(book_path), exist_ok=True)
+    download_file(book_url, book_path, store=blob_store)
+
+    text_path = blob_store.text_path(hash_file_cached(book_path))
+    cached_pages = 0
+    page_count = None
+    try:
+        with open(text_path, 'r', encoding='utf-8') as f:
+            page_count = json.loads(f.readline())["page_count"]
+            for line in f:
+                page_text = json.loads(line)
+                cached_pages += 1
+                yield page_text
+    except (OSError, ValueError, KeyError):
+        # No cache yet, or a damaged one: extraction continues after the last page that could be read from it.
+        pass
+    if page_count is not None and cached_pages >= page_count:
+        logging.info(f"Read {cached_pages} pages of {os.path.basename(book_path)} from the text cache.")
+        return
+
+    start_time = time.time()
+    pdf_reader = PyPDF2.PdfReader(book_path)
+    page_count = len(pdf_reader.pages)
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+    tmp_path = f"{text_path}.{uuid.uuid4().hex}.tmp"
+    extracted = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as cache:
+            cache.write(json.dumps({"page_count": page_count}) + "\n")
+            if cached_pages:
+                with open(text_path, 'r', encoding='utf-8') as f:
+                    f.readline()
+                    for _, line in zip(range(cached_pages), f):
+                        cache.write(line)
+            try:
+                for page_num in range(cached_pages, page_count):
+                    page_text = pdf_reader.pages[page_num].extract_text() or ""
+                    cache.write(json.dumps(page_text) + "\n")
+                    extracted += 1
+                    yield page_text
+            finally:
+                # Closing the generator early raises GeneratorExit at the yield, so the cache is committed here:
+                # the pages extracted so far are kept for the next reader.
+                cache.flush()
+                os.fsync(cache.fileno())
+                cache.close()
+                if extracted:
+                    os.replace(tmp_path, text_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logging.info(f"Extracted {extracted} of {page_count} pages of {os.path.basename(book_path)} in "
+                     f"{time.time() - start_time:.2f} seconds ({cached_pages} read from the text cache).")
+
 def extract_text_from_books(book_url: str, save_directory: str) -> str:
     """
-    Downloads the book from the provided Firebase URL and extracts text, saving the file in the specified directory.
+    Downloads the book from the provided Firebase URL and extracts its full text. Prefer iter_book_pages when only
+    part of the book is needed.
     
     Args:
         book_url (str): The URL of the book in Firebase storage.
@@ -209,17 +357,4 @@ def extract_text_from_books(book_url: str, save_directory: str) -> str:
     Returns:
         str: The full extracted text from the PDF.
     """
-    os.makedirs(save_directory, exist_ok=True)
-    
-    book_path = download_file_from_url(book_url, save_directory)
-
-    full_text = ""
-    print(f"Extracting text from book: {book_path}")
-
-    pdf_reader = PyPDF2.PdfReader(book_path)
-    for page_num in range(len(pdf_reader.pages)):
-        page_text = pdf_reader.pages[page_num].extract_text()
-        full_text += page_text + "\n\n"
-
-    print("Text extraction from books complete.")
-    return full_text
+    return "".join(f"{page_text}\n\n" for page_text in iter_book_pages(book_url, save_directory))
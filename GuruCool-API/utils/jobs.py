@@ -0,0 +1,199 @@
+#utils/jobs.py
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Jobs", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+JSON_FIELDS = ("params", "result", "timings")
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while JOB_QUEUE_SIZE jobs are already queued or running in this process."""
+
+class JobStore:
+    """
+    Job table in SQLite, shared by every worker process using the same database file.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    job_key TEXT,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    timings TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    updated_at TEXT NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_active ON jobs (kind, job_key, status)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, kind: str, job_key: str, owner: str, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, job_key, owner, status, params, timings, created_at, updated_at) "
+                         "VALUES (?, ?, ?, ?, 'queued', ?, '{}', ?, ?)",
+                         (job_id, kind, job_key, owner, json.dumps(params), now, now))
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        for name in JSON_FIELDS:
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for name in JSON_FIELDS:
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def find_active(self, kind: str, job_key: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id FROM jobs WHERE kind = ? AND job_key = ? AND status IN ('queued', 'running') "
+                               "ORDER BY created_at DESC LIMIT 1", (kind, job_key)).fetchone()
+        return row[0] if row else None
+
+    def fail_orphaned(self) -> int:
+        """
+        Marks queued or running jobs of processes on this host that no longer exist as failed.
+        """
+        host = socket.gethostname()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        orphaned = [job_id for job_id, owner in rows
+                    if owner.rpartition(":")[0] == host and not psutil.pid_exists(int(owner.rpartition(":")[2]))]
+        for job_id in orphaned:
+            self.update(job_id, status="failed", error="Interrupted: the worker process running the job exited.",
+                        finished_at=datetime.now().isoformat(timespec="seconds"))
+        return len(orphaned)
+
+class Job:
+    """
+    Handle passed to a running job function for reporting its stage and progress. The time spent in each stage is
+    recorded in the job's timings.
+    """
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.id = job_id
+        self.timings = {}
+        self._stage = None
+        self._stage_started = None
+
+    def report(self, stage: str, progress: float) -> None:
+        now = time.time()
+        if stage != self._stage:
+            self._close_stage(now)
+            self._stage, self._stage_started = stage, now
+        self.store.update(self.id, stage=stage, progress=round(min(max(progress, 0.0), 1.0), 3), timings=self.timings)
+
+    def _close_stage(self, now: float) -> None:
+        if self._stage is not None:
+            self.timings[self._stage] = round(self.timings.get(self._stage, 0) + now - self._stage_started, 3)
+
+class JobQueue:
+    """
+    Runs jobs on a bounded pool of background threads and keeps their state in the job table, so any worker
+    process can report the status of any job.
+    """
+    def __init__(self, store: JobStore, workers: int, max_pending: int):
+        self.store = store
+        self.max_pending = max_pending
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._pending = 0
+        self._lock = threading.Lock()
+        orphaned = store.fail_orphaned()
+        if orphaned:
+            logging.warning(f"Marked {orphaned} jobs of exited worker processes as failed.")
+
+    def submit(self, kind: str, job_key: str, params: dict, fn) -> tuple:
+        """
+        Queues fn(job, **params) unless a job of the same kind and key is already queued or running.
+
+        Returns:
+            tuple: The job id and whether a new job was created.
+
+        Raises:
+            JobQueueFull: If JOB_QUEUE_SIZE jobs are already queued or running in this process.
+        """
+        with self._lock:
+            active = self.store.find_active(kind, job_key)
+            if active:
+                return active, False
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs are already queued or running; try again later.")
+            self._pending += 1
+            job_id = self.store.create(kind, job_key, self.owner, params)
+        self._executor.submit(self._run, job_id, fn, params)
+        logging.info(f"Queued {kind} job {job_id} for {job_key}")
+        return job_id, True
+
+    def _run(self, job_id: str, fn, params: dict) -> None:
+        job = Job(self.store, job_id)
+        start_time = time.time()
+        self.store.update(job_id, status="running", started_at=datetime.now().isoformat(timespec="seconds"))
+        try:
+            result = fn(job, **params)
+            job._close_stage(time.time())
+            job.timings["total"] = round(time.time() - start_time, 3)
+            self.store.update(job_id, status="succeeded", stage="done", progress=1.0, result=result, timings=job.timings,
+                              finished_at=datetime.now().isoformat(timespec="seconds"))
+            logging.info(f"Job {job_id} succeeded in {job.timings['total']:.2f} seconds")
+        except Exception as e:
+            job._close_stage(time.time())
+            job.timings["total"] = round(time.time() - start_time, 3)
+            self.store.update(job_id, status="failed", error=str(e), timings=job.timings,
+                              finished_at=datetime.now().isoformat(timespec="seconds"))
+            logging.error(f"Job {job_id} failed in stage {job._stage}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+job_queue = JobQueue(JobStore(JOBS_DB_PATH), JOB_WORKERS, JOB_QUEUE_SIZE)
+
+def get_job(job_id: str):
+    return job_queue.store.get(job_id)
@@ -0,0 +1,143 @@
+#utils/lecture_cache.py
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.lecture_index import *
+
+LECTURE_CACHE_MAX_MB = int(os.getenv("LECTURE_CACHE_MAX_MB", "1024"))
+
+def file_signature(path: str):
+    """
+    Returns a signature that changes whenever the file is replaced or rewritten, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+class LectureIndexCache:
+    """
+    Thread-safe LRU cache of opened lecture indexes, bounded by an estimated byte budget.
+    An entry is dropped as soon as the signature of its backing file on disk changes.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, signature_path: str, loader, size_of):
+        """
+        Returns the cached value for the key, calling loader() on a miss or when the file at signature_path changed.
+
+        Args:
+            key (tuple): Cache key, e.g. (subject, unit, lecture_id).
+            signature_path (str): File whose signature decides whether the cached value is still valid.
+            loader (callable): Loads the value.
+            size_of (callable): Estimates the memory footprint of a loaded value in bytes.
+        """
+        signature = file_signature(signature_path)
+        value = self._lookup(key, signature)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have loaded the entry while we were waiting.
+            value = self._lookup(key, signature, count=False)
+            if value is not None:
+                return value
+
+            value = loader()
+            if signature is None:
+                signature = file_signature(signature_path)
+            self._store(key, signature, value, size_of(value))
+            return value
+
+    def _lookup(self, key, signature, count: bool = True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and signature is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                self._remove(key)
+                self.invalidations += 1
+                logging.info(f"Lecture cache entry {key} invalidated: file on disk changed.")
+            if count:
+                self.misses += 1
+            return None
+
+    def _store(self, key, signature, value, nbytes: int) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if nbytes > self.max_bytes:
+                logging.warning(f"Lecture cache entry {key} ({nbytes} bytes) exceeds the cache budget; not caching it.")
+                return
+
+            self._entries[key] = (signature, value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                evicted_key, _ = next(iter(self._entries.items()))
+                self._remove(evicted_key)
+                self.evictions += 1
+                logging.info(f"Lecture cache entry {evicted_key} evicted to stay within {self.max_bytes} bytes.")
+
+    def _remove(self, key) -> None:
+        _, _, nbytes = self._entries.pop(key)
+        self.current_bytes -= nbytes
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+lecture_cache = LectureIndexCache(max_bytes=LECTURE_CACHE_MAX_MB * 1024 * 1024)
+
+def _lecture_index_nbytes(lecture_index: LectureIndex) -> int:
+    return sum(os.path.getsize(os.path.join(lecture_index.index_dir, file_name))
+               for file_name in lecture_index.manifest["files"].values())
+
+def get_cached_lecture_index(cache_directory: str, subject: str, unit: str, lecture_id: str) -> LectureIndex:
+    """
+    Returns the opened lecture index for a lecture from the process-level cache, loading it from disk on a miss.
+    """
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
+    return lecture_cache.get(
+        (subject, unit, lecture_id),
+        os.path.join(index_dir, MANIFEST_FILE),
+        lambda: load_lecture_index(cache_directory, subject, unit, lecture_id),
+        _lecture_index_nbytes,
+    )
+
+def get_lecture_cache_stats() -> dict:
+    return lecture_cache.stats()
@@ -0,0 +1,348 @@
+#utils/lecture_index.py
+import os
+import sys
+import json
+import mmap
+import uuid
+import pickle
+import logging
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from langchain.schema import Document
+
+from utils.faiss_index import describe_faiss_index, configure_search, index_compression, measure_recall, EMBEDDING_MIN_RECALL
+from utils.bm25 import BM25Index, BM25_FILES, bm25_file_names, write_bm25_index
+from utils.build_lock import atomic_write, build_lock
+
+# Root of the lecture and unit indexes, shared by every module that builds or reads them.
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cache"))
+LECTURE_INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+def get_lecture_index_dir(cache_directory: str, subject: str, unit: str, lecture_id: str) -> str:
+    return os.path.join(cache_directory, subject, unit, lecture_id)
+
+def get_lecture_lock_file(index_dir: str) -> str:
+    # Kept next to the index directory rather than inside it, so replacing or deleting the index leaves the lock alone.
+    return f"{os.path.normpath(index_dir)}.lock"
+
+def get_legacy_cache_file(cache_directory: str, lecture_id: str) -> str:
+    return os.path.join(cache_directory, f"{lecture_id}_embedding_cache.pkl")
+
+class ChunkStore:
+    """
+    Read-only sequence of chunk Documents backed by a memory-mapped text blob and metadata blob.
+    Each blob is a concatenation of UTF-8 records addressed through an offsets array of length n + 1.
+    """
+    def __init__(self, texts_path: str, text_offsets_path: str, metadata_path: str, metadata_offsets_path: str):
+        self._texts = _map_file(texts_path)
+        self._text_offsets = np.load(text_offsets_path, mmap_mode='r')
+        self._metadata = _map_file(metadata_path)
+        self._metadata_offsets = np.load(metadata_offsets_path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self._text_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Chunk index {i} out of range.")
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def text(self, i: int) -> str:
+        return _read_record(self._texts, self._text_offsets, i)
+
+    def metadata(self, i: int) -> dict:
+        return json.loads(_read_record(self._metadata, self._metadata_offsets, i))
+
+class IndexVectors:
+    """
+    Read-only view of the vectors held in a compressed FAISS index, used in place of the embedding matrix when a
+    lecture index was written without one. Rows are decoded on access, so they are approximations of the originals.
+    """
+    def __init__(self, index):
+        # The downcast view does not own the index, so the index itself is kept alive alongside it.
+        self._owner = index
+        self._index = faiss.downcast_index(index)
+        if isinstance(self._index, faiss.IndexIVF):
+            # IVF indexes can only reconstruct by id once they have an id -> list map.
+            self._index.make_direct_map()
+
+    def __len__(self):
+        return self._index.ntotal
+
+    @property
+    def shape(self):
+        return (self._index.ntotal, self._index.d)
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            rows = range(*rows.indices(len(self)))
+        if np.isscalar(rows):
+            return self._index.reconstruct(int(rows))
+        return np.vstack([self._index.reconstruct(int(i)) for i in rows]) if len(rows) else np.empty((0, self._index.d), dtype=np.float32)
+
+    def __array__(self, dtype=None, copy=None):
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)
+        return vectors if dtype is None else vectors.astype(dtype, copy=False)
+
+class LectureIndex:
+    """
+    An opened lecture index: the FAISS index, the (memory-mapped) embedding matrix, the chunk store and the
+    BM25 index (None for lecture indexes written before it existed).
+    Compressed lecture indexes have no embedding matrix; their vectors are decoded from the index instead.
+    """
+    def __init__(self, index_dir: str, manifest: dict, index, embeddings, documents: ChunkStore, bm25: BM25Index = None):
+        self.index_dir = index_dir
+        self.manifest = manifest
+        self.index = index
+        self.embeddings = embeddings
+        self.documents = documents
+        self.bm25 = bm25
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def build_id(self) -> str:
+        return self.manifest["build_id"]
+
+def _map_file(path: str):
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _read_record(blob, offsets, i: int) -> str:
+    return bytes(blob[int(offsets[i]):int(offsets[i + 1])]).decode('utf-8')
+
+def _write_records(records: list, blob_path: str, offsets_path: str) -> None:
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    with open(blob_path, 'wb') as f:
+        for i, record in enumerate(records):
+            encoded = record.encode('utf-8')
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    _save_npy(offsets_path, offsets)
+
+def _save_npy(path: str, array) -> None:
+    # np.save appends ".npy" to bare paths, so write through a file object to keep the exact name.
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def _write_json_atomic(path: str, data: dict) -> None:
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+def read_manifest(index_dir: str) -> dict:
+    with open(os.path.join(index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def lecture_index_exists(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+
+def write_lecture_index(index_dir: str, embeddings, index, chunks: list, **manifest_fields) -> dict:
+    """
+    Writes a lecture index to disk. Data files carry a fresh build id in their names and the manifest is
+    replaced atomically last, so readers always see either the previous build or the complete new one.
+    When the FAISS index is compressed the embedding matrix is not written, and the recall@5 of the index
+    against exact search over the embeddings is recorded in the manifest.
+
+    Args:
+        index_dir (str): Directory of the lecture index.
+        embeddings (np.ndarray): Chunk embedding matrix, one row per document.
+        index (faiss.Index): FAISS index over the embeddings.
+        chunks (list): The chunk Documents, in the same order as the embeddings.
+        **manifest_fields: Extra fields recorded in the manifest (subject, unit, model, the per-file 'documents' map, ...).
+
+    Returns:
+        dict: The written manifest.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    build_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    embeddings = np.ascontiguousarray(embeddings)
+    compression = index_compression(index)
+    files = {
+        "index": f"index-{build_id}.faiss",
+        "embeddings": f"embeddings-{build_id}.npy",
+        "texts": f"texts-{build_id}.bin",
+        "text_offsets": f"texts-{build_id}.offsets.npy",
+        "metadata": f"metadata-{build_id}.bin",
+        "metadata_offsets": f"metadata-{build_id}.offsets.npy",
+        **bm25_file_names(build_id),
+    }
+    compression_fields = {}
+    if compression != "none":
+        # The index codes are the only copy of the vectors; keeping a float32 matrix next to them would undo the savings.
+        del files["embeddings"]
+        recall = measure_recall(index, embeddings) if len(chunks) else 1.0
+        compression_fields["recall_at_5"] = round(recall, 4)
+        if recall < EMBEDDING_MIN_RECALL:
+            logging.warning(f"Compressed ({compression}) lecture index for {index_dir} has recall@5 {recall:.3f}, below {EMBEDDING_MIN_RECALL}.")
+    paths = {name: os.path.join(index_dir, file_name) for name, file_name in files.items()}
+
+    faiss.write_index(index, paths["index"])
+    if "embeddings" in paths:
+        _save_npy(paths["embeddings"], embeddings)
+    _write_records([doc.page_content for doc in chunks], paths["texts"], paths["text_offsets"])
+    _write_records([json.dumps(doc.metadata, default=str) for doc in chunks], paths["metadata"], paths["metadata_offsets"])
+    bm25_stats = write_bm25_index([doc.page_content for doc in chunks], paths)
+
+    manifest = {
+        "format_version": LECTURE_INDEX_FORMAT_VERSION,
+        "build_id": build_id,
+        "count": len(chunks),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "embedding_dtype": str(embeddings.dtype) if "embeddings" in files else None,
+        **describe_faiss_index(index),
+        **compression_fields,
+        "bm25": bm25_stats,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        **manifest_fields,
+        "files": files,
+    }
+    _write_json_atomic(os.path.join(index_dir, MANIFEST_FILE), manifest)
+    _remove_stale_files(index_dir, set(files.values()))
+
+    logging.info(f"Lecture index {build_id} with {len(chunks)} chunks written to {index_dir}")
+    return manifest
+
+def _remove_stale_files(index_dir: str, keep: set) -> None:
+    # Readers that still map an older build keep their pages: unlinking does not invalidate open mappings.
+    for file_name in os.listdir(index_dir):
+        if file_name in keep or file_name.startswith(MANIFEST_FILE):
+            continue
+        try:
+            os.remove(os.path.join(index_dir, file_name))
+        except OSError as e:
+            logging.warning(f"Could not remove stale lecture index file {file_name}: {e}")
+
+def _read_faiss_index(path: str):
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+def open_lecture_index(index_dir: str) -> LectureIndex:
+    """
+    Opens a lecture index written by write_lecture_index. The embedding matrix and chunk store are memory-mapped;
+    compressed indexes without a matrix expose their decoded vectors instead.
+
+    Raises:
+        FileNotFoundError: If no lecture index exists in the directory.
+        ValueError: If the index was written with an unsupported format version.
+    """
+    if not lecture_index_exists(index_dir):
+        raise FileNotFoundError(f"No lecture index found at {index_dir}.")
+
+    manifest = read_manifest(index_dir)
+    if manifest.get("format_version") != LECTURE_INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported lecture index format version {manifest.get('format_version')} at {index_dir}.")
+
+    paths = {name: os.path.join(index_dir, file_name) for name, file_name in manifest["files"].items()}
+    index = configure_search(_read_faiss_index(paths["index"]))
+    embeddings = np.load(paths["embeddings"], mmap_mode='r') if "embeddings" in paths else IndexVectors(index)
+    documents = ChunkStore(paths["texts"], paths["text_offsets"], paths["metadata"], paths["metadata_offsets"])
+    bm25 = BM25Index(paths, manifest["bm25"]["avg_doc_length"]) if all(name in paths for name in BM25_FILES) else None
+
+    return LectureIndex(index_dir, manifest, index, embeddings, documents, bm25)
+
+def migrate_pickle_cache(pickle_file: str, index_dir: str, remove_pickle: bool = True, **manifest_fields) -> dict:
+    """
+    Converts a legacy (embeddings, index, documents) pickle cache into the on-disk lecture index format.
+
+    Args:
+        pickle_file (str): Path of the legacy `{lecture_id}_embedding_cache.pkl` file.
+        index_dir (str): Directory the lecture index is written to.
+        remove_pickle (bool): Delete the pickle once the lecture index has been written.
+
+    Returns:
+        dict: The written manifest.
+    """
+    logging.info(f"Migrating legacy embedding cache {pickle_file} to {index_dir}")
+    with open(pickle_file, 'rb') as f:
+        embeddings, index, documents = pickle.load(f)
+
+    manifest = write_lecture_index(index_dir, np.asarray(embeddings, dtype=np.float32), index, documents,
+                                   migrated_from=os.path.basename(pickle_file), **manifest_fields)
+    if remove_pickle:
+        os.remove(pickle_file)
+    return manifest
+
+def load_lecture_index(cache_directory: str, subject: str, unit: str, lecture_id: str) -> LectureIndex:
+    """
+    Opens the lecture index for a lecture, migrating a legacy pickle cache first if that is all there is.
+
+    Raises:
+        FileNotFoundError: If neither a lecture index nor a legacy cache exists for the lecture.
+    """
+    index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
+    if not lecture_index_exists(index_dir):
+        legacy_cache_file = get_legacy_cache_file(cache_directory, lecture_id)
+        if not os.path.exists(legacy_cache_file):
+            raise FileNotFoundError(f"Embeddings not found for Lecture ID: {lecture_id}.")
+        # Migrating writes the lecture index, so it takes the build lock like any other writer; a worker that waited
+        # finds the index another worker already migrated.
+        with build_lock(get_lecture_lock_file(index_dir)):
+            if not lecture_index_exists(index_dir):
+                migrate_pickle_cache(legacy_cache_file, index_dir, subject=subject, unit=unit, lecture_id=lecture_id)
+    return open_lecture_index(index_dir)
+
+def _infer_subject_unit(documents: list, lecture_id: str):
+    # Chunk sources look like <DATA_PATH>/<subject>/<unit>/<lecture_id>/<file>.
+    for doc in documents:
+        parts = os.path.normpath(str(doc.metadata.get("source", ""))).split(os.sep)
+        if lecture_id in parts:
+            position = parts.index(lecture_id)
+            if position >= 2:
+                return parts[position - 2], parts[position - 1]
+    return None, None
+
+def migrate_all_pickle_caches(cache_directory: str) -> int:
+    """
+    Migrates every legacy pickle cache in the cache directory, inferring subject and unit from the chunk sources.
+
+    Returns:
+        int: The number of migrated caches.
+    """
+    migrated = 0
+    for file_name in sorted(os.listdir(cache_directory)):
+        if not file_name.endswith("_embedding_cache.pkl"):
+            continue
+        lecture_id = file_name[:-len("_embedding_cache.pkl")]
+        pickle_file = os.path.join(cache_directory, file_name)
+        try:
+            with open(pickle_file, 'rb') as f:
+                _, _, documents = pickle.load(f)
+            subject, unit = _infer_subject_unit(documents, lecture_id)
+            if not subject:
+                logging.warning(f"Could not infer subject and unit for {file_name}; it will be migrated on first use.")
+                continue
+            index_dir = get_lecture_index_dir(cache_directory, subject, unit, lecture_id)
+            with build_lock(get_lecture_lock_file(index_dir)):
+                if lecture_index_exists(index_dir) or not os.path.exists(pickle_file):
+                    continue
+                migrate_pickle_cache(pickle_file, index_dir, subject=subject, unit=unit, lecture_id=lecture_id)
+            migrated += 1
+        except Exception as e:
+            logging.error(f"Error migrating {file_name}: {e}")
+    return migrated
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.lecture_index <cache_directory>")
+        sys.exit(1)
+    print(f"Migrated {migrate_all_pickle_caches(sys.argv[1])} legacy embedding caches.")
@@ -0,0 +1,191 @@
+#utils/models.py
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+import psutil
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+_models = {}
+_model_stats = {}
+_model_locks = {}
+_registry_lock = threading.Lock()
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_device():
+    """
+    Picks the torch device used for the embedding models (CUDA, then Apple MPS, then CPU).
+
+    Returns:
+        str: The torch device name.
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def _record_model_stats(model_name: str, device: str, torch_model, load_time: float, rss_delta: int) -> None:
+    parameter_bytes = sum(p.numel() * p.element_size() for p in torch_model.parameters())
+    _model_stats[model_name] = {
+        "device": device,
+        "load_time_seconds": round(load_time, 3),
+        "rss_delta_mb": round(rss_delta / (1024 * 1024), 1),
+        "parameter_mb": round(parameter_bytes / (1024 * 1024), 1),
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    logging.info(f"Model '{model_name}' loaded on {device} in {load_time:.2f} seconds "
+                 f"(RSS +{_model_stats[model_name]['rss_delta_mb']} MB, parameters {_model_stats[model_name]['parameter_mb']} MB)")
+
+def _load_embedding_model(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    start_time = time.time()
+
+    device = get_device()
+    model = SentenceTransformer(model_name, device=device)
+
+    _record_model_stats(model_name, device, model, time.time() - start_time, process.memory_info().rss - rss_before)
+    return model
+
+def _load_onnx_embedding_model(model_name: str, backend: str):
+    from utils.onnx_embedding import load_onnx_embedding_model
+
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    start_time = time.time()
+
+    model = load_onnx_embedding_model(model_name, backend)
+
+    load_time = time.time() - start_time
+    _model_stats[f"{model_name}:{backend}"] = {
+        "device": "cpu",
+        "backend": backend,
+        "load_time_seconds": round(load_time, 3),
+        "rss_delta_mb": round((process.memory_info().rss - rss_before) / (1024 * 1024), 1),
+        "parameter_mb": round(os.path.getsize(model.model_path) / (1024 * 1024), 1),
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    logging.info(f"Model '{model_name}' loaded with {backend} in {load_time:.2f} seconds")
+    return model
+
+def _load_reranker_model(model_name: str):
+    from sentence_transformers import CrossEncoder
+
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    start_time = time.time()
+
+    # Reranking scores a few dozen short pairs per request, which a small cross-encoder does fine on CPU.
+    model = CrossEncoder(model_name, device="cpu")
+
+    _record_model_stats(model_name, "cpu", model.model, time.time() - start_time, process.memory_info().rss - rss_before)
+    return model
+
+def _get_model(model_name: str, loader):
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(model_name, threading.Lock())
+
+    with model_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = loader(model_name)
+            _models[model_name] = model
+    return model
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND):
+    """
+    Returns the process-wide instance of an embedding model, loading it on first use.
+    Concurrent callers asking for a model that is still loading wait for that single load.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        backend (str): 'torch' for SentenceTransformer, or 'onnx' / 'onnx-int8' for ONNX Runtime on CPU.
+
+    Returns:
+        SentenceTransformer or OnnxEmbeddingModel: The shared model instance.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if backend == "torch":
+        return _get_model(model_name, _load_embedding_model)
+    return _get_model(f"{model_name}:{backend}", lambda _: _load_onnx_embedding_model(model_name, backend))
+
+def get_reranker_model(model_name: str = RERANK_MODEL):
+    """
+    Returns the process-wide instance of a cross-encoder reranking model, loading it on first use.
+
+    Args:
+        model_name (str): The CrossEncoder model name.
+
+    Returns:
+        CrossEncoder: The shared model instance.
+    """
+    return _get_model(model_name, _load_reranker_model)
+
+def preload_embedding_models(model_names=None) -> None:
+    """
+    Loads the given embedding models (the default model if none are given) so the first request does not pay for it.
+
+    Args:
+        model_names (list): Model names to load.
+    """
+    for model_name in model_names or [DEFAULT_EMBEDDING_MODEL]:
+        try:
+            get_embedding_model(model_name)
+        except Exception as e:
+            logging.error(f"Error preloading embedding model '{model_name}': {e}")
+
+def get_embedding_pool(model_name: str = DEFAULT_EMBEDDING_MODEL, workers: int = 2):
+    """
+    Returns a multi-process encoding pool of a model with one CPU worker process per entry, starting it on first use.
+    Every worker holds its own copy of the model, so the pool is kept for the lifetime of the process.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        workers (int): Number of worker processes.
+
+    Returns:
+        dict: The pool, as returned by SentenceTransformer.start_multi_process_pool.
+    """
+    with _pool_lock:
+        pool = _pools.get((model_name, workers))
+        if pool is None:
+            start_time = time.time()
+            pool = get_embedding_model(model_name, backend="torch").start_multi_process_pool(target_devices=["cpu"] * workers)
+            _pools[(model_name, workers)] = pool
+            logging.info(f"Started {workers} encoding processes for '{model_name}' in {time.time() - start_time:.2f} seconds")
+    return pool
+
+@atexit.register
+def stop_embedding_pools() -> None:
+    if not _pools:
+        return
+    from sentence_transformers import SentenceTransformer
+
+    with _pool_lock:
+        for pool in _pools.values():
+            SentenceTransformer.stop_multi_process_pool(pool)
+        _pools.clear()
+
+def get_model_stats() -> dict:
+    """
+    Returns load time and memory figures for every model loaded in this process.
+    """
+    return {name: dict(stats) for name, stats in _model_stats.items()}
@@ -0,0 +1,168 @@
+#utils/onnx_embedding.py
+import os
+import sys
+import json
+import time
+import inspect
+import logging
+
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Models", "onnx"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_CONFIG_FILE = "embedding_config.json"
+ONNX_MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+
+def get_onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+def _is_cls_pooling(pooling) -> bool:
+    # sentence-transformers 6 replaced the pooling_mode_* flags with a single pooling_mode string.
+    if hasattr(pooling, "pooling_mode_cls_token"):
+        return bool(pooling.pooling_mode_cls_token)
+    return getattr(pooling, "pooling_mode", "mean") == "cls"
+
+def export_onnx_model(model_name: str, output_dir: str = None) -> str:
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX, together with its tokenizer and pooling settings,
+    and writes a dynamically int8-quantized copy next to it. This is the only step that needs torch.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+        output_dir (str): Target directory. Defaults to the model's directory under ONNX_MODEL_DIR.
+
+    Returns:
+        str: The directory the model was exported to.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError(f"Exporting an ONNX embedding model needs the onnx package (pip install onnx): {e}") from e
+
+    output_dir = output_dir or get_onnx_model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = time.time()
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = next((module for module in model if type(module).__name__ == "Pooling"), None)
+
+    sample = tokenizer(["GuruCool exports this sentence to ONNX."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class NamedInputs(torch.nn.Module):
+        # Calls the transformer with keyword inputs, since the positional order of forward() differs between
+        # transformers versions.
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *tensors):
+            return self.transformer(**dict(zip(input_names, tensors)), return_dict=True).last_hidden_state
+
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILES["onnx"])
+    # torch 2.9+ exports with dynamo (and onnxscript) by default; dynamic_axes belong to the TorchScript exporter.
+    exporter = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(NamedInputs().eval(), tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14, **exporter)
+    quantize_dynamic(model_path, os.path.join(output_dir, ONNX_MODEL_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+
+    config = {
+        "model_name": model_name,
+        "inputs": input_names,
+        "max_seq_length": model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pooling": "cls" if pooling is not None and _is_cls_pooling(pooling) else "mean",
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+    }
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    logging.info(f"Exported '{model_name}' to ONNX at {output_dir} in {time.time() - start_time:.2f} seconds")
+    return output_dir
+
+class OnnxEmbeddingModel:
+    """
+    Sentence embedding model run with ONNX Runtime on CPU. Tokenization, pooling and normalization are done with
+    the tokenizers library and numpy, so encoding never imports torch. Mirrors the parts of
+    SentenceTransformer.encode the API uses.
+    """
+    def __init__(self, model_dir: str, backend: str = "onnx"):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.backend = backend
+        self.model_path = os.path.join(model_dir, ONNX_MODEL_FILES[backend])
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_tensor: bool = False, **kwargs) -> np.ndarray:
+        """
+        Encodes sentences into a float32 matrix with one row per sentence. convert_to_tensor is accepted for call
+        compatibility with SentenceTransformer and ignored.
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        # Encoding longest first keeps the sentences of a batch close in length, so little padding is computed.
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = np.empty((len(sentences), self.session.get_outputs()[0].shape[-1]), dtype=np.float32)
+
+        for batch_start in range(0, len(sentences), batch_size):
+            batch_ids = order[batch_start:batch_start + batch_size]
+            encodings = self.tokenizer.encode_batch([sentences[i] for i in batch_ids])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: inputs[name] for name in self.config["inputs"]})[0]
+            embeddings[batch_ids] = self._pool(hidden, inputs["attention_mask"])
+        return embeddings
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+def load_onnx_embedding_model(model_name: str, backend: str = "onnx") -> OnnxEmbeddingModel:
+    """
+    Opens the ONNX export of a model for the given backend ('onnx' or 'onnx-int8'), exporting it first if needed.
+    """
+    if backend not in ONNX_MODEL_FILES:
+        raise ValueError(f"Unknown ONNX embedding backend: {backend}")
+    model_dir = get_onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, ONNX_CONFIG_FILE)):
+        logging.info(f"No ONNX export of '{model_name}' found at {model_dir}; exporting it now.")
+        export_onnx_model(model_name, model_dir)
+    return OnnxEmbeddingModel(model_dir, backend)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) > 2:
+        print("Usage: python -m utils.onnx_embedding [model_name]")
+        sys.exit(1)
+    print(f"Exported to {export_onnx_model(sys.argv[1] if len(sys.argv) == 2 else os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))}")
@@ -0,0 +1,205 @@
+#utils/parsing.py
+import os
+import math
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from utils.extractors import EXTRACTOR_KEY, count_pages, detect_format, extract_file
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Smaller PDFs are parsed as one task, without opening them first to count their pages.
+PDF_SPLIT_MIN_BYTES = int(os.getenv("PDF_SPLIT_MIN_BYTES", str(2 * 1024 * 1024)))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Part of the key of cached chunks: changing how documents are parsed or split, or the configured extractors, must
+# change it, so stale chunks are never served.
+SPLITTER_KEY = f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}-start-v2-{EXTRACTOR_KEY}"
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats = {"files": 0, "failed": 0, "pages": 0, "chunks": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    # start_index records where each chunk starts in its page or file, so retrieval can merge overlapping chunks.
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+
+def parse_task(path: str, fmt: str = None, start: int = None, stop: int = None) -> tuple:
+    """
+    Extracts and splits one file, or one page range of a PDF, with the extractor configured for its format. Runs in
+    a parse worker process.
+
+    Returns:
+        tuple: The split documents, the number of pages or documents parsed, and the seconds it took.
+    """
+    start_time = time.time()
+    documents = extract_file(path, fmt, start, stop)
+    return get_text_splitter().split_documents(documents), len(documents), time.time() - start_time
+
+def plan_parse_tasks(files: list, workers: int = PARSE_WORKERS) -> list:
+    """
+    Splits files into parse tasks: one per file, and for PDFs of at least PDF_SPLIT_MIN_BYTES parsed by more than one
+    worker, one per page range of at least PDF_PAGES_PER_TASK pages. The format of each file is sniffed from its
+    content here, once.
+
+    Counting the pages opens the PDF in the calling thread, and every page-range task opens it again (reading its
+    cross-reference table and page tree, though it only extracts its own pages), so small PDFs are not split and a
+    PDF is split into at most `workers` ranges.
+
+    Returns:
+        list: (file index, path, format, start page, stop page) tuples; the pages are None for unsplit files.
+    """
+    tasks = []
+    for file_index, file in enumerate(files):
+        path = str(file)
+        fmt = detect_format(path)
+        page_count = 1
+        if fmt == "pdf" and workers > 1 and os.path.getsize(path) >= PDF_SPLIT_MIN_BYTES:
+            try:
+                page_count = count_pages(path, fmt)
+            except Exception:
+                # Let the worker report the error for this file.
+                pass
+        pages_per_task = max(PDF_PAGES_PER_TASK, math.ceil(page_count / max(workers, 1)))
+        if page_count > pages_per_task:
+            for start in range(0, page_count, pages_per_task):
+                tasks.append((file_index, path, fmt, start, start + pages_per_task))
+        else:
+            tasks.append((file_index, path, fmt, None, None))
+    return tasks
+
+def start_parse_pool(workers: int = PARSE_WORKERS) -> None:
+    """
+    Starts the parse pool by forking the current process, so the workers share its already imported parsers. Call it
+    at startup, before models are loaded and threads are started: a fork copies only the calling thread, and locks
+    that other threads hold at that moment (logging, allocators, OpenMP, HTTP pools) would stay locked in the workers.
+    """
+    global _executor
+    # Spawned workers of a replacement pool import the API module too; they must not start pools of their own.
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods() or multiprocessing.parent_process() is not None:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+            # A fork-based pool starts all its workers with its first task, so they are forked now.
+            _executor.submit(os.getpid).result()
+            logging.info(f"Started document parse pool with {workers} forked worker processes")
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Started later (without start_parse_pool, or to replace a broken pool), the process may already run
+            # models and threads, which a fork could deadlock on, so the workers are spawned as fresh interpreters.
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            logging.info(f"Started document parse pool with {workers} spawned worker processes")
+        return _executor
+
+def _reset_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+@atexit.register
+def stop_parse_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def parse_files(files: list, workers: int = PARSE_WORKERS) -> tuple:
+    """
+    Parses and splits document files across a pool of worker processes, one task per file and per page range of
+    large PDFs. A file that fails to parse, or crashes its worker, is reported and left out; the others are
+    unaffected.
+
+    Args:
+        files (list): Paths of the files, in the order their chunks should be returned.
+        workers (int): Parse processes; with 1, or a single task, files are parsed in this process.
+
+    Returns:
+        tuple: The split documents in file and page order, and one report per file with its 'file', 'pages',
+               'chunks', 'seconds' (summed over its tasks) and 'error'.
+    """
+    tasks = plan_parse_tasks(files, workers)
+    reports = [{"file": os.path.basename(str(file)), "pages": 0, "chunks": 0, "seconds": 0.0, "error": None} for file in files]
+    results = [None] * len(tasks)
+
+    if workers <= 1 or len(tasks) <= 1:
+        for i, (_, path, fmt, start, stop) in enumerate(tasks):
+            try:
+                results[i] = parse_task(path, fmt, start, stop)
+            except Exception as e:
+                results[i] = e
+    else:
+        executor = _get_executor(workers)
+        futures = [executor.submit(parse_task, *task[1:]) for task in tasks]
+        broken = []
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool as e:
+                broken.append(i)
+                results[i] = e
+            except Exception as e:
+                results[i] = e
+        if broken:
+            # A dead worker fails every task still in flight. Retry those one at a time on a fresh pool, so only
+            # the task that actually crashes it is reported as failed.
+            logging.error(f"A parse worker process died; retrying {len(broken)} tasks one at a time.")
+            _reset_executor(executor)
+            for i in broken:
+                executor = _get_executor(workers)
+                try:
+                    results[i] = executor.submit(parse_task, *tasks[i][1:]).result()
+                except BrokenProcessPool as e:
+                    results[i] = e
+                    _reset_executor(executor)
+                except Exception as e:
+                    results[i] = e
+
+    for (file_index, *_), result in zip(tasks, results):
+        report = reports[file_index]
+        if isinstance(result, Exception):
+            report["error"] = report["error"] or f"{type(result).__name__}: {result}"
+            continue
+        documents, pages, seconds = result
+        report["pages"] += pages
+        report["chunks"] += len(documents)
+        report["seconds"] = round(report["seconds"] + seconds, 3)
+
+    documents = []
+    for (file_index, *_), result in zip(tasks, results):
+        if reports[file_index]["error"] is None:
+            documents.extend(result[0])
+
+    for report in reports:
+        if report["error"]:
+            logging.error(f"Error parsing {report['file']}: {report['error']}")
+        else:
+            logging.info(f"Parsed {report['file']}: {report['pages']} pages, {report['chunks']} chunks in {report['seconds']:.2f} seconds")
+    with _stats_lock:
+        _stats["files"] += len(reports)
+        _stats["failed"] += sum(1 for report in reports if report["error"])
+        _stats["pages"] += sum(report["pages"] for report in reports)
+        _stats["chunks"] += sum(report["chunks"] for report in reports)
+        _stats["seconds"] += sum(report["seconds"] for report in reports)
+    return documents, reports
+
+def get_parse_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["seconds"] = round(stats["seconds"], 3)
+    stats["pages_per_second"] = round(stats["pages"] / stats["seconds"], 1) if stats["seconds"] else None
+    return stats
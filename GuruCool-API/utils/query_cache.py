@@ -0,0 +1,93 @@
+#utils/query_cache.py
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.models import DEFAULT_EMBEDDING_MODEL, get_embedding_model
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a chat query for cache lookups: case, surrounding whitespace and punctuation, and runs of whitespace
+    are ignored, so "What is a stack?" and "what is a  stack" share an entry.
+    """
+    return re.sub(r"\s+", " ", query).strip(" \t\n?!.").casefold()
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache from (model, normalized query) to the query's embedding, bounded by entry count.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector) -> None:
+        if self.max_entries <= 0:
+            return
+        # Cached vectors are shared between requests, so nobody may modify them in place.
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+query_cache = QueryEmbeddingCache(max_entries=QUERY_CACHE_SIZE)
+
+def encode_query(query: str, embedding_model=None, model_name: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Returns the embedding of a chat query, encoding it only if the same normalized query was not seen recently.
+
+    Args:
+        query (str): The query text.
+        embedding_model (SentenceTransformer): The model to encode with. Defaults to the shared model of model_name.
+        model_name (str): Name of the model, part of the cache key.
+
+    Returns:
+        np.ndarray: A read-only float32 matrix of shape (1, dim).
+    """
+    key = (model_name, normalize_query(query))
+    vector = query_cache.get(key)
+    if vector is not None:
+        logging.info("Query embedding served from cache.")
+        return vector
+
+    embedding_model = embedding_model or get_embedding_model(model_name)
+    vector = np.asarray(embedding_model.encode([query], convert_to_tensor=False), dtype=np.float32).reshape(1, -1)
+    query_cache.put(key, vector)
+    return vector
+
+def get_query_cache_stats() -> dict:
+    return query_cache.stats()
@@ -0,0 +1,199 @@
+#utils/retrieval.py
+import os
+import time
+import logging
+
+import numpy as np
+
+from langchain.schema import Document
+
+from utils.models import get_reranker_model
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_MODES = ("dense", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RERANK_ENABLED = os.getenv("RERANK", "false").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+MMR_ENABLED = os.getenv("RETRIEVAL_MMR", "true").lower() == "true"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.95"))
+
+def dense_search(index, query_embedding, k: int) -> list:
+    """
+    Returns the ids of the k chunks closest to the query embedding, best first.
+    """
+    _, indices = index.search(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1), k)
+    return [int(i) for i in indices[0] if i != -1]
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Fuses several rankings of chunk ids with reciprocal rank fusion: each id scores sum(1 / (k + rank)) over the
+    rankings it appears in. Only ranks are used, so BM25 and L2 scores never have to be put on one scale.
+
+    Returns:
+        list: The chunk ids, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+def search_lecture(query: str, query_embedding, index, bm25=None, k: int = 5, mode: str = None) -> list:
+    """
+    Finds the chunks of a lecture that best match a query.
+
+    Args:
+        query (str): The query text, used for BM25.
+        query_embedding (np.ndarray): The encoded query, used for the FAISS index.
+        index (faiss.Index): The lecture's FAISS index.
+        bm25 (BM25Index): The lecture's BM25 index, or None to search the FAISS index only.
+        k (int): Number of chunk ids to return.
+        mode (str): 'dense' or 'hybrid'. Defaults to RETRIEVAL_MODE.
+
+    Returns:
+        list: Up to k chunk ids, best first.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    if mode == "dense" or bm25 is None:
+        return dense_search(index, query_embedding, k)
+
+    start_time = time.time()
+    candidates = max(k, HYBRID_CANDIDATES)
+    dense_ids = dense_search(index, query_embedding, candidates)
+    _, sparse_ids = bm25.search(query, candidates)
+    fused = reciprocal_rank_fusion([dense_ids, [int(i) for i in sparse_ids]])[:k]
+    logging.info(f"Hybrid retrieval fused {len(dense_ids)} dense and {len(sparse_ids)} BM25 candidates in {(time.time() - start_time) * 1000:.1f} ms")
+    return fused
+
+def rerank_documents(query: str, documents: list, top_k: int = RERANK_TOP_K, budget_ms: float = RERANK_BUDGET_MS) -> list:
+    """
+    Reorders retrieved chunks by cross-encoder relevance to the query. Candidates are scored batch by batch in
+    retrieval order until the time budget runs out; the scored prefix is sorted by score and the unscored rest
+    keeps its retrieval order behind it, so an exhausted budget degrades to plain retrieval order.
+
+    Args:
+        query (str): The query text.
+        documents (list): Candidate chunk Documents, best first according to retrieval.
+        top_k (int): Number of chunks to return.
+        budget_ms (float): Time budget for scoring, in milliseconds.
+
+    Returns:
+        list: Up to top_k Documents.
+    """
+    # The model is fetched before the clock starts, so a first-request load does not eat the budget.
+    model = get_reranker_model()
+    start_time = time.time()
+    deadline = start_time + budget_ms / 1000
+    scores = []
+    for batch_start in range(0, len(documents), RERANK_BATCH_SIZE):
+        if time.time() >= deadline:
+            logging.warning(f"Rerank budget of {budget_ms:.0f} ms exhausted after {len(scores)} of {len(documents)} candidates; keeping retrieval order for the rest.")
+            break
+        batch = documents[batch_start:batch_start + RERANK_BATCH_SIZE]
+        scores.extend(model.predict([(query, doc.page_content) for doc in batch], batch_size=RERANK_BATCH_SIZE))
+
+    order = sorted(range(len(scores)), key=lambda i: -scores[i]) + list(range(len(scores), len(documents)))
+    logging.info(f"Reranked {len(scores)} of {len(documents)} candidates in {(time.time() - start_time) * 1000:.1f} ms")
+    return [documents[i] for i in order[:top_k]]
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def remove_near_duplicates(doc_ids: list, vectors, threshold: float = DEDUP_THRESHOLD) -> tuple:
+    """
+    Drops chunks whose embedding is nearly identical to a better ranked chunk, such as the same slide text
+    coming from both the PDF and the PPTX export of a deck.
+
+    Args:
+        doc_ids (list): Chunk ids, best first.
+        vectors (np.ndarray): Their embeddings, one row per id.
+        threshold (float): Cosine similarity at or above which a chunk counts as a duplicate.
+
+    Returns:
+        tuple: The kept ids and their (normalized) vectors.
+    """
+    vectors = _unit_rows(vectors)
+    kept = []
+    for i in range(len(doc_ids)):
+        if not kept or np.max(vectors[kept] @ vectors[i]) < threshold:
+            kept.append(i)
+    if len(kept) < len(doc_ids):
+        logging.info(f"Dropped {len(doc_ids) - len(kept)} near-duplicate chunks.")
+    return [doc_ids[i] for i in kept], vectors[kept]
+
+def mmr_select(query_embedding, doc_ids: list, vectors, k: int, lambda_: float = MMR_LAMBDA) -> list:
+    """
+    Picks k chunks by maximal marginal relevance: each step takes the candidate with the best trade-off between
+    similarity to the query and dissimilarity to the chunks already picked.
+
+    Args:
+        query_embedding (np.ndarray): The encoded query.
+        doc_ids (list): Candidate chunk ids.
+        vectors (np.ndarray): Their embeddings, one row per id.
+        k (int): Number of chunks to pick.
+        lambda_ (float): Weight of query relevance against diversity, 1 meaning relevance only.
+
+    Returns:
+        list: The picked chunk ids, in the order they were picked.
+    """
+    vectors = _unit_rows(vectors)
+    relevance = vectors @ _unit_rows(query_embedding).reshape(-1)
+    selected = []
+    remaining = list(range(len(doc_ids)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = np.max(vectors[remaining] @ vectors[selected].T, axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        best = remaining[int(np.argmax(lambda_ * relevance[remaining] - (1 - lambda_) * redundancy))]
+        selected.append(best)
+        remaining.remove(best)
+    return [doc_ids[i] for i in selected]
+
+def merge_overlapping_chunks(documents: list) -> list:
+    """
+    Merges retrieved chunks that overlap or touch within the same page of the same source into one contiguous
+    passage, so overlapping text reaches the prompt only once. Chunks without a start_index (indexed before it was
+    recorded) are left as they are.
+
+    Returns:
+        list: The passages, ordered by the best ranked chunk each one contains.
+    """
+    spans = {}
+    passages = []
+    for rank, doc in enumerate(documents):
+        start = doc.metadata.get("start_index", -1)
+        if start is None or start < 0:
+            passages.append((rank, doc))
+            continue
+        spans.setdefault((doc.metadata.get("source"), doc.metadata.get("page")), []).append((start, rank, doc))
+
+    for group in spans.values():
+        group.sort(key=lambda span: span[0])
+        start, rank, doc = group[0]
+        text, end = doc.page_content, start + len(doc.page_content)
+        for next_start, next_rank, next_doc in group[1:]:
+            if next_start <= end:
+                text += next_doc.page_content[end - next_start:]
+                end = max(end, next_start + len(next_doc.page_content))
+                rank = min(rank, next_rank)
+            else:
+                passages.append((rank, Document(page_content=text, metadata={**doc.metadata, "start_index": start})))
+                start, rank, doc = next_start, next_rank, next_doc
+                text, end = doc.page_content, start + len(doc.page_content)
+        passages.append((rank, Document(page_content=text, metadata={**doc.metadata, "start_index": start})))
+
+    passages.sort(key=lambda passage: passage[0])
+    if len(passages) < len(documents):
+        logging.info(f"Merged {len(documents)} retrieved chunks into {len(passages)} passages.")
+    return [doc for _, doc in passages]
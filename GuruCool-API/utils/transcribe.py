@@ -1,10 +1,12 @@
 #utils/transcribe.py
 import sys
 import logging
-import whisper
 
 class Transcriber:
     def __init__(self, model_name):
+        # Imported here so that only transcription pulls in torch.
+        import whisper
+
         try:
             self.model = whisper.load_model(model_name)
             logging.info(f"Model '{model_name}' loaded successfully.")
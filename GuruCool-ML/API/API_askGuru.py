@@ -1,15 +1,16 @@
 import os
-import pickle
 import time
 import logging
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, session
 from langchain_ollama import OllamaLLM
-from sentence_transformers import SentenceTransformer
 from flask_cors import CORS
 import faiss
 import warnings
 
+from utils.models import get_embedding_model, preload_embedding_models
+from utils.lecture_cache import load_cached_embedding_cache, get_lecture_cache_stats
+
 load_dotenv()
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -26,15 +27,14 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def get_embedding_cache_file(lecture_id):
     return os.path.join(PROJECT_ROOT, f"Cache/{lecture_id}_embedding_cache.pkl")
 
-def load_embeddings(lecture_id):
+def load_embeddings(lecture_id, subject=None, unit=None):
     embedding_cache_file = get_embedding_cache_file(lecture_id)
     logging.info(f"Loading embeddings from cache at: {embedding_cache_file}")
     
     if not os.path.exists(embedding_cache_file):
         raise FileNotFoundError(f"Embedding cache file not found for lecture ID: {lecture_id}. Please generate embeddings first.")
     
-    with open(embedding_cache_file, 'rb') as f:
-        embeddings, index, documents = pickle.load(f)
+    embeddings, index, documents = load_cached_embedding_cache(embedding_cache_file, (subject, unit, lecture_id))
     
     logging.info(f"Embeddings, index, and documents loaded successfully for lecture ID: {lecture_id}.")
     return embeddings, index, documents
@@ -79,6 +79,8 @@ def chat():
     
     user_query = request.json.get("query")
     lecture_id = request.json.get("lecture_id")
+    subject = request.json.get("subject_id")
+    unit = request.json.get("unit_id")
     
     if not user_query or not lecture_id:
         logging.error("Both 'query' and 'lecture_id' are required.")
@@ -87,12 +89,12 @@ def chat():
     logging.info(f"Received query: {user_query}, Lecture ID: {lecture_id}")
     
     try:
-        embeddings, index, documents = load_embeddings(lecture_id)
+        embeddings, index, documents = load_embeddings(lecture_id, subject, unit)
     except FileNotFoundError as e:
         logging.error(f"Error loading embeddings: {e}")
         return jsonify({"error": str(e)}), 500
     
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    embedding_model = get_embedding_model()
 
     retrieval_start_time = time.time()
     relevant_docs = retrieve_relevant_docs(user_query, index, documents, embedding_model)
@@ -114,6 +116,10 @@ def chat():
         "processing_time": f"{end_time - start_time:.2f} seconds"
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({"lecture_cache": get_lecture_cache_stats()})
+
 @app.route('/reset', methods=['POST'])
 def reset():
     session.pop('conversation_history', None)
@@ -121,4 +127,5 @@ def reset():
     return jsonify({"message": "Conversation history reset."})
 
 if __name__ == "__main__":  
+    preload_embedding_models()
     app.run(debug=True, host='0.0.0.0', port=8000)
@@ -10,7 +10,7 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from langchain_ollama import OllamaLLM
-from sentence_transformers import SentenceTransformer
+from utils.models import get_embedding_model
 
 # Load environment variables
 load_dotenv()
@@ -29,7 +29,7 @@ CORS(app)
 ollama_model = OllamaLLM(model="llama3.1")
 
 # Load the embedding model
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+embedding_model = get_embedding_model()
 
 # Helper function to create MCQ
 def generate_mcq_question(llm, question_number, documents):
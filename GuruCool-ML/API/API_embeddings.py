@@ -7,8 +7,6 @@ from dotenv import load_dotenv
 from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from sentence_transformers import SentenceTransformer
-import faiss
 from pptx import Presentation
 from pathlib import Path
 import warnings
@@ -17,6 +15,10 @@ from firebase_admin import credentials, firestore
 import logging
 from flask_cors import CORS
 
+from utils.models import get_embedding_model
+from utils.faiss_index import build_faiss_index
+from utils.build_lock import build_lock, atomic_write
+
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 load_dotenv()
@@ -107,28 +109,28 @@ def generate_and_save_embeddings(lecture_id, documents):
     embedding_cache_file = os.path.join(cache_directory, f"{lecture_id}_embedding_cache.pkl")
     
     logging.info(f"Checking for cached embeddings at: {embedding_cache_file}")
-    if os.path.exists(embedding_cache_file):
-        logging.info("Embeddings cache already exists. No need to regenerate.")
-        return embedding_cache_file
-    
-    logging.info("No cache file found. Generating embeddings...")
-    start_time = time.time()
+    # Concurrent requests for the same lecture build it once; the others wait and reuse the finished cache.
+    with build_lock(f"{embedding_cache_file}.lock"):
+        if os.path.exists(embedding_cache_file):
+            logging.info("Embeddings cache already exists. No need to regenerate.")
+            return embedding_cache_file
 
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    document_texts = [doc.page_content for doc in documents]
-    
-    embeddings = embedding_model.encode(document_texts, convert_to_tensor=False)
-    embedding_dim = len(embeddings[0])
-    index = faiss.IndexFlatL2(embedding_dim)
-    index.add(embeddings)
-    
-    try:
-        with open(embedding_cache_file, 'wb') as f:
-            pickle.dump((embeddings, index, documents), f)
-        logging.info(f"Embeddings cached successfully with documents at {embedding_cache_file}.")
-    except Exception as e:
-        logging.error(f"Error saving embeddings to cache: {e}")
-        raise
+        logging.info("No cache file found. Generating embeddings...")
+        start_time = time.time()
+
+        embedding_model = get_embedding_model()
+        document_texts = [doc.page_content for doc in documents]
+
+        embeddings = embedding_model.encode(document_texts, convert_to_tensor=False)
+        index = build_faiss_index(embeddings)
+
+        try:
+            with atomic_write(embedding_cache_file) as f:
+                pickle.dump((embeddings, index, documents), f)
+            logging.info(f"Embeddings cached successfully with documents at {embedding_cache_file}.")
+        except Exception as e:
+            logging.error(f"Error saving embeddings to cache: {e}")
+            raise
 
     end_time = time.time()
     logging.info(f"Embeddings generated and saved in {end_time - start_time:.2f} seconds")
@@ -17,7 +17,8 @@ def generate_lecture_schedule():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
 
-        text = extract_text_from_books(book_url)
+        # Pages are extracted only as far as topic generation reads them.
+        book_pages = iter_book_pages(book_url)
 
         num_days = (end_date - start_date).days
         lectures_per_week = hours_per_week // 1
@@ -25,7 +26,7 @@ def generate_lecture_schedule():
 
         print("Loading the LLaMA model...")
         model = OllamaLLM(model="llama3.1")
-        lecture_topics = generate_topics_using_llm(text, num_lectures, model)
+        lecture_topics = generate_topics_using_llm(book_pages, num_lectures, model)
 
         grouped_lectures = group_topics_into_lectures(lecture_topics, num_lectures)
 
@@ -1,5 +1,4 @@
 import os
-import pickle
 import random
 from flask import Flask, request, jsonify
 from langchain_ollama import OllamaLLM
@@ -9,6 +8,8 @@ import json
 warnings.filterwarnings("ignore", category=FutureWarning)
 from flask_cors import CORS
 
+from utils.lecture_cache import load_cached_embedding_cache, get_lecture_cache_stats
+
 app = Flask(__name__)
 CORS(app)
 
@@ -17,16 +18,12 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 def get_embedding_cache_file(lecture_id):
     return os.path.join(PROJECT_ROOT, f"Cache/{lecture_id}_embedding_cache.pkl")
 
-def load_embeddings_and_documents(lecture_id):
+def load_embeddings_and_documents(lecture_id, subject=None, unit=None):
     try:
         embedding_cache_file = get_embedding_cache_file(lecture_id)
         print(f"Loading embeddings from cache at: {embedding_cache_file}")
         
-        if not os.path.exists(embedding_cache_file):
-            raise FileNotFoundError(f"Embedding cache file not found at {embedding_cache_file}. Please generate embeddings first.")
-        
-        with open(embedding_cache_file, 'rb') as f:
-            embeddings, index, documents = pickle.load(f)
+        embeddings, index, documents = load_cached_embedding_cache(embedding_cache_file, (subject, unit, lecture_id))
         
         print("Embeddings, index, and documents loaded successfully.")
         return documents
@@ -125,7 +122,7 @@ def generate_mcq_quiz():
         if not lecture_id:
             return jsonify({"error": "lecture_id is required"}), 400
 
-        documents = load_embeddings_and_documents(lecture_id)
+        documents = load_embeddings_and_documents(lecture_id, data.get("subject_id"), data.get("unit_id"))
         
         if not documents:
             return jsonify({"error": "No documents found for the given lecture_id"}), 404
@@ -169,5 +166,9 @@ def test_generate_mcq_quiz():
     except Exception as e:
         print(f"Error during the request: {e}")
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({"lecture_cache": get_lecture_cache_stats()})
+
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=8008)
\ No newline at end of file
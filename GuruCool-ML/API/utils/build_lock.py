@@ -0,0 +1,82 @@
+#utils/build_lock.py
+import os
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+from filelock import FileLock, Timeout
+
+BUILD_LOCK_TIMEOUT = float(os.getenv("BUILD_LOCK_TIMEOUT", "1800"))
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+def _thread_lock(lock_path: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(lock_path), threading.Lock())
+
+@contextmanager
+def build_lock(lock_path: str, timeout: float = BUILD_LOCK_TIMEOUT):
+    """
+    Holds the build lock of one lecture (or unit) index. Builds are serialized across the threads of this process
+    by an in-process lock and across processes sharing the cache directory, such as gunicorn workers, by a file lock.
+
+    Args:
+        lock_path (str): Path of the lock file.
+        timeout (float): Seconds to wait for a running build; 0 to give up at once.
+
+    Yields:
+        bool: True if another build held the lock when this caller arrived.
+
+    Raises:
+        TimeoutError: If the lock could not be acquired within the timeout.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    start_time = time.time()
+
+    thread_lock = _thread_lock(lock_path)
+    waited = not thread_lock.acquire(blocking=False)
+    if waited:
+        logging.info(f"Another build holds {lock_path} in this process; waiting for it.")
+        if not thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Timed out after {timeout:.0f} seconds waiting for {lock_path}.")
+    try:
+        file_lock = FileLock(lock_path)
+        try:
+            file_lock.acquire(timeout=0)
+        except Timeout:
+            waited = True
+            logging.info(f"Another process holds {lock_path}; waiting for it.")
+            remaining = max(0.0, timeout - (time.time() - start_time))
+            try:
+                file_lock.acquire(timeout=remaining)
+            except Timeout:
+                raise TimeoutError(f"Timed out after {timeout:.0f} seconds waiting for {lock_path}.")
+        if waited:
+            logging.info(f"Acquired {lock_path} after waiting {time.time() - start_time:.2f} seconds.")
+        try:
+            yield waited
+        finally:
+            file_lock.release()
+    finally:
+        thread_lock.release()
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'wb', encoding: str = None):
+    """
+    Opens a temporary file next to path for writing and moves it over path once the block completes, so readers
+    never see a partially written file. The temporary file is removed if the block fails.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,4 +1,6 @@
 import os
+import uuid
+import hashlib
 import PyPDF2
 import random
 from datetime import datetime, timedelta
@@ -8,9 +10,104 @@ import requests
 from langchain_ollama import OllamaLLM
 
 
+BOOK_DIR = "GuruCoursePlanner/Docs"
+# Characters of book text given to the model when planning topics; the pages after it are never extracted.
+# 0 (the default) gives it the whole book.
+BOOK_TEXT_BUDGET = int(os.getenv("BOOK_TEXT_BUDGET", "0"))
+
+
+def download_book(book_url, book_dir=BOOK_DIR):
+    """
+    Downloads a book to <book_dir>/<sha256>.pdf. The response is streamed to a uniquely named temporary file, so
+    concurrent requests for different books never overwrite each other.
+
+    Returns:
+        tuple: The path of the book and the SHA-256 of its content.
+    """
+    os.makedirs(book_dir, exist_ok=True)
+    tmp_path = os.path.join(book_dir, f"book-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    try:
+        with requests.get(book_url, stream=True, timeout=(10, 120)) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to download the book from the URL: {book_url}")
+            with open(tmp_path, 'wb') as f:
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+                    digest.update(block)
+        book_path = os.path.join(book_dir, f"{digest.hexdigest()}.pdf")
+        os.replace(tmp_path, book_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return book_path, digest.hexdigest()
+
+
+def iter_book_pages(book_url, book_dir=BOOK_DIR):
+    """
+    Downloads the book from the provided Firebase URL and yields the text of its pages one at a time. Extracted
+    pages are cached in <book_dir>/text/<sha256>.jsonl, also when the caller stops early, and read back from there
+    the next time the same book is requested.
+
+    Args:
+        book_url (str): The URL of the book in Firebase storage.
+        book_dir (str): The directory where the book and its text cache are saved.
+
+    Yields:
+        str: The text of each page, in order.
+    """
+    book_path, sha256 = download_book(book_url, book_dir)
+    text_path = os.path.join(book_dir, "text", f"{sha256}.jsonl")
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+
+    # Pages already in the cache are served from it.
+    cached_pages = 0
+    page_count = None
+    try:
+        with open(text_path, 'r', encoding='utf-8') as f:
+            page_count = json.loads(f.readline())["page_count"]
+            for line in f:
+                page_text = json.loads(line)
+                cached_pages += 1
+                yield page_text
+    except (OSError, ValueError, KeyError):
+        pass
+    if page_count is not None and cached_pages >= page_count:
+        return
+
+    # The rest are extracted into a new copy of the cache, which replaces the old one once the caller is done.
+    print(f"Extracting text from book: {book_path}")
+    pdf_reader = PyPDF2.PdfReader(book_path)
+    page_count = len(pdf_reader.pages)
+    tmp_path = f"{text_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as cache:
+            cache.write(json.dumps({"page_count": page_count}) + "\n")
+            if cached_pages:
+                with open(text_path, 'r', encoding='utf-8') as f:
+                    f.readline()
+                    for _, line in zip(range(cached_pages), f):
+                        cache.write(line)
+            extracted = 0
+            try:
+                for page_num in range(cached_pages, page_count):
+                    page_text = pdf_reader.pages[page_num].extract_text() or ""
+                    cache.write(json.dumps(page_text) + "\n")
+                    extracted += 1
+                    yield page_text
+            finally:
+                # Closing the generator early raises GeneratorExit at the yield, so the cache is committed here.
+                cache.close()
+                if extracted:
+                    os.replace(tmp_path, text_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def extract_text_from_books(book_url):
     """
-    Downloads the book from the provided Firebase URL and extracts text.
+    Downloads the book from the provided Firebase URL and extracts its full text.
     
     Args:
         book_url (str): The URL of the book in Firebase storage.
@@ -18,32 +115,29 @@ def extract_text_from_books(book_url):
     Returns:
         str: The full extracted text from the PDF.
     """
-    # Ensure the directory for saving the book exists
-    book_dir = "GuruCoursePlanner/Docs"
-    os.makedirs(book_dir, exist_ok=True)
-    
-    # Download the book from Firebase
-    response = requests.get(book_url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download the book from the URL: {book_url}")
-    
-    book_path = os.path.join(book_dir, "book.pdf")
-    
-    # Save the downloaded content as a PDF file
-    with open(book_path, 'wb') as f:
-        f.write(response.content)
-    
-    full_text = ""
-    print(f"Extracting text from book: {book_path}")
-    
-    # Open the downloaded PDF and extract text
-    pdf_reader = PyPDF2.PdfReader(book_path)
-    for page_num in range(len(pdf_reader.pages)):
-        page_text = pdf_reader.pages[page_num].extract_text()
-        full_text += page_text + "\n\n"
-    
-    print("Text extraction from books complete.")
-    return full_text
+    return "".join(f"{page_text}\n\n" for page_text in iter_book_pages(book_url))
+
+
+def take_book_text(pages, max_chars=BOOK_TEXT_BUDGET):
+    """
+    Joins pages from a page iterator, such as iter_book_pages, until max_chars characters, then closes the iterator
+    so no further pages are read. With max_chars 0 every page is joined.
+    """
+    parts = []
+    size = 0
+    try:
+        for page_text in pages:
+            if not max_chars:
+                parts.append(page_text)
+                continue
+            parts.append(page_text[:max_chars - size])
+            size += len(parts[-1])
+            if size >= max_chars:
+                break
+    finally:
+        if hasattr(pages, "close"):
+            pages.close()
+    return "\n\n".join(parts)
 
 
 def inject_review_and_exploration(topics, num_lectures):
@@ -64,13 +158,17 @@ def generate_topics_using_llm(text, num_lectures, model):
     Generates lecture topics using a large language model based on the provided book text.
 
     Args:
-        text (str): The full extracted text from the book.
+        text (str or iterable): The extracted text from the book, or an iterator over its pages, read page by page
+            (only up to BOOK_TEXT_BUDGET characters when that is set).
         num_lectures (int): The number of lectures to divide topics into.
         model (OllamaLLM): The language model used for generating topics.
 
     Returns:
         list: A list of topics to be used in the lectures.
     """
+    if not isinstance(text, str):
+        text = take_book_text(text)
+
     prompt = (
         f"Your task is to generate specific and detailed lecture topics based on the structure of the provided book. "
         f"Extract major sections, subsections, key concepts, methods, and case studies that can fill multiple lectures. "
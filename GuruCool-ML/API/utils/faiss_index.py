@@ -0,0 +1,90 @@
+#utils/faiss_index.py
+import os
+import math
+import logging
+
+import faiss
+import numpy as np
+
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+FAISS_FLAT_MAX_VECTORS = int(os.getenv("FAISS_FLAT_MAX_VECTORS", "20000"))
+FAISS_HNSW_MAX_VECTORS = int(os.getenv("FAISS_HNSW_MAX_VECTORS", "200000"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Picks the index type for a corpus size: exact flat search for small corpora (a slide deck or a few),
+    HNSW for medium corpora and IVF for very large ones, where HNSW's graph gets expensive to build and hold.
+    """
+    if num_vectors <= FAISS_FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= FAISS_HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+def ivf_nlist(num_vectors: int) -> int:
+    # Rule of thumb of ~4 * sqrt(n) lists, capped so every list still gets enough training points.
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def build_faiss_index(embeddings: np.ndarray, index_type: str = None):
+    """
+    Builds a FAISS index over the embeddings, choosing Flat, IVF or HNSW from the vector count unless an index type is given.
+
+    Args:
+        embeddings (np.ndarray): A float32 matrix with one row per chunk.
+        index_type (str): 'flat', 'ivf', 'hnsw' or 'auto'. Defaults to FAISS_INDEX_TYPE.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    num_vectors, dim = embeddings.shape
+    index_type = index_type or FAISS_INDEX_TYPE
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+    if index_type == "ivf":
+        nlist = ivf_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        index.train(embeddings)
+        index.nprobe = min(FAISS_NPROBE, nlist)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+    else:
+        index = faiss.IndexFlatL2(dim)
+
+    index.add(embeddings)
+    logging.info(f"Built {index_type} FAISS index over {num_vectors} vectors ({describe_faiss_index(index)['index_params']})")
+    return index
+
+def describe_faiss_index(index) -> dict:
+    """
+    Returns the index type and its parameters, as recorded in the lecture index manifest.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return {"index_type": "hnsw", "index_params": {"M": index.hnsw.nb_neighbors(1), "efSearch": index.hnsw.efSearch}}
+    if isinstance(index, faiss.IndexIVF):
+        return {"index_type": "ivf", "index_params": {"nlist": index.nlist, "nprobe": index.nprobe}}
+    return {"index_type": "flat", "index_params": {}}
+
+def configure_search(index):
+    """
+    Applies the search-time tuning knobs (FAISS_NPROBE, FAISS_EF_SEARCH) to a loaded index.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(FAISS_NPROBE, index.nlist)
+    return index
@@ -0,0 +1,99 @@
+#utils/models.py
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import psutil
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+_models = {}
+_model_stats = {}
+_model_locks = {}
+_registry_lock = threading.Lock()
+
+def get_device():
+    """
+    Picks the torch device used for the embedding models (CUDA, then Apple MPS, then CPU).
+
+    Returns:
+        str: The torch device name.
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def _load_embedding_model(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    start_time = time.time()
+
+    device = get_device()
+    model = SentenceTransformer(model_name, device=device)
+
+    load_time = time.time() - start_time
+    rss_delta = process.memory_info().rss - rss_before
+    parameter_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+
+    _model_stats[model_name] = {
+        "device": device,
+        "load_time_seconds": round(load_time, 3),
+        "rss_delta_mb": round(rss_delta / (1024 * 1024), 1),
+        "parameter_mb": round(parameter_bytes / (1024 * 1024), 1),
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    logging.info(f"Embedding model '{model_name}' loaded on {device} in {load_time:.2f} seconds "
+                 f"(RSS +{_model_stats[model_name]['rss_delta_mb']} MB, parameters {_model_stats[model_name]['parameter_mb']} MB)")
+    return model
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Returns the process-wide instance of a SentenceTransformer model, loading it on first use.
+    Concurrent callers asking for a model that is still loading wait for that single load.
+
+    Args:
+        model_name (str): The SentenceTransformer model name.
+
+    Returns:
+        SentenceTransformer: The shared model instance.
+    """
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(model_name, threading.Lock())
+
+    with model_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _load_embedding_model(model_name)
+            _models[model_name] = model
+    return model
+
+def preload_embedding_models(model_names=None) -> None:
+    """
+    Loads the given embedding models (the default model if none are given) so the first request does not pay for it.
+
+    Args:
+        model_names (list): Model names to load.
+    """
+    for model_name in model_names or [DEFAULT_EMBEDDING_MODEL]:
+        try:
+            get_embedding_model(model_name)
+        except Exception as e:
+            logging.error(f"Error preloading embedding model '{model_name}': {e}")
+
+def get_model_stats() -> dict:
+    """
+    Returns load time and memory figures for every model loaded in this process.
+    """
+    return {name: dict(stats) for name, stats in _model_stats.items()}